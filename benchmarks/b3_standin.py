@@ -0,0 +1,159 @@
+# ==============================================================================
+# SERVIDOR LOCAL QUE SUBSTITUI A API DE COMPOSIÇÃO DE ÍNDICES DA B3
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Um servidor HTTP mínimo que responde como o endpoint
+# `indexProxy/indexCall/GetDownloadPortfolioDay/<base64>` da B3, servindo
+# respostas gravadas em disco. Permite exercitar o download HTTP do
+# `B3Service` (e medir seu desempenho) sem acesso à rede:
+#
+#     with servidor_b3_local(Path("respostas_b3")) as api_url:
+#         B3Service(api_url=api_url).refresh_indices_http(["IBOV"], Path("data"))
+#
+# As respostas ficam em `<pasta>/<INDICE>.txt`, exatamente como devolvidas
+# pela B3 (o CSV codificado em base64). Elas podem ser gravadas da API real
+# (`gravar_respostas`), geradas a partir de CSVs já baixados
+# (`resposta_de_csv`) ou de composições sintéticas (`csv_sintetico`).
+#
+# COMO USAR:
+# > python -m benchmarks.b3_standin gravar --pasta respostas_b3
+# > python -m benchmarks.b3_standin servir --pasta respostas_b3 --porta 8765
+#
+# ==============================================================================
+
+import argparse
+import base64
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+ROTA = "/indexProxy/indexCall/GetDownloadPortfolioDay/"
+
+
+def resposta_de_csv(csv_path: Path, index_name: str, pasta: Path) -> Path:
+    """Gera a resposta da API (CSV em base64) a partir de um CSV já baixado."""
+    pasta.mkdir(parents=True, exist_ok=True)
+    destino = pasta / f"{index_name}.txt"
+    destino.write_text(base64.b64encode(Path(csv_path).read_bytes()).decode())
+    return destino
+
+
+def csv_sintetico(index_name: str, tickers: list[str], destino: Path) -> Path:
+    """
+    Grava um CSV no formato da B3 (título, cabeçalho, ativos e rodapé, em
+    latin-1 e com números no formato brasileiro) com os tickers informados.
+    """
+    participacao = f"{100.0 / max(len(tickers), 1):.3f}".replace(".", ",")
+    linhas = [
+        f"{index_name} - Carteira do Dia 02/01/25",
+        "Código;Ação;Tipo;Qtde. Teórica;Part. (%);",
+    ]
+    for i, ticker in enumerate(tickers):
+        qtde = f"{1_000_000 + 7_919 * i:,}".replace(",", ".")
+        linhas.append(f"{ticker};EMPRESA {ticker[:4]};ON  NM;{qtde};{participacao};")
+    linhas.append(f"Quantidade Teórica Total;;;{len(tickers)}.000.000;100,000;")
+    linhas.append("Redutor;;;15.933.447,50;;")
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_bytes("\n".join(linhas).encode("latin-1"))
+    return destino
+
+
+def gravar_respostas(index_names: list[str], pasta: Path, api_url: str) -> list[Path]:
+    """Grava as respostas reais da B3 para os índices informados."""
+    pasta.mkdir(parents=True, exist_ok=True)
+    gravadas = []
+    with requests.Session() as session:
+        for index_name in index_names:
+            parametros = json.dumps({"index": index_name, "language": "pt-br"})
+            url = api_url + base64.b64encode(parametros.encode()).decode()
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+            destino = pasta / f"{index_name}.txt"
+            destino.write_text(response.text)
+            gravadas.append(destino)
+            print(f"Resposta de {index_name} gravada em {destino}")
+    return gravadas
+
+
+def _criar_handler(pasta: Path, latencia: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latencia:
+                time.sleep(latencia)
+            try:
+                token = self.path.split(ROTA, 1)[1].split("?", 1)[0]
+                index_name = json.loads(base64.b64decode(token))["index"]
+                corpo = (pasta / f"{index_name}.txt").read_bytes()
+            except (IndexError, ValueError, KeyError, FileNotFoundError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass  # Silencia o log de cada requisição.
+
+    return Handler
+
+
+@contextmanager
+def servidor_b3_local(pasta: Path, latencia: float = 0.0, porta: int = 0):
+    """
+    Sobe o servidor em uma thread e retorna a URL a ser passada para
+    `B3Service(api_url=...)`. `latencia` (em segundos) é aplicada a cada
+    requisição.
+    """
+    servidor = ThreadingHTTPServer(
+        ("127.0.0.1", porta), _criar_handler(pasta, latencia)
+    )
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, porta_real = servidor.server_address[:2]
+        yield f"http://{host}:{porta_real}{ROTA}"
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servidor local com respostas gravadas da API de índices da B3."
+    )
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    gravar = sub.add_parser("gravar", help="Grava as respostas reais da B3.")
+    gravar.add_argument("--pasta", type=Path, default=Path("respostas_b3"))
+    gravar.add_argument("indices", nargs="*")
+
+    servir = sub.add_parser("servir", help="Serve as respostas gravadas.")
+    servir.add_argument("--pasta", type=Path, default=Path("respostas_b3"))
+    servir.add_argument("--porta", type=int, default=8765)
+    servir.add_argument("--latencia", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.comando == "gravar":
+        from diversify.b3_services import B3Service
+
+        indices = args.indices or list(B3Service()._load_indices_config())
+        gravar_respostas(indices, args.pasta, B3Service.B3_API_URL)
+    else:
+        with servidor_b3_local(args.pasta, args.latencia, args.porta) as api_url:
+            print(f"Servindo respostas de '{args.pasta}' em {api_url}")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
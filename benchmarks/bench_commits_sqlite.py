@@ -0,0 +1,132 @@
+# ==============================================================================
+# BENCHMARK: VAZÃO DE COMMITS NO SQLITE
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Simula a gravação noturna de cotações (N ativos, algumas linhas novas por
+# ativo) em um banco SQLite em disco, com um leitor concorrente consultando o
+# banco o tempo todo (como um notebook ou relatório aberto). Compara:
+#
+#   - padrão:   configuração padrão do SQLite, um commit por ativo;
+#   - perfil:   `registrar_perfil_sqlite()` (WAL, synchronous=NORMAL, ...),
+#               ainda com um commit por ativo;
+#   - perfil + grupo: o perfil com `GrupoDeCommits` (um SAVEPOINT por ativo e
+#               um commit a cada 50 ativos).
+#
+# Para cada cenário são medidos o tempo total, os ativos gravados por segundo
+# e quantas leituras concorrentes foram bloqueadas ("database is locked").
+#
+# COMO USAR:
+# > python -m benchmarks.bench_commits_sqlite --ativos 500 --linhas 5
+#
+# ==============================================================================
+
+import argparse
+import datetime as dt
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from db_nexus.base import Base
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from diversify.database.models import PrecoHistorico
+from diversify.database.performance import GrupoDeCommits, registrar_perfil_sqlite
+
+CENARIOS = ("padrão", "perfil", "perfil + grupo")
+
+
+def linhas_do_ativo(ativo_id: int, n_linhas: int) -> list[dict]:
+    inicio = dt.date(2025, 1, 1)
+    return [
+        {
+            "ativo_id": ativo_id,
+            "data_pregao": inicio + dt.timedelta(days=i),
+            "preco_fechamento": 10.0 + i,
+        }
+        for i in range(n_linhas)
+    ]
+
+
+def leitor(caminho: str, parar: threading.Event, contagem: dict):
+    """Consulta o banco em laço, sem esperar por locks, contando os bloqueios."""
+    conn = sqlite3.connect(caminho, timeout=0)
+    while not parar.is_set():
+        try:
+            conn.execute("SELECT COUNT(*) FROM precos_historicos").fetchone()
+            contagem["leituras"] += 1
+        except sqlite3.OperationalError:
+            contagem["bloqueadas"] += 1
+        time.sleep(0.001)
+    conn.close()
+
+
+def executar_cenario(cenario: str, n_ativos: int, n_linhas: int) -> dict:
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "bench.db")
+        engine = create_engine(f"sqlite:///{caminho}")
+        if cenario != "padrão":
+            registrar_perfil_sqlite(engine)
+        Base.metadata.create_all(engine, tables=[PrecoHistorico.__table__])
+        tabela = PrecoHistorico.__table__
+
+        parar = threading.Event()
+        contagem = {"leituras": 0, "bloqueadas": 0}
+        thread = threading.Thread(target=leitor, args=(caminho, parar, contagem))
+        thread.start()
+
+        inicio = time.perf_counter()
+        commits = 0
+        if cenario == "perfil + grupo":
+            with Session(engine) as session:
+                grupo = GrupoDeCommits(session, itens_por_commit=50)
+                for ativo_id in range(1, n_ativos + 1):
+                    with grupo.item(f"ativo {ativo_id}"):
+                        session.execute(
+                            insert(tabela), linhas_do_ativo(ativo_id, n_linhas)
+                        )
+                grupo.commit()
+                commits = grupo.commits
+        else:
+            for ativo_id in range(1, n_ativos + 1):
+                with Session(engine) as session, session.begin():
+                    session.execute(insert(tabela), linhas_do_ativo(ativo_id, n_linhas))
+                commits += 1
+        tempo = time.perf_counter() - inicio
+
+        parar.set()
+        thread.join()
+        engine.dispose()
+
+    return {
+        "tempo (s)": f"{tempo:.3f}",
+        "ativos/s": f"{n_ativos / tempo:,.0f}",
+        "commits": commits,
+        "leituras": contagem["leituras"],
+        "bloqueadas": contagem["bloqueadas"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark de vazão de commits no SQLite."
+    )
+    parser.add_argument("--ativos", type=int, default=500)
+    parser.add_argument("--linhas", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"Benchmark de commits: {args.ativos} ativos × {args.linhas} linhas novas, "
+        "com um leitor concorrente"
+    )
+    for cenario in CENARIOS:
+        print(f"\n{cenario}")
+        for chave, valor in executar_cenario(cenario, args.ativos, args.linhas).items():
+            print(f"  {chave:>10}: {valor}")
+
+
+if __name__ == "__main__":
+    main()
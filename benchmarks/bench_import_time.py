@@ -0,0 +1,92 @@
+# ==============================================================================
+# BENCHMARK: TEMPO DE IMPORTAÇÃO DOS PONTOS DE ENTRADA
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Verifica que os módulos usados para decidir "há algo a fazer?" continuam
+# leves. Cada módulo é importado em um interpretador novo com
+# `python -X importtime`, e o script falha (código de saída 1) se:
+#   - o tempo acumulado de importação passar do orçamento; ou
+#   - alguma dependência pesada (pandas, numpy, SQLAlchemy, Selenium,
+#     requests, yfinance) for carregada.
+#
+# Serve como teste de regressão: um import no topo de um módulo que puxe uma
+# dessas bibliotecas aparece aqui antes de chegar ao cron.
+#
+# COMO USAR:
+# > python -m benchmarks.bench_import_time
+# > python -m benchmarks.bench_import_time --orcamento-ms 30 --repeticoes 5
+#
+# ==============================================================================
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+MODULOS = [
+    "diversify.cli",
+    "diversify.b3_services",
+    "diversify.manifest",
+    "diversify.metrics",
+    "diversify.database.tipos",
+]
+PESADOS = ["pandas", "numpy", "sqlalchemy", "selenium", "requests", "yfinance"]
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def medir_importacao(modulo: str) -> tuple[float, set[str]]:
+    """
+    Importa `modulo` em um interpretador novo. Retorna o tempo acumulado (em
+    ms) informado pelo `-X importtime` e os pacotes de topo carregados.
+    """
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=RAIZ,
+    ).stderr
+    acumulado = 0.0
+    carregados = set()
+    for linha in saida.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, nome = linha[len("import time:") :].split("|")
+        nome = nome.strip()
+        carregados.add(nome.split(".")[0])
+        if nome == modulo:
+            acumulado = int(cumulativo) / 1000
+    return acumulado, carregados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Orçamento de tempo de importação dos pontos de entrada."
+    )
+    parser.add_argument("--orcamento-ms", type=float, default=50.0)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    falhou = False
+    for modulo in MODULOS:
+        # O menor tempo das repetições descarta o ruído de cache frio.
+        medicoes = [medir_importacao(modulo) for _ in range(args.repeticoes)]
+        tempo = min(m[0] for m in medicoes)
+        pesados = sorted(set(PESADOS) & medicoes[0][1])
+
+        problemas = []
+        if tempo > args.orcamento_ms:
+            problemas.append(f"acima do orçamento de {args.orcamento_ms:.0f} ms")
+        if pesados:
+            problemas.append(f"importa {', '.join(pesados)}")
+        falhou = falhou or bool(problemas)
+        situacao = "❌ " + "; ".join(problemas) if problemas else "✅"
+        print(f"{modulo:>28}: {tempo:7.1f} ms  {situacao}")
+
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# ==============================================================================
+# BENCHMARK: LAYOUT FÍSICO DA TABELA `precos_historicos`
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Compara o layout antigo (chave `(data_pregao, ativo_id)` + índice em
+# `data_pregao`) com o layout agrupado por ativo (`(ativo_id, data_pregao)`,
+# `WITHOUT ROWID`) em um conjunto sintético de N ativos × M anos de pregões.
+#
+# Consultas medidas (as mesmas usadas pelos repositórios):
+#   - range:   preços de um ativo em uma janela de 1 ano.
+#   - max:     MAX(data_pregao) de um ativo (`get_latest_date`).
+#   - planner: MAX(data_pregao) agrupado de todo o universo (`plan_updates`).
+#
+# COMO USAR:
+# > python -m benchmarks.bench_layout_precos --ativos 500 --anos 10
+#
+# ==============================================================================
+
+import argparse
+import datetime as dt
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+LAYOUTS = {
+    "antigo (data_pregao, ativo_id)": """
+        CREATE TABLE precos_historicos (
+            ativo_id INTEGER NOT NULL,
+            data_pregao DATE NOT NULL,
+            preco_fechamento FLOAT NOT NULL,
+            CONSTRAINT pk_preco_historico PRIMARY KEY (data_pregao, ativo_id)
+        );
+        CREATE INDEX ix_precos_historicos_data_pregao
+            ON precos_historicos (data_pregao);
+    """,
+    "agrupado (ativo_id, data_pregao) WITHOUT ROWID": """
+        CREATE TABLE precos_historicos (
+            ativo_id INTEGER NOT NULL,
+            data_pregao DATE NOT NULL,
+            preco_fechamento FLOAT NOT NULL,
+            CONSTRAINT pk_preco_historico PRIMARY KEY (ativo_id, data_pregao)
+        ) WITHOUT ROWID;
+        CREATE INDEX ix_precos_historicos_data_pregao
+            ON precos_historicos (data_pregao);
+    """,
+}
+
+
+def dias_uteis(anos: int) -> list[str]:
+    """Datas (ISO) de segunda a sexta nos últimos `anos` anos."""
+    fim = dt.date(2025, 1, 1)
+    dia = fim - dt.timedelta(days=365 * anos)
+    datas = []
+    while dia < fim:
+        if dia.weekday() < 5:
+            datas.append(dia.isoformat())
+        dia += dt.timedelta(days=1)
+    return datas
+
+
+def carregar(conn: sqlite3.Connection, ddl: str, n_ativos: int, datas: list[str]):
+    """Cria a tabela e a popula na ordem em que o coletor insere (por data)."""
+    conn.executescript(ddl)
+    linhas = (
+        (ativo_id, data, 10.0 + (ativo_id % 7))
+        for data in datas
+        for ativo_id in range(1, n_ativos + 1)
+    )
+    conn.executemany("INSERT INTO precos_historicos VALUES (?, ?, ?)", linhas)
+    conn.commit()
+
+
+def medir(func, repeticoes: int) -> float:
+    """Retorna a latência média, em milissegundos."""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def executar(n_ativos: int, anos: int, repeticoes: int) -> dict:
+    datas = dias_uteis(anos)
+    rng = random.Random(42)
+    resultados = {}
+
+    for nome, ddl in LAYOUTS.items():
+        with tempfile.TemporaryDirectory() as pasta:
+            conn = sqlite3.connect(os.path.join(pasta, "bench.db"))
+            inicio = time.perf_counter()
+            carregar(conn, ddl, n_ativos, datas)
+            tempo_carga = time.perf_counter() - inicio
+
+            def range_scan():
+                ativo = rng.randint(1, n_ativos)
+                i = rng.randint(0, len(datas) - 253)
+                conn.execute(
+                    "SELECT data_pregao, preco_fechamento FROM precos_historicos "
+                    "WHERE ativo_id = ? AND data_pregao BETWEEN ? AND ? "
+                    "ORDER BY data_pregao",
+                    (ativo, datas[i], datas[i + 252]),
+                ).fetchall()
+
+            def max_data():
+                conn.execute(
+                    "SELECT MAX(data_pregao) FROM precos_historicos WHERE ativo_id = ?",
+                    (rng.randint(1, n_ativos),),
+                ).fetchone()
+
+            def planner():
+                conn.execute(
+                    "SELECT ativo_id, MAX(data_pregao) FROM precos_historicos "
+                    "GROUP BY ativo_id"
+                ).fetchall()
+
+            resultados[nome] = {
+                "carga_s": round(tempo_carga, 2),
+                "range_ms": round(medir(range_scan, repeticoes), 3),
+                "max_ms": round(medir(max_data, repeticoes), 3),
+                "planner_ms": round(medir(planner, max(1, repeticoes // 50)), 2),
+            }
+            conn.close()
+
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark de layout da tabela precos_historicos."
+    )
+    parser.add_argument("--ativos", type=int, default=500)
+    parser.add_argument("--anos", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=500)
+    args = parser.parse_args()
+
+    print(
+        f"Benchmark de layout: {args.ativos} ativos × {args.anos} anos "
+        f"({args.repeticoes} consultas por medida)"
+    )
+    for nome, medidas in executar(args.ativos, args.anos, args.repeticoes).items():
+        print(f"\n{nome}")
+        for chave, valor in medidas.items():
+            print(f"  {chave:>11}: {valor}")
+
+
+if __name__ == "__main__":
+    main()
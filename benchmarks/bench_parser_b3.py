@@ -0,0 +1,91 @@
+# ==============================================================================
+# BENCHMARK: PARSER DOS CSVs DE COMPOSIÇÃO DA B3
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Compara, nos arquivos reais da pasta `data/` (`<INDICE>Dia_DD-MM-YY.csv`):
+#   - pandas:   a leitura anterior do `b3_composition`
+#               (`pd.read_csv(..., skipfooter=2, engine="python")`);
+#   - parser:   `b3_parser.parse_b3_csv`, arquivo por arquivo;
+#   - paralelo: `b3_parser.parse_many`, todos os arquivos no pool de threads.
+#
+# COMO USAR:
+# > python -m benchmarks.bench_parser_b3 --pasta data --repeticoes 50
+#
+# ==============================================================================
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from diversify.b3_parser import parse_b3_csv, parse_many
+
+
+def leitura_pandas(file_path: Path) -> list[dict]:
+    """A implementação anterior de `B3Service.b3_composition`."""
+    df = pd.read_csv(
+        file_path,
+        sep=";",
+        encoding="latin-1",
+        skipfooter=2,
+        engine="python",
+        skiprows=2,
+        header=None,
+        usecols=[0, 1],
+        names=["ticker", "nome"],
+    )
+    df.dropna(inplace=True)
+    return df.to_dict("records")
+
+
+def medir(func, repeticoes: int) -> float:
+    """Tempo médio por repetição, em milissegundos."""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark do parser de composição da B3."
+    )
+    parser.add_argument("--pasta", type=Path, default=Path("data"))
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    arquivos = {
+        caminho.name.split("Dia_")[0]: caminho
+        for caminho in sorted(args.pasta.glob("*Dia_*.csv"))
+    }
+    if not arquivos:
+        print(f"Nenhum arquivo '*Dia_*.csv' encontrado em '{args.pasta}'.")
+        return
+
+    print(
+        f"{'índice':<8} {'ativos':>6} {'pandas ms':>10} {'parser ms':>10} {'ganho':>7}"
+    )
+    total_pandas = total_parser = 0.0
+    for index_name, caminho in arquivos.items():
+        ativos = len(parse_b3_csv(caminho, index_name))
+        t_pandas = medir(lambda: leitura_pandas(caminho), args.repeticoes)
+        t_parser = medir(lambda: parse_b3_csv(caminho, index_name), args.repeticoes)
+        total_pandas += t_pandas
+        total_parser += t_parser
+        print(
+            f"{index_name:<8} {ativos:>6} {t_pandas:>10.3f} {t_parser:>10.3f} "
+            f"{t_pandas / t_parser:>6.1f}x"
+        )
+
+    t_paralelo = medir(lambda: parse_many(arquivos), args.repeticoes)
+    print(
+        f"\nTodos os índices: pandas sequencial {total_pandas:.3f} ms | "
+        f"parser sequencial {total_parser:.3f} ms | "
+        f"parser paralelo {t_paralelo:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# ==============================================================================
+# BENCHMARK: POSIÇÕES MATERIALIZADAS x RECÁLCULO PELO HISTÓRICO
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Monta um banco SQLite em memória com N carteiras e um histórico de
+# transações crescente, e mede, para cada tamanho de histórico:
+#
+#   - transação: o custo médio de registrar uma transação e atualizar a
+#     posição materializada (`PosicaoRepository.aplicar`);
+#   - leitura:   ler as posições abertas de todas as carteiras da tabela
+#     `posicoes` (o que a avaliação a mercado faz);
+#   - replay:    refazer as mesmas posições varrendo todo o histórico de
+#     transações (o que seria feito a cada avaliação sem a tabela).
+#
+# O custo por transação não depende do tamanho do histórico, e a leitura só
+# cresce com o número de posições (pares carteira/ativo); o replay cresce com
+# o número de transações.
+#
+# COMO USAR:
+# > python -m benchmarks.bench_posicoes --carteiras 1000 --ativos 50 --lotes 4
+#
+# ==============================================================================
+
+import argparse
+import datetime as dt
+import random
+import time
+
+from db_nexus.base import Base
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from diversify.database.models import Ativo, Carteira, TipoAtivo, TipoTransacao
+from diversify.database.repositories import PosicaoRepository, TransacaoRepository
+
+
+def criar_banco(n_carteiras: int, n_ativos: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(
+            insert(Ativo),
+            [
+                {"ticker": f"ATV{i:03d}3", "nome": f"Ativo {i}", "tipo": TipoAtivo.ACAO}
+                for i in range(n_ativos)
+            ],
+        )
+        session.execute(
+            insert(Carteira), [{"nome": f"cliente_{i}"} for i in range(n_carteiras)]
+        )
+        session.commit()
+    return engine
+
+
+def registrar_lote(
+    session: Session, n_transacoes: int, n_carteiras: int, n_ativos: int, dia
+) -> float:
+    """Registra `n_transacoes` compras (e aplica às posições); retorna o tempo."""
+    transacoes, posicoes = TransacaoRepository(), PosicaoRepository()
+    inicio = time.perf_counter()
+    for _ in range(n_transacoes):
+        transacao = transacoes.registrar(
+            session,
+            random.randint(1, n_carteiras),
+            random.randint(1, n_ativos),
+            dia,
+            TipoTransacao.COMPRA,
+            random.randint(1, 100),
+            random.uniform(5, 50),
+        )
+        posicoes.aplicar(session, transacao)
+    session.commit()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--carteiras", type=int, default=1000)
+    parser.add_argument("--ativos", type=int, default=50)
+    parser.add_argument(
+        "--transacoes", type=int, default=20_000, help="Transações por lote."
+    )
+    parser.add_argument("--lotes", type=int, default=4)
+    args = parser.parse_args()
+
+    random.seed(0)
+    engine = criar_banco(args.carteiras, args.ativos)
+    repo = PosicaoRepository()
+    dia = dt.date(2024, 1, 2)
+
+    print(
+        f"{'histórico':>10} | {'transação (µs)':>15} | "
+        f"{'leitura (ms)':>13} | {'replay (ms)':>12}"
+    )
+    print("-" * 60)
+    historico = 0
+    for lote in range(args.lotes):
+        with Session(engine) as session:
+            tempo = registrar_lote(
+                session,
+                args.transacoes,
+                args.carteiras,
+                args.ativos,
+                dia + dt.timedelta(days=lote),
+            )
+        historico += args.transacoes
+
+        with Session(engine) as session:
+            inicio = time.perf_counter()
+            abertas = repo.posicoes_abertas(session)
+            leitura = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            refeitas = repo._recalcular(session)
+            replay = time.perf_counter() - inicio
+        assert len(abertas) == len(refeitas)
+
+        print(
+            f"{historico:>10} | {tempo / args.transacoes * 1e6:>15.1f} | "
+            f"{leitura * 1e3:>13.1f} | {replay * 1e3:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
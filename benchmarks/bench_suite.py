@@ -0,0 +1,243 @@
+# ==============================================================================
+# BENCHMARK: SUÍTE OFFLINE DO FLUXO COMPLETO
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Mede as etapas principais do projeto sem acesso à rede, em um banco SQLite
+# temporário, para várias escalas (N ativos × M anos de histórico):
+#
+#   - b3_download:      `B3Service.download_b3_file_http` contra o servidor
+#                       local da B3 (`b3_standin.py`), com latência simulada;
+#   - b3_composition:   `B3Service.b3_composition` do CSV baixado;
+#   - populate_assets:  carga inicial dos ativos e uma segunda carga sem
+#                       mudanças (`populate_assets_repetido`);
+#   - update_quotes:    `QuoteService.update_historical_prices` com o
+#                       substituto do yfinance (`yf_standin.py`), e uma
+#                       segunda execução incremental (`update_quotes_repetido`);
+#   - load_price_matrix: matriz de preços de todo o universo.
+#   - get_latest_prices: último fechamento de todo o universo (retrato em
+#                       cache) e em uma data passada (`..._as_of`, uma query).
+#
+# Os resultados são gravados em JSON (com metadados da máquina e do commit)
+# e podem ser comparados com uma execução anterior (`--comparar`).
+#
+# COMO USAR:
+# > python -m benchmarks.bench_suite --saida resultados.json
+# > python -m benchmarks.bench_suite --ativos 50 500 --anos 1 --latencia-yf 0
+# > python -m benchmarks.bench_suite --comparar base.json --saida novo.json
+#
+# ==============================================================================
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import platform
+import string
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from db_nexus.session import DatabaseSessionManager
+
+from benchmarks.b3_standin import csv_sintetico, resposta_de_csv, servidor_b3_local
+from benchmarks.yf_standin import YFinanceLocal
+from diversify.b3_services import B3Service
+from diversify.database.models import TipoAtivo
+from diversify.database.performance import aplicar_perfil_sqlite
+from diversify.database.repositories import PrecoHistoricoRepository
+from diversify.database.services import AtivoService
+from diversify.quotes_services import QuoteService
+
+INDICE = "SINT"
+
+
+def tickers_sinteticos(n: int) -> list[str]:
+    """Tickers no formato da B3: quatro letras + '3'."""
+    letras = string.ascii_uppercase
+    tickers = []
+    for i in range(n):
+        codigo = ""
+        for _ in range(4):
+            i, resto = divmod(i, 26)
+            codigo = letras[resto] + codigo
+        tickers.append(f"{codigo}3")
+    return tickers
+
+
+@contextlib.contextmanager
+def medir(resultados: dict, etapa: str, silencioso: bool = True):
+    """Mede o bloco e guarda o tempo (em segundos) em `resultados[etapa]`."""
+    saida = io.StringIO() if silencioso else None
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(saida) if silencioso else contextlib.nullcontext():
+        yield
+    resultados[etapa] = round(time.perf_counter() - inicio, 4)
+
+
+def executar_cenario(
+    n_ativos: int,
+    anos: int,
+    latencia_yf: float,
+    latencia_b3: float,
+    requests_per_second: float,
+    max_workers: int,
+) -> dict:
+    tempos: dict[str, float] = {}
+    extras: dict[str, int] = {}
+
+    with tempfile.TemporaryDirectory() as pasta:
+        pasta = Path(pasta)
+        db_manager = DatabaseSessionManager(f"sqlite:///{pasta / 'bench.db'}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_perfil_sqlite(db_manager)
+        db_manager.create_all_tables()
+
+        # --- B3: download HTTP + parsing -------------------------------------
+        csv_origem = csv_sintetico(
+            INDICE, tickers_sinteticos(n_ativos), pasta / "origem.csv"
+        )
+        resposta_de_csv(csv_origem, INDICE, pasta / "respostas")
+        (pasta / "data").mkdir()
+        with servidor_b3_local(pasta / "respostas", latencia_b3) as api_url:
+            b3_service = B3Service(api_url=api_url)
+            with requests.Session() as session, medir(tempos, "b3_download"):
+                csv_baixado = b3_service.download_b3_file_http(
+                    session, INDICE, pasta / "data"
+                )
+        with medir(tempos, "b3_composition"):
+            composicao = b3_service.b3_composition(csv_baixado, INDICE)
+        extras["ativos_na_composicao"] = len(composicao)
+
+        # --- Ativos -----------------------------------------------------------
+        ativo_service = AtivoService(session_manager=db_manager)
+        with medir(tempos, "populate_assets"):
+            ativo_service.populate_assets(composicao, db_manager, TipoAtivo.ACAO)
+        with medir(tempos, "populate_assets_repetido"):
+            ativo_service.populate_assets(composicao, db_manager, TipoAtivo.ACAO)
+
+        # --- Cotações ---------------------------------------------------------
+        downloader = YFinanceLocal(latencia=latencia_yf)
+        quote_service = QuoteService()
+        parametros = dict(
+            downloader=downloader,
+            requests_per_second=requests_per_second,
+            max_workers=max_workers,
+            periodo=f"{anos}y",
+        )
+        with medir(tempos, "update_quotes"):
+            stats = quote_service.update_historical_prices(db_manager, **parametros)
+        extras["linhas_inseridas"] = stats.linhas_inseridas
+        extras["requisicoes"] = stats.requisicoes
+        with medir(tempos, "update_quotes_repetido"):
+            quote_service.update_historical_prices(db_manager, **parametros)
+
+        # --- Leitura ----------------------------------------------------------
+        hoje = dt.date.today()
+        with medir(tempos, "load_price_matrix"):
+            with db_manager.get_session() as session:
+                matriz = PrecoHistoricoRepository().load_price_matrix(
+                    session, TipoAtivo.ACAO, hoje - dt.timedelta(days=365 * anos), hoje
+                )
+        extras["matriz"] = list(matriz.shape)
+        with db_manager.get_session() as session:
+            repo = PrecoHistoricoRepository()
+            with medir(tempos, "get_latest_prices"):
+                repo.get_latest_prices(session)
+            with medir(tempos, "get_latest_prices_as_of"):
+                repo.get_latest_prices(session, as_of=hoje - dt.timedelta(days=30))
+
+    return {
+        "ativos": n_ativos,
+        "anos": anos,
+        "tempos": tempos,
+        "extras": extras,
+    }
+
+
+def metadados(args: argparse.Namespace) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "data": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {
+            "latencia_yf": args.latencia_yf,
+            "latencia_b3": args.latencia_b3,
+            "requests_per_second": args.rps,
+            "max_workers": args.max_workers,
+        },
+    }
+
+
+def comparar(anteriores: dict, atuais: dict):
+    """Imprime a razão atual/anterior de cada tempo em comum."""
+    base = {(c["ativos"], c["anos"]): c["tempos"] for c in anteriores["cenarios"]}
+    print(f"\nComparação com {anteriores['metadados'].get('commit')} (atual/anterior):")
+    for cenario in atuais["cenarios"]:
+        tempos_base = base.get((cenario["ativos"], cenario["anos"]))
+        if tempos_base is None:
+            continue
+        print(f"\n{cenario['ativos']} ativos × {cenario['anos']} anos")
+        for etapa, tempo in cenario["tempos"].items():
+            anterior = tempos_base.get(etapa)
+            if anterior:
+                razao = tempo / anterior
+                alerta = "  ⚠️" if razao > 1.2 else ""
+                print(
+                    f"  {etapa:>24}: {anterior:8.3f}s -> {tempo:8.3f}s  ({razao:.2f}x){alerta}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Suíte de benchmarks offline do fluxo B3 -> banco -> cotações."
+    )
+    parser.add_argument("--ativos", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--anos", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--latencia-yf", type=float, default=0.05)
+    parser.add_argument("--latencia-b3", type=float, default=0.2)
+    parser.add_argument("--rps", type=float, default=50.0)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--saida", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--comparar", type=Path, default=None)
+    args = parser.parse_args()
+
+    resultado = {"metadados": metadados(args), "cenarios": []}
+    for n_ativos in args.ativos:
+        for anos in args.anos:
+            print(f"Executando: {n_ativos} ativos × {anos} anos...")
+            cenario = executar_cenario(
+                n_ativos,
+                anos,
+                args.latencia_yf,
+                args.latencia_b3,
+                args.rps,
+                args.max_workers,
+            )
+            resultado["cenarios"].append(cenario)
+            for etapa, tempo in cenario["tempos"].items():
+                print(f"  {etapa:>24}: {tempo:8.3f}s")
+
+    args.saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        comparar(json.loads(args.comparar.read_text()), resultado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# ==============================================================================
+# SUBSTITUTO LOCAL E DETERMINÍSTICO DO `yfinance.download`
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Um "downloader" com a mesma assinatura e o mesmo formato de retorno do
+# `yf.download`, que gera séries OHLCV sintéticas em vez de acessar a rede.
+# Ele é passado para o `QuoteService`/`QuoteFetcher` pelo parâmetro
+# `downloader`:
+#
+#     downloader = YFinanceLocal(latencia=0.05)
+#     QuoteService().update_historical_prices(db_manager, downloader=downloader)
+#
+# As séries são determinísticas: o preço de um ticker em um pregão depende
+# apenas do ticker e da data (é uma função fechada do número de dias úteis
+# desde 03/01/2000), então janelas diferentes do mesmo ticker são
+# consistentes entre si e entre execuções.
+#
+# Com `actions=True`, as colunas "Dividends" e "Stock Splits" também vêm:
+# fundos (tickers terminados em "11") pagam um rendimento de 0,8% do
+# fechamento no primeiro pregão de cada mês; não há desdobramentos.
+#
+# ==============================================================================
+
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+ORIGEM = np.datetime64("2000-01-03", "D")
+CAMPOS = ["Open", "High", "Low", "Close", "Volume"]
+ACOES = ["Dividends", "Stock Splits"]
+_PERIODO = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_DIAS_POR_UNIDADE = {"d": 1, "wk": 7, "mo": 31, "y": 365}
+
+
+def _ruido(seed: int, dias: np.ndarray, canal: int) -> np.ndarray:
+    """Ruído pseudoaleatório em [-0.5, 0.5) função apenas de (seed, dia, canal)."""
+    x = np.sin(dias * 12.9898 + seed * 78.233 + canal * 37.719) * 43758.5453
+    return x - np.floor(x) - 0.5
+
+
+def serie_ohlcv(ticker: str, datas: pd.DatetimeIndex) -> np.ndarray:
+    """Matriz (datas × [Open, High, Low, Close, Volume]) de um ticker."""
+    seed = zlib.crc32(ticker.encode()) % 10_000
+    dias = np.busday_count(ORIGEM, datas.values.astype("datetime64[D]")).astype(
+        np.float64
+    )
+    preco_base = 5.0 + seed % 200
+    tendencia = ((seed % 7) - 3) * 1e-4
+    log_preco = (
+        tendencia * dias
+        + 0.15 * np.sin(2 * np.pi * dias / (120 + seed % 140) + seed)
+        + 0.05 * np.sin(2 * np.pi * dias / (15 + seed % 25))
+        + 0.02 * _ruido(seed, dias, 0)
+    )
+    fechamento = preco_base * np.exp(log_preco)
+    abertura = fechamento * (1 + 0.01 * _ruido(seed, dias, 1))
+    amplitude = np.abs(0.01 * _ruido(seed, dias, 2)) * fechamento
+    maxima = np.maximum(abertura, fechamento) + amplitude
+    minima = np.minimum(abertura, fechamento) - amplitude
+    volume = np.round(1e5 * (1.5 + _ruido(seed, dias, 3)))
+    return np.column_stack([abertura, maxima, minima, fechamento, volume])
+
+
+def serie_acoes(ticker: str, datas: pd.DatetimeIndex, fechamento) -> np.ndarray:
+    """Matriz (datas × [Dividends, Stock Splits]) de um ticker."""
+    proventos = np.zeros(len(datas))
+    if ticker.split(".")[0].endswith("11") and len(datas):
+        meses = datas.values.astype("datetime64[M]")
+        # Primeiro dia útil (seg-sex) de cada mês.
+        primeiro = np.busday_offset(meses.astype("datetime64[D]"), 0, roll="forward")
+        no_inicio = datas.values.astype("datetime64[D]") == primeiro
+        proventos[no_inicio] = np.round(0.008 * fechamento[no_inicio], 4)
+    return np.column_stack([proventos, np.zeros(len(datas))])
+
+
+class YFinanceLocal:
+    """
+    Substituto do `yf.download`. `latencia` (em segundos) é aplicada a cada
+    chamada; `hoje` fixa a data final das buscas por período.
+    """
+
+    def __init__(self, latencia: float = 0.0, hoje: pd.Timestamp | None = None):
+        self.latencia = latencia
+        self.hoje = pd.Timestamp(hoje or pd.Timestamp.today()).normalize()
+        self.chamadas = 0
+        self.linhas = 0
+        self._lock = threading.Lock()
+
+    def _inicio_do_periodo(self, period: str) -> pd.Timestamp:
+        if period == "max":
+            return pd.Timestamp(ORIGEM)
+        encontrado = _PERIODO.match(period)
+        if encontrado is None:
+            raise ValueError(f"Período inválido: {period!r}")
+        quantidade, unidade = encontrado.groups()
+        return self.hoje - pd.Timedelta(
+            days=int(quantidade) * _DIAS_POR_UNIDADE[unidade]
+        )
+
+    def __call__(
+        self,
+        tickers,
+        start=None,
+        end=None,
+        period: str | None = None,
+        group_by: str = "column",
+        **kwargs,
+    ) -> pd.DataFrame:
+        if self.latencia:
+            time.sleep(self.latencia)
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+
+        if start is None:
+            inicio, fim = self._inicio_do_periodo(period or "1mo"), self.hoje
+        else:
+            inicio = pd.Timestamp(start)
+            fim = pd.Timestamp(end) if end is not None else self.hoje
+        # Como no Yahoo, `end` é exclusivo.
+        datas = pd.bdate_range(inicio, fim, inclusive="left", name="Date")
+
+        campos = CAMPOS + ACOES if kwargs.get("actions") else CAMPOS
+        blocos = [serie_ohlcv(ticker, datas) for ticker in tickers]
+        if kwargs.get("actions"):
+            blocos = [
+                np.hstack([bloco, serie_acoes(ticker, datas, bloco[:, 3])])
+                for ticker, bloco in zip(tickers, blocos)
+            ]
+        if group_by == "ticker":
+            colunas = pd.MultiIndex.from_product(
+                [tickers, campos], names=["Ticker", "Price"]
+            )
+            valores = np.hstack(blocos) if blocos else np.empty((len(datas), 0))
+        else:
+            colunas = pd.MultiIndex.from_product(
+                [campos, tickers], names=["Price", "Ticker"]
+            )
+            valores = (
+                np.stack(blocos, axis=2).reshape(len(datas), -1)
+                if blocos
+                else np.empty((len(datas), 0))
+            )
+
+        with self._lock:
+            self.chamadas += 1
+            self.linhas += len(datas) * len(tickers)
+        return pd.DataFrame(valores, index=datas, columns=colunas)
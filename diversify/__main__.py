@@ -0,0 +1,6 @@
+# Permite executar `python -m diversify <subcomando>` (ver `cli.py`).
+import sys
+
+from diversify.cli import main
+
+sys.exit(main())
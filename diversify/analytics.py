@@ -0,0 +1,148 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/ANALYTICS.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Cálculos estatísticos sobre a matriz "data × ativo" de preços carregada por
+# `PrecoHistoricoRepository.load_price_matrix`: retornos, volatilidade
+# anualizada, covariância e correlação.
+#
+# Todas as funções operam sobre o universo inteiro de uma vez, com operações
+# matriciais do NumPy (nenhum laço por ativo). Lacunas (NaN) são tratadas par
+# a par: a covariância entre dois ativos usa apenas os pregões em que ambos
+# têm retorno, como no `DataFrame.cov()` do Pandas.
+#
+# COMPONENTES:
+# - retornos_log() / retornos_simples(): Retornos entre pregões consecutivos.
+# - volatilidade_anualizada(): Desvio padrão anualizado de cada ativo.
+# - covariancia_pareada(): Covariância com tratamento par a par de NaN.
+# - correlacao_pareada(): Correlação com tratamento par a par de NaN.
+# - calcular_estatisticas(): Executa tudo a partir de uma `MatrizPrecos`.
+#
+# MODO FLOAT32:
+# Todas as funções preservam o dtype da entrada. Passar `dtype=np.float32` para
+# `calcular_estatisticas` reduz o uso de memória pela metade em universos
+# grandes, ao custo de precisão (suficiente para alocação de carteiras).
+#
+# ==============================================================================
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from diversify.database.matriz_precos import MatrizPrecos
+
+PREGOES_POR_ANO = 252
+
+
+def retornos_log(precos: np.ndarray) -> np.ndarray:
+    """Retornos logarítmicos: `ln(P_t / P_{t-1})`. Uma linha a menos que a entrada."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.diff(np.log(precos), axis=0)
+
+
+def retornos_simples(precos: np.ndarray) -> np.ndarray:
+    """Retornos simples: `P_t / P_{t-1} - 1`. Uma linha a menos que a entrada."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return precos[1:] / precos[:-1] - 1
+
+
+def volatilidade_anualizada(
+    retornos: np.ndarray, periodos_por_ano: int = PREGOES_POR_ANO
+) -> np.ndarray:
+    """Desvio padrão amostral de cada coluna (ignorando NaN), anualizado."""
+    validos = ~np.isnan(retornos)
+    n = validos.sum(axis=0).astype(retornos.dtype)
+    media = np.nansum(retornos, axis=0) / np.maximum(n, 1)
+    desvios = np.where(validos, retornos - media, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variancia = (desvios * desvios).sum(axis=0) / (n - 1)
+    variancia[n < 2] = np.nan
+    return np.sqrt(variancia * periodos_por_ano)
+
+
+def _somas_pareadas(retornos: np.ndarray):
+    """
+    Somas necessárias para estatísticas par a par, todas como produtos de
+    matrizes. Para cada par (i, j), consideram apenas os pregões em que os
+    dois ativos têm retorno.
+    """
+    validos = ~np.isnan(retornos)
+    m = validos.astype(retornos.dtype)
+    # Centralizar antes de somar reduz o erro numérico, principalmente em float32.
+    n_coluna = np.maximum(validos.sum(axis=0), 1).astype(retornos.dtype)
+    x = np.where(validos, retornos - np.nansum(retornos, axis=0) / n_coluna, 0)
+
+    n = m.T @ m  # pregões em comum
+    sx = x.T @ m  # sx[i, j] = soma de x_i nos pregões em comum com j
+    sxx = (x * x).T @ m  # idem para x_i²
+    sxy = x.T @ x  # soma de x_i * x_j
+    return n, sx, sxx, sxy
+
+
+def covariancia_pareada(
+    retornos: np.ndarray,
+    periodos_por_ano: int | None = PREGOES_POR_ANO,
+    min_periodos: int = 2,
+) -> np.ndarray:
+    """
+    Matriz de covariância amostral com tratamento par a par de NaN.
+    Pares com menos de `min_periodos` pregões em comum ficam como NaN.
+    """
+    n, sx, _, sxy = _somas_pareadas(retornos)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (sxy - sx * sx.T / n) / (n - 1)
+    cov[n < max(min_periodos, 2)] = np.nan
+    if periodos_por_ano:
+        cov *= periodos_por_ano
+    return cov
+
+
+def correlacao_pareada(retornos: np.ndarray, min_periodos: int = 2) -> np.ndarray:
+    """
+    Matriz de correlação com tratamento par a par de NaN. As variâncias de
+    cada par também são calculadas só sobre os pregões em comum.
+    """
+    n, sx, sxx, sxy = _somas_pareadas(retornos)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var = sxx - sx * sx / n
+        corr = cov / np.sqrt(var * var.T)
+    corr[n < max(min_periodos, 2)] = np.nan
+    np.clip(corr, -1, 1, out=corr)
+    return corr
+
+
+@dataclass(frozen=True)
+class EstatisticasRetornos:
+    """Resultado de `calcular_estatisticas`, com um ticker por coluna/linha."""
+
+    tickers: list[str]
+    datas: np.ndarray  # datas dos retornos (a partir do segundo pregão)
+    retornos: np.ndarray
+    volatilidade: np.ndarray
+    covariancia: np.ndarray
+    correlacao: np.ndarray
+
+
+def calcular_estatisticas(
+    matriz: MatrizPrecos,
+    log: bool = True,
+    periodos_por_ano: int = PREGOES_POR_ANO,
+    min_periodos: int = 20,
+    dtype: type = np.float64,
+) -> EstatisticasRetornos:
+    """
+    Calcula retornos, volatilidade anualizada, covariância anualizada e
+    correlação de todos os ativos de uma `MatrizPrecos`.
+    """
+    precos = matriz.valores.astype(dtype, copy=False)
+    retornos = retornos_log(precos) if log else retornos_simples(precos)
+    return EstatisticasRetornos(
+        tickers=matriz.tickers,
+        datas=matriz.datas[1:],
+        retornos=retornos,
+        volatilidade=volatilidade_anualizada(retornos, periodos_por_ano),
+        covariancia=covariancia_pareada(retornos, periodos_por_ano, min_periodos),
+        correlacao=correlacao_pareada(retornos, min_periodos),
+    )
@@ -0,0 +1,195 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/B3_PARSER.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Parser rápido dos arquivos CSV de composição de índices baixados da B3.
+#
+# O formato do arquivo é:
+#
+#     IBOV - Carteira do Dia 02/09/25                      <- título
+#     Código;Ação;Tipo;Qtde. Teórica;Part. (%);            <- cabeçalho
+#     ALOS3;ALLOS;ON  NM;476.976.044;0,459;                <- ativos
+#     ...
+#     Quantidade Teórica Total;;;95.487.251.830;100,000;   <- rodapé
+#     Redutor;;;15.933.447,50;;
+#
+# Em vez de usar `pd.read_csv(..., skipfooter=2, engine="python")`, o parser
+# percorre as linhas uma única vez: lê a data da carteira no título, localiza
+# o cabeçalho pelo nome das colunas,
+# para no rodapé e converte os números no formato brasileiro. As colunas são
+# localizadas pelo nome, então o arquivo da visão "por setor" (que tem a
+# coluna `Setor` antes do código) também é aceito.
+#
+# COMPONENTES:
+# - ComposicaoIndice: A composição em estrutura compacta e tipada (listas de
+#   texto + arrays NumPy para quantidade teórica e participação).
+# - parse_b3_csv(): Lê um arquivo.
+# - parse_many(): Lê vários arquivos em paralelo, em um pool de threads.
+#
+# ==============================================================================
+
+import datetime as dt
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from diversify.metrics import cronometro, log_erro
+
+# Nome da coluna no cabeçalho da B3 -> campo da ComposicaoIndice.
+COLUNAS = {
+    "código": "tickers",
+    "ação": "nomes",
+    "tipo": "tipos",
+    "qtde. teórica": "qtde_teorica",
+    "part. (%)": "participacao",
+    "setor": "setores",
+}
+RODAPES = ("quantidade teórica total", "redutor")
+
+# Data no título (ex: "IBOV - Carteira do Dia 02/09/25"), com ano de 2 ou 4 dígitos.
+_DATA_TITULO = re.compile(r"(\d{2})/(\d{2})/(\d{4}|\d{2})\b")
+
+
+@dataclass(frozen=True)
+class ComposicaoIndice:
+    """Composição de um índice da B3, com uma posição por ativo."""
+
+    index_name: str
+    tickers: list[str]
+    nomes: list[str]
+    tipos: list[str]  # tipo do papel na B3 (ex: "ON NM", "PN N1")
+    qtde_teorica: np.ndarray  # int64
+    participacao: np.ndarray  # float64, em %
+    setores: list[str] | None = None  # só presente na visão por setor
+    # Data da carteira no título do arquivo (None se o título não tiver data).
+    data: dt.date | None = None
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def to_records(self) -> list[dict]:
+        """
+        Converte para a lista de dicionários usada no resto do projeto
+        (`ticker` e `nome`, mais as colunas extras da B3).
+        """
+        registros = [
+            {
+                "ticker": ticker,
+                "nome": nome,
+                "tipo_papel": tipo,
+                "qtde_teorica": int(qtde),
+                "participacao": float(part),
+            }
+            for ticker, nome, tipo, qtde, part in zip(
+                self.tickers,
+                self.nomes,
+                self.tipos,
+                self.qtde_teorica.tolist(),
+                self.participacao.tolist(),
+            )
+        ]
+        if self.setores is not None:
+            for registro, setor in zip(registros, self.setores):
+                registro["setor"] = setor
+        return registros
+
+
+def _numero_br(texto: str) -> float:
+    """Converte '1.234,56' em 1234.56 (campo vazio vira NaN)."""
+    texto = texto.strip()
+    if not texto:
+        return float("nan")
+    return float(texto.replace(".", "").replace(",", "."))
+
+
+def _data_do_titulo(linha: str) -> dt.date | None:
+    """Data de uma linha de título como "IBOV - Carteira do Dia 02/09/25"."""
+    encontrada = _DATA_TITULO.search(linha)
+    if encontrada is None:
+        return None
+    dia, mes, ano = (int(parte) for parte in encontrada.groups())
+    try:
+        return dt.date(ano + 2000 if ano < 100 else ano, mes, dia)
+    except ValueError:
+        return None
+
+
+def parse_b3_csv(
+    file_path: str | Path, index_name: str, encoding: str = "latin-1"
+) -> ComposicaoIndice:
+    """
+    Lê um CSV de composição da B3 em uma única passada pelas linhas.
+    Levanta ValueError se o cabeçalho não for encontrado.
+    """
+    with cronometro("b3_parse_csv", indice=index_name):
+        linhas = Path(file_path).read_bytes().decode(encoding).splitlines()
+
+        # 1. Cabeçalho: primeira linha que contém a coluna "Código". A data da
+        #    carteira vem do título, antes dele.
+        posicoes = None
+        inicio = 0
+        data = None
+        for i, linha in enumerate(linhas):
+            campos = [c.strip().lower() for c in linha.split(";")]
+            if "código" in campos:
+                posicoes = {COLUNAS[c]: j for j, c in enumerate(campos) if c in COLUNAS}
+                inicio = i + 1
+                break
+            data = data or _data_do_titulo(linha)
+        if posicoes is None:
+            raise ValueError(f"Cabeçalho não encontrado em '{file_path}'.")
+
+        valores: dict[str, list] = {campo: [] for campo in posicoes}
+        ultimo = max(posicoes.values())
+
+        # 2. Linhas de ativos, até o rodapé.
+        for linha in linhas[inicio:]:
+            campos = linha.split(";")
+            primeiro = campos[0].strip().lower()
+            if primeiro.startswith(RODAPES):
+                break
+            if len(campos) <= ultimo or not campos[posicoes["tickers"]].strip():
+                continue
+            for campo, j in posicoes.items():
+                valores[campo].append(campos[j].strip())
+
+        quantidade = len(valores["tickers"])
+        qtde = [_numero_br(q) for q in valores.get("qtde_teorica", [])]
+        part = [_numero_br(p) for p in valores.get("participacao", [])]
+        return ComposicaoIndice(
+            index_name=index_name,
+            tickers=valores["tickers"],
+            nomes=valores.get("nomes", [""] * quantidade),
+            tipos=valores.get("tipos", [""] * quantidade),
+            qtde_teorica=np.nan_to_num(np.array(qtde or [0] * quantidade)).astype(
+                np.int64
+            ),
+            participacao=np.array(part or [np.nan] * quantidade, dtype=np.float64),
+            setores=valores.get("setores"),
+            data=data,
+        )
+
+
+def parse_many(
+    files: dict[str, str | Path], max_workers: int = 5
+) -> dict[str, ComposicaoIndice]:
+    """
+    Lê vários arquivos ({nome do índice: caminho}) em paralelo.
+    Arquivos que não puderem ser lidos ficam fora do resultado.
+    """
+
+    def parse(item):
+        index_name, file_path = item
+        try:
+            return index_name, parse_b3_csv(file_path, index_name)
+        except (OSError, ValueError) as e:
+            log_erro(f"❌ Erro ao processar o arquivo {file_path}: {e}")
+            return index_name, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = executor.map(parse, files.items())
+        return {nome: comp for nome, comp in resultados if comp is not None}
@@ -21,7 +21,9 @@
 #      - Tenta obter todos os arquivos de índice para o dia. Possui lógica de
 #        múltiplas tentativas para lidar com falhas de rede.
 #      - A obtenção é inteligente: se o arquivo do dia já existe, ele é usado;
-#        senão, é feito o download via Selenium.
+#        senão, o CSV é baixado direto da API da B3 por HTTP (todos os índices
+#        em paralelo). O Selenium só é usado para os índices em que o
+#        download HTTP falhar.
 #
 #   3. PROCESSAMENTO E PERSISTÊNCIA (Lógica no script principal):
 #      - Após `run_update_manager` retornar os caminhos dos arquivos, o script
@@ -43,38 +45,63 @@
 #   - moment_index(): Verifica se é o momento certo do mês para a atualização.
 #
 # - DOWNLOAD:
-#   - refresh_indices(): Gerencia a instância do navegador e o loop de downloads.
-#   - download_b3_file(): Executa a tarefa de baixar um único arquivo CSV.
+#   - refresh_indices(): Decide, para cada índice, entre o arquivo do dia, o
+#     download HTTP e o navegador (fallback).
+#   - refresh_indices_http(): Baixa os CSVs de vários índices em paralelo,
+#     usando uma sessão HTTP com pool de conexões.
+#   - download_b3_file_http(): Baixa o CSV de um índice pela API da B3.
+#   - refresh_indices_selenium(): Gerencia a instância do navegador e o loop
+#     de downloads do fallback.
+#   - download_b3_file(): Baixa um único arquivo CSV pelo navegador e espera
+#     o arquivo final com o observador de diretório (`file_watcher.py`).
 #   - find_todays_file_for_index(): Utilitário que verifica se o arquivo do dia
 #     já foi baixado.
 #
 # - PROCESSAMENTO:
-#   - b3_composition(): O "parser" de baixo nível que usa Pandas para ler e
-#     limpar o conteúdo do arquivo CSV bruto.
+#   - ler_composicao() / b3_composition(): Lê e limpa o conteúdo do arquivo
+#     CSV bruto (e a data da carteira), usando o parser de passada única de
+#     `b3_parser.py`.
 #   - get_composition_for_index(): (Se utilizada) Função de alto nível que
 #     decide entre processar um arquivo ou usar dados de fallback.
 #
 # - PERSISTÊNCIA:
-#   - save_composition_to_json(): Salva os dados processados em um arquivo JSON.
+#   - save_composition_to_json(): Salva os dados processados em um arquivo JSON
+#     (de forma atômica e só quando a composição mudou, ver `manifest.py`) e
+#     registra no manifesto a data da carteira.
 #
 # - MANUTENÇÃO:
 #   - cleanup_old_index_files(): Deleta arquivos CSV de dias anteriores.
 #
 # ==============================================================================
 
+import base64
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+from diversify.file_watcher import DirectoryWatcher, aguardar_csv_final
+from diversify.manifest import (
+    ETAPA_COMPOSICAO,
+    ETAPA_CSV,
+    Manifest,
+    hash_arquivo,
+    hash_dados,
+    write_json_atomic,
+)
+from diversify.metrics import contar, cronometro, log, log_erro
+
+# requests, Selenium e o parser (numpy) são importados só nos métodos que os
+# usam: decidir se há algo a fazer (`moment_index`, manifesto) não deve pagar
+# pelo import deles.
+if TYPE_CHECKING:
+    import requests
+    from selenium import webdriver
+
+    from diversify.b3_parser import ComposicaoIndice
 
 
 class B3Service:
@@ -82,33 +109,162 @@ class B3Service:
     Contém a lógica de negócio de alto nível para lidar com dados da B3.
     """
 
-    # A função principal agora gerencia a criação e destruição do navegador
+    # Endpoint da API usada pelo botão "Download" das páginas de índices da B3.
+    # O último segmento da URL é um JSON codificado em base64 e a resposta é o
+    # próprio CSV, também em base64.
+    B3_API_URL = (
+        "https://sistemaswebb3-listados.b3.com.br/indexProxy/indexCall/"
+        "GetDownloadPortfolioDay/"
+    )
+
+    def __init__(self, api_url: str | None = None):
+        # `api_url` permite apontar o download para um servidor local com
+        # respostas gravadas (ver `benchmarks/b3_standin.py`).
+        self.api_url = api_url or self.B3_API_URL
+
+    def _load_indices_config(self) -> dict:
+        """Lê o mapa {nome do índice: URL da página} de `b3_links.json`."""
+        config_path = Path(__file__).resolve().parent.parent / "b3_links.json"
+        with open(config_path, "r", encoding="utf-8") as f:
+            return json.load(f)["indices_b3"]
+
     def refresh_indices(self) -> dict:
         """
-        Cria uma única instância do navegador e a reutiliza para baixar todos
-        os arquivos de índices, mantendo os arquivos antigos na pasta de destino.
+        Garante o arquivo de composição do dia para cada índice de
+        `b3_links.json`, mantendo os arquivos antigos na pasta de destino.
+
+        Para cada índice, usa o arquivo do dia se ele já existir; senão, baixa
+        por HTTP (em paralelo). O navegador só é iniciado se algum download
+        HTTP falhar.
 
         Retorna um dicionário com os nomes dos índices e os caminhos dos arquivos
         recém-baixados.
         """
-        print("--- Iniciando atualização dos arquivos de composição dos índices ---")
+        log("--- Iniciando atualização dos arquivos de composição dos índices ---")
 
         # --- 1. CONFIGURAÇÃO INICIAL ---
         download_dir = Path("data").resolve()
         os.makedirs(download_dir, exist_ok=True)
 
         try:
-            config_path = Path(__file__).resolve().parent.parent / "b3_links.json"
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            indices = config["indices_b3"]
+            indices = self._load_indices_config()
         except FileNotFoundError:
-            print(
+            log_erro(
                 f"❌ ERRO: Arquivo 'b3_links.json' não encontrado na raiz do projeto."
             )
             return {}
 
-        # --- 2. INICIALIZAÇÃO DO NAVEGADOR (FEITA UMA ÚNICA VEZ) ---
+        # --- 2. ARQUIVOS DO DIA QUE JÁ EXISTEM ---
+        downloaded_files = {}
+        for name in indices:
+            existing_file_path = self.find_todays_file_for_index(name, download_dir)
+            if existing_file_path:
+                log(f"✅ Arquivo para '{name}' já existe hoje. Pulando download.")
+                downloaded_files[name] = existing_file_path
+
+        # --- 3. DOWNLOAD HTTP DOS QUE FALTAM ---
+        pending = [name for name in indices if name not in downloaded_files]
+        if pending:
+            downloaded_files.update(self.refresh_indices_http(pending, download_dir))
+
+        # --- 4. FALLBACK PELO NAVEGADOR ---
+        pending = {
+            name: url for name, url in indices.items() if name not in downloaded_files
+        }
+        if pending:
+            log_erro(
+                f"\n⚠️ Download HTTP falhou para {', '.join(pending)}. "
+                "Usando o navegador como alternativa."
+            )
+            downloaded_files.update(
+                self.refresh_indices_selenium(pending, download_dir)
+            )
+
+        log("\n--- Atualização concluída ---")
+        return downloaded_files
+
+    def refresh_indices_http(
+        self, index_names: list[str], download_dir: Path, max_workers: int = 5
+    ) -> dict:
+        """
+        Baixa os CSVs de vários índices em paralelo, compartilhando uma única
+        sessão HTTP (conexões reaproveitadas).
+
+        Retorna {nome do índice: caminho do arquivo} apenas para os downloads
+        que deram certo.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with requests.Session() as session:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(
+                    lambda name: (
+                        name,
+                        self.download_b3_file_http(session, name, download_dir),
+                    ),
+                    index_names,
+                )
+                return {name: path for name, path in results if path}
+
+    def download_b3_file_http(
+        self,
+        session: "requests.Session",
+        index_name: str,
+        download_dir: Path,
+        timeout: float = 30,
+    ) -> str | None:
+        """
+        Baixa o CSV de composição do dia de um índice direto da API da B3.
+
+        O arquivo é salvo com o mesmo nome que o navegador usaria
+        (`NOME_DO_INDICEDia_DD-MM-YY.csv`). Retorna o caminho do arquivo ou
+        None em caso de falha.
+        """
+        parametros = json.dumps({"index": index_name, "language": "pt-br"})
+        url = self.api_url + base64.b64encode(parametros.encode()).decode()
+
+        with cronometro("b3_download", indice=index_name, metodo="http"):
+            try:
+                log(f"Baixando composição do índice {index_name} via HTTP...")
+                response = session.get(url, timeout=timeout)
+                response.raise_for_status()
+
+                # A resposta é o CSV em base64, às vezes entre aspas (string JSON).
+                content = base64.b64decode(response.text.strip().strip('"'))
+                if b";" not in content:
+                    raise ValueError("resposta não contém um CSV de composição")
+
+                today_str = datetime.now().strftime("%d-%m-%y")
+                file_path = Path(download_dir) / f"{index_name}Dia_{today_str}.csv"
+                # Grava em um arquivo temporário e renomeia, para que nenhum
+                # leitor encontre um CSV escrito pela metade.
+                temp_path = file_path.with_suffix(".csv.part")
+                temp_path.write_bytes(content)
+                os.replace(temp_path, file_path)
+
+                log(f"✅ Download concluído. Arquivo salvo como: {file_path}")
+                return str(file_path)
+
+            except Exception as e:
+                contar("b3_download_falhas", indice=index_name, metodo="http")
+                log_erro(f"❌ Erro no download HTTP do {index_name}: {e}")
+                return None
+
+    def refresh_indices_selenium(self, indices: dict, download_dir: Path) -> dict:
+        """
+        Cria uma única instância do navegador e a reutiliza para baixar os
+        arquivos dos índices informados ({nome: URL da página}).
+        """
+        from selenium import webdriver
+        from selenium.webdriver.firefox.options import Options
+        from selenium.webdriver.firefox.service import Service
+
+        # --- INICIALIZAÇÃO DO NAVEGADOR (FEITA UMA ÚNICA VEZ) ---
         options = Options()
         options.add_argument("--headless")
         options.set_preference("browser.download.folderList", 2)
@@ -117,39 +273,23 @@ class B3Service:
         options.set_preference("browser.helperApps.neverAsk.saveToDisk", "text/csv")
 
         service = Service(executable_path="./drivers/geckodriver")
-        driver = webdriver.Firefox(service=service, options=options)
+        with cronometro("b3_navegador_inicio"):
+            driver = webdriver.Firefox(service=service, options=options)
 
         downloaded_files = {}
 
-        # --- 3. EXECUÇÃO DOS DOWNLOADS COM VERIFICAÇÃO ---
+        # --- EXECUÇÃO DOS DOWNLOADS ---
         try:
             for name, url in indices.items():
-
-                # ** AQUI ESTÁ A NOVA LÓGICA **
-                # Primeiro, verifica se o arquivo do dia já existe
-                existing_file_path = self.find_todays_file_for_index(name, download_dir)
-
-                if existing_file_path:
-                    print(
-                        f"\n✅ Arquivo para '{name}' já existe hoje. Pulando download."
-                    )
-                    # Adiciona o arquivo existente à nossa lista de resultados
-                    downloaded_files[name] = existing_file_path
-                    continue  # Pula para o próximo índice do loop
-
-                # Se o arquivo não existe, prossegue com o download
                 file_path = self.download_b3_file(driver, url, name, str(download_dir))
 
                 if file_path:
                     downloaded_files[name] = file_path
 
-                time.sleep(2)
-
         finally:
-            # --- 4. ENCERRAMENTO DO NAVEGADOR ---
+            # --- ENCERRAMENTO DO NAVEGADOR ---
             if driver:
                 driver.quit()
-            print("\n--- Atualização concluída ---")
 
         return downloaded_files
 
@@ -170,19 +310,19 @@ class B3Service:
 
         # Verifica se estamos nos primeiros 10 dias de um mês de rebalanceamento
         if mes_atual in meses_rebalanceamento and dia_atual <= 10:
-            print(
+            log(
                 f"INFO: Data ({hoje}) está no início do período de rebalanceamento. Atualização recomendada."
             )
             return True
 
         # Verifica se estamos nos últimos 10 dias de um mês de prévias
         if mes_atual in meses_previa and dia_atual >= 20:
-            print(
+            log(
                 f"INFO: Data ({hoje}) está no período de prévias do rebalanceamento. Atualização recomendada."
             )
             return True
 
-        print(f"INFO: Data ({hoje}) fora da janela de rebalanceamento da B3.")
+        log(f"INFO: Data ({hoje}) fora da janela de rebalanceamento da B3.")
         return False
 
     def find_todays_file_for_index(
@@ -214,106 +354,100 @@ class B3Service:
 
     # A função de download agora recebe o 'driver' já criado como argumento
     def download_b3_file(
-        self, driver: webdriver.Firefox, url: str, index_name: str, download_dir: str
+        self, driver: "webdriver.Firefox", url: str, index_name: str, download_dir: str
     ) -> str | None:
         """
         Usa uma instância de driver existente para baixar o arquivo de composição de um índice.
 
         Esta versão aprimorada:
-        - Espera o download ser concluído de forma inteligente.
+        - Espera o download ser concluído por eventos do sistema de arquivos
+          (inotify, com polling como alternativa), sem pausas fixas.
         - Mantém o nome original do arquivo baixado.
         - Retorna o caminho completo do arquivo baixado em caso de sucesso, ou None em caso de falha.
         """
-        try:
-            print(f"\nIniciando download da composição do índice {index_name}...")
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
 
-            # 1. Pega a lista de arquivos na pasta ANTES do download
-            files_before = set(os.listdir(download_dir))
+        with cronometro("b3_download", indice=index_name, metodo="navegador"):
+            try:
+                log(f"\nIniciando download da composição do índice {index_name}...")
 
-            driver.get(url)
+                # 1. Começa a observar a pasta ANTES do download, para não perder
+                #    nenhum evento, e guarda os arquivos que já existiam.
+                with DirectoryWatcher(download_dir) as watcher:
+                    files_before = set(os.listdir(download_dir))
 
-            download_button_xpath = "//a[normalize-space()='Download']"
-            print("Aguardando o botão de download ficar disponível...")
+                    driver.get(url)
 
-            download_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.XPATH, download_button_xpath))
-            )
-            print("Botão de download encontrado. Clicando...")
-            download_button.click()
-
-            # 2. Lógica de espera inteligente (substituindo time.sleep)
-            print("Aguardando o download ser concluído...")
-            timeout = 30  # Tempo máximo de espera em segundos
-            for i in range(timeout):
-                # Pega a lista de arquivos DEPOIS do clique
-                files_after = set(os.listdir(download_dir))
-                new_files = files_after - files_before
-
-                # Verifica se um novo arquivo .csv apareceu e não é um download parcial
-                if new_files:
-                    new_filename = new_files.pop()
-                    if new_filename.endswith(".csv"):
-                        # Espera um segundo extra para garantir que a escrita terminou
-                        time.sleep(1)
-                        file_path = os.path.join(download_dir, new_filename)
-                        print(f"✅ Download concluído. Arquivo salvo como: {file_path}")
-                        return file_path  # Retorna o caminho do novo arquivo
-
-                time.sleep(1)  # Espera 1 segundo antes de verificar novamente
-
-            # Se o loop terminar sem encontrar um arquivo, é um erro de timeout
-            print("❌ Erro: O download não foi concluído dentro do tempo esperado.")
-            return None
+                    download_button_xpath = "//a[normalize-space()='Download']"
+                    log("Aguardando o botão de download ficar disponível...")
 
-        except Exception as e:
-            print(f"❌ Erro durante o download do {index_name}: {e}")
-            return None
+                    download_button = WebDriverWait(driver, 15).until(
+                        EC.element_to_be_clickable((By.XPATH, download_button_xpath))
+                    )
+                    log("Botão de download encontrado. Clicando...")
+                    download_button.click()
+
+                    # 2. Espera o CSV final do índice (sem `.part` e com tamanho
+                    #    estável), acordando a cada mudança na pasta.
+                    log("Aguardando o download ser concluído...")
+                    file_path = aguardar_csv_final(
+                        watcher, index_name, files_before, timeout=30
+                    )
+
+                if file_path is None:
+                    contar("b3_download_falhas", indice=index_name, metodo="navegador")
+                    log_erro(
+                        "❌ Erro: O download não foi concluído dentro do tempo esperado."
+                    )
+                    return None
+
+                log(f"✅ Download concluído. Arquivo salvo como: {file_path}")
+                return str(file_path)
+
+            except Exception as e:
+                contar("b3_download_falhas", indice=index_name, metodo="navegador")
+                log_erro(f"❌ Erro durante o download do {index_name}: {e}")
+                return None
 
     def b3_composition(self, file_path: str, index_name: str) -> list[dict]:
         """
-        Lê um arquivo CSV de composição de índice da B3, extraindo apenas as
-        duas primeiras colunas (ticker e nome do ativo).
+        Lê um arquivo CSV de composição de índice da B3.
 
-        Esta versão assume que a primeira coluna é sempre o ticker e a segunda
-        é sempre o nome do ativo.
+        Cada ativo vira um dicionário com `ticker` e `nome`, mais as colunas
+        extras do arquivo (`tipo_papel`, `qtde_teorica`, `participacao` e, na
+        visão por setor, `setor`). O parsing é feito por `b3_parser`, que
+        localiza cabeçalho e rodapé em uma única passada.
         """
-        print(
-            f"Processando arquivo de composição para {index_name} de '{file_path}'..."
-        )
+        composicao = self.ler_composicao(file_path, index_name)
+        return [] if composicao is None else composicao.to_records()
 
-        try:
-            # --- MUDANÇA PRINCIPAL AQUI ---
-            # Usamos 'usecols' e 'names' para ler APENAS as colunas que nos interessam,
-            # já nomeando-as corretamente no momento da leitura.
-            df_composicao = pd.read_csv(
-                file_path,
-                sep=";",
-                encoding="latin-1",
-                skipfooter=2,
-                engine="python",
-                skiprows=2,  # Pula a primeira linha do arquivo (título geral)
-                header=None,  # Informa que o arquivo não tem um cabeçalho que queremos usar
-                usecols=[0, 1],  # Lê APENAS a primeira (0) e a segunda (1) colunas
-                names=[
-                    "ticker",
-                    "nome",
-                ],  # Dá a essas colunas os nomes 'ticker' e 'nome'
-            )
+    def ler_composicao(
+        self, file_path: str, index_name: str
+    ) -> "ComposicaoIndice | None":
+        """
+        Como `b3_composition`, mas retorna a `ComposicaoIndice`, que traz
+        também a data da carteira lida do título do arquivo. None se o
+        arquivo não puder ser lido.
+        """
+        from diversify.b3_parser import parse_b3_csv
 
-            # Como já selecionamos as colunas, basta remover linhas que possam estar vazias.
-            df_composicao.dropna(inplace=True)
+        log(f"Processando arquivo de composição para {index_name} de '{file_path}'...")
 
-            print(f"Processados {len(df_composicao)} ativos do arquivo {file_path}.")
-            return df_composicao.to_dict("records")
+        try:
+            composicao = parse_b3_csv(file_path, index_name)
+            log(f"Processados {len(composicao)} ativos do arquivo {file_path}.")
+            return composicao
 
         except FileNotFoundError:
-            print(
+            log_erro(
                 f"❌ ERRO CRÍTICO: O arquivo '{file_path}' não foi encontrado ao tentar processar."
             )
-            return []
+            return None
         except Exception as e:
-            print(f"❌ Erro ao processar o arquivo {file_path}: {e}")
-            return []
+            log_erro(f"❌ Erro ao processar o arquivo {file_path}: {e}")
+            return None
 
     # Adicione a importação do `datetime` se ainda não tiver no topo do arquivo
     from datetime import datetime
@@ -332,14 +466,14 @@ class B3Service:
         :param target_dir: O diretório a ser limpo (ex: a pasta 'data').
         :param index_names: Uma lista com os nomes dos índices (ex: ["IBOV", "IFIX"]).
         """
-        print(f"\n--- INICIANDO LIMPEZA DE ARQUIVOS ANTIGOS EM '{target_dir}' ---")
+        log(f"\n--- INICIANDO LIMPEZA DE ARQUIVOS ANTIGOS EM '{target_dir}' ---")
 
         # Pega a data de hoje no formato DD-MM-YY (ex: 02-09-25)
         today_str = datetime.now().strftime("%d-%m-%y")
 
         # Garante que o diretório alvo existe antes de continuar
         if not target_dir.exists():
-            print(
+            log_erro(
                 f"⚠️ Diretório '{target_dir}' não encontrado. Nenhuma limpeza a ser feita."
             )
             return
@@ -358,11 +492,11 @@ class B3Service:
                 if file_path.name != file_to_keep:
                     try:
                         os.remove(file_path)
-                        print(f"🗑️ Deletado arquivo antigo: {file_path.name}")
+                        log(f"🗑️ Deletado arquivo antigo: {file_path.name}")
                     except Exception as e:
-                        print(f"❌ Erro ao tentar deletar {file_path.name}: {e}")
+                        log_erro(f"❌ Erro ao tentar deletar {file_path.name}: {e}")
 
-        print("--- LIMPEZA FINALIZADA ---")
+        log("--- LIMPEZA FINALIZADA ---")
 
     def run_update_manager(
         self, max_attempts: int = 3, retry_delay_minutes: int = 1
@@ -371,18 +505,17 @@ class B3Service:
         Gerencia o processo completo de atualização dos arquivos de índices da B3.
         ... (o resto da docstring) ...
         """
-        print("==========================================================")
-        print(f"🚀 INICIANDO GERENCIADOR DE ATUALIZAÇÃO DE ÍNDICES B3")
-        print(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        print("==========================================================")
+        log("==========================================================")
+        log(f"🚀 INICIANDO GERENCIADOR DE ATUALIZAÇÃO DE ÍNDICES B3")
+        log(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        log("==========================================================")
 
         try:
-            config_path = Path(__file__).resolve().parent.parent / "b3_links.json"
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            target_indices = set(config["indices_b3"].keys())
+            target_indices = set(self._load_indices_config().keys())
         except FileNotFoundError:
-            print(f"❌ ERRO FATAL: Arquivo 'b3_links.json' não encontrado. Abortando.")
+            log_erro(
+                f"❌ ERRO FATAL: Arquivo 'b3_links.json' não encontrado. Abortando."
+            )
             return {}  # Retorna um dicionário vazio em caso de erro inicial
 
         # Inicializa o dicionário ANTES do loop
@@ -390,7 +523,7 @@ class B3Service:
 
         # Loop de tentativas
         for attempt in range(1, max_attempts + 1):
-            print(f"\n--- TENTATIVA {attempt} de {max_attempts} ---")
+            log(f"\n--- TENTATIVA {attempt} de {max_attempts} ---")
 
             # A cada tentativa, a variável `downloaded_files` é atualizada
             downloaded_files = self.refresh_indices()
@@ -398,7 +531,7 @@ class B3Service:
             successful_indices = set(downloaded_files.keys())
 
             if target_indices.issubset(successful_indices):
-                print(
+                log(
                     "\n✅ SUCESSO! Todos os arquivos de índice para hoje foram obtidos."
                 )
                 if target_indices:
@@ -406,63 +539,98 @@ class B3Service:
                 break
             else:
                 missing_indices = target_indices - successful_indices
-                print(
+                log_erro(
                     f"\n⚠️ AVISO: A tentativa {attempt} falhou em obter todos os arquivos."
                 )
-                print(f"Índices faltando: {', '.join(missing_indices)}")
+                log(f"Índices faltando: {', '.join(missing_indices)}")
 
                 if attempt < max_attempts:
-                    print(
+                    log(
                         f"Aguardando {retry_delay_minutes} minutos antes de tentar novamente..."
                     )
                     time.sleep(retry_delay_minutes * 60)
                 else:
-                    print("\n❌ ERRO FINAL: Número máximo de tentativas atingido.")
+                    log_erro("\n❌ ERRO FINAL: Número máximo de tentativas atingido.")
 
-        print("\n==========================================================")
-        print("🏁 GERENCIADOR DE ATUALIZAÇÃO FINALIZADO.")
-        print("==========================================================")
+        log("\n==========================================================")
+        log("🏁 GERENCIADOR DE ATUALIZAÇÃO FINALIZADO.")
+        log("==========================================================")
 
         # <<< A CORREÇÃO ESTÁ AQUI! >>>
         # Retorna o resultado da última tentativa (bem-sucedida ou não).
         return downloaded_files
 
     def save_composition_to_json(
-        self, index_name: str, composition_data: list[dict], output_dir: Path
-    ):
+        self,
+        index_name: str,
+        composition_data: list[dict],
+        output_dir: Path,
+        manifest: Manifest | None = None,
+        data_carteira: date | None = None,
+    ) -> bool:
         """
         Salva a lista de composição de um índice em um arquivo JSON.
 
+        Com um `manifest`, o arquivo só é regravado se o conteúdo da composição
+        mudou desde a última gravação. A escrita é atômica (arquivo temporário
+        + rename).
+
         :param index_name: O nome do índice (ex: "IFIX"), usado para nomear o arquivo.
         :param composition_data: A lista de dicionários de ativos para salvar.
         :param output_dir: O diretório onde o arquivo JSON será salvo.
+        :param manifest: Manifesto de hashes usado para pular gravações repetidas.
+        :param data_carteira: Data da carteira no título do CSV. Fica no
+            manifesto quando o JSON é gravado (ou se ainda não houver data):
+            uma composição inalterada mantém a data em que apareceu.
+        :return: True se o arquivo foi gravado.
         """
-        # Garante que o diretório de saída exista
-        os.makedirs(output_dir, exist_ok=True)
-
         # Define o caminho completo do arquivo de saída
         file_path = output_dir / f"{index_name}_composition.json"
-
-        print(f"Salvando composição do {index_name} em: {file_path}")
+        if (
+            manifest is not None
+            and data_carteira is not None
+            and manifest.data_carteira(index_name) is None
+        ):
+            manifest.set_data_carteira(index_name, data_carteira)
+
+        hash_composicao = hash_dados(composition_data)
+        if (
+            manifest is not None
+            and file_path.exists()
+            and manifest.inalterado(index_name, ETAPA_COMPOSICAO, hash_composicao)
+        ):
+            log(f"Composição do {index_name} não mudou. Mantendo {file_path}.")
+            return False
+
+        log(f"Salvando composição do {index_name} em: {file_path}")
 
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                # json.dump é usado para escrever o objeto Python no arquivo
-                json.dump(
-                    composition_data,
-                    f,
-                    ensure_ascii=False,  # Essencial para salvar caracteres como 'Ç' e 'Ã' corretamente
-                    indent=4,  # Formata o JSON para ser legível, com 4 espaços de indentação
-                )
-            print(f"✅ Arquivo {file_path} salvo com sucesso.")
+            write_json_atomic(
+                file_path,
+                composition_data,
+                ensure_ascii=False,  # Essencial para salvar caracteres como 'Ç' e 'Ã' corretamente
+                indent=4,  # Formata o JSON para ser legível, com 4 espaços de indentação
+            )
+            if manifest is not None:
+                manifest.set(index_name, ETAPA_COMPOSICAO, hash_composicao)
+                if data_carteira is not None:
+                    manifest.set_data_carteira(index_name, data_carteira)
+            log(f"✅ Arquivo {file_path} salvo com sucesso.")
+            return True
         except Exception as e:
-            print(f"❌ Erro ao salvar o arquivo JSON para {index_name}: {e}")
+            log_erro(f"❌ Erro ao salvar o arquivo JSON para {index_name}: {e}")
+            return False
 
-    def refresh_index(self):
+    def refresh_index(self, forcar: bool = False):
         """
         Executa o processo de atualização dos dados de índices da B3.
+
+        Cada etapa consulta o manifesto de hashes (`processed_data/manifest.json`):
+        CSVs idênticos aos da última execução não são processados de novo, e
+        composições idênticas não regravam o JSON. Com `forcar`, a janela de
+        rebalanceamento (`moment_index`) é ignorada.
         """
-        if self.moment_index():
+        if forcar or self.moment_index():
             # ETAPA 1: Gerenciar e garantir o download de todos os arquivos de índice.
             available_files_map = self.run_update_manager(
                 max_attempts=3, retry_delay_minutes=1
@@ -470,36 +638,65 @@ class B3Service:
 
             # Verifica se a etapa de download teve algum sucesso antes de prosseguir
             if not available_files_map:
-                print(
+                log(
                     "\nNenhum arquivo foi encontrado ou baixado. Encerrando o processo."
                 )
             else:
-                print("\n--- INICIANDO ETAPA DE PROCESSAMENTO DOS ARQUIVOS ---")
-                all_compositions = {}
-                for index_name, file_path in available_files_map.items():
-                    composition = self.b3_composition(file_path, index_name)
-                    all_compositions[index_name] = composition
+                # Define um diretório para salvar os dados processados
+                processed_data_dir = Path("processed_data")
+                manifest = Manifest(processed_data_dir / "manifest.json")
+
+                # ETAPA 2: Só processa os CSVs cujo conteúdo mudou.
+                csv_hashes = {
+                    index_name: hash_arquivo(file_path)
+                    for index_name, file_path in available_files_map.items()
+                }
+                changed_files = {
+                    index_name: file_path
+                    for index_name, file_path in available_files_map.items()
+                    if not (
+                        manifest.inalterado(
+                            index_name, ETAPA_CSV, csv_hashes[index_name]
+                        )
+                        and (
+                            processed_data_dir / f"{index_name}_composition.json"
+                        ).exists()
+                    )
+                }
+                for index_name in available_files_map.keys() - changed_files.keys():
+                    log(f"Arquivo do {index_name} não mudou. Pulando processamento.")
 
-                print("\n--- PROCESSAMENTO CONCLUÍDO ---")
+                from diversify.b3_parser import parse_many
 
-                # --- ETAPA 3: SALVAR OS RESULTADOS PROCESSADOS EM ARQUIVOS JSON ---
-                print("\n--- INICIANDO ETAPA DE SALVAMENTO EM JSON ---")
+                log("\n--- INICIANDO ETAPA DE PROCESSAMENTO DOS ARQUIVOS ---")
+                # Todos os arquivos são processados em paralelo.
+                all_compositions = parse_many(changed_files)
 
-                # Define um diretório para salvar os dados processados
-                processed_data_dir = Path("processed_data")
+                log("\n--- PROCESSAMENTO CONCLUÍDO ---")
+
+                # --- ETAPA 3: SALVAR OS RESULTADOS PROCESSADOS EM ARQUIVOS JSON ---
+                log("\n--- INICIANDO ETAPA DE SALVAMENTO EM JSON ---")
 
-                for index_name, composition_list in all_compositions.items():
-                    if (
-                        composition_list
-                    ):  # Salva apenas se a lista de composição não estiver vazia
+                for index_name, composicao in all_compositions.items():
+                    # Salva apenas se a lista de composição não estiver vazia
+                    if len(composicao):
                         self.save_composition_to_json(
-                            index_name, composition_list, processed_data_dir
+                            index_name,
+                            composicao.to_records(),
+                            processed_data_dir,
+                            manifest,
+                            data_carteira=composicao.data,
                         )
+                        if (
+                            processed_data_dir / f"{index_name}_composition.json"
+                        ).exists():
+                            manifest.set(index_name, ETAPA_CSV, csv_hashes[index_name])
                     else:
-                        print(
+                        log_erro(
                             f"⚠️ Nenhuma composição para salvar para o índice {index_name}."
                         )
 
-                print("\n--- SALVAMENTO CONCLUÍDO ---")
+                manifest.save()
+                log("\n--- SALVAMENTO CONCLUÍDO ---")
         else:
-            print(f"Atualização dos índices não é necessária.")
+            log(f"Atualização dos índices não é necessária.")
@@ -0,0 +1,180 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/CALENDARIO_B3.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Calendário de pregões da B3, calculado localmente (sem consultar a rede).
+#
+# O atualizador de cotações usa o calendário para não pedir ao Yahoo dados
+# que ainda não existem: em fins de semana, feriados da bolsa e antes do
+# fechamento do pregão do dia, os ativos já atualizados até o último pregão
+# encerrado são pulados.
+#
+# REGRAS DE FERIADOS:
+#   - Fixos: Confraternização (01/01), Tiradentes (21/04), Dia do Trabalho
+#     (01/05), Independência (07/09), Nossa Senhora Aparecida (12/10),
+#     Finados (02/11), Proclamação da República (15/11), Natal (25/12), além
+#     de 24/12 e 31/12, em que a B3 não abre.
+#   - Último dia útil do ano: quando 31/12 cai em fim de semana, a B3 fecha no
+#     dia útil anterior (ex: 30/12/2022 e 29/12/2023).
+#   - Móveis (a partir da Páscoa): segunda e terça de Carnaval, Sexta-feira
+#     Santa e Corpus Christi. A Quarta-feira de Cinzas tem pregão (só começa
+#     mais tarde).
+#   - Consciência Negra (20/11): feriado nacional a partir de 2024. Até 2021 a
+#     B3 também fechava nos feriados da cidade e do estado de São Paulo
+#     (25/01, 09/07 e 20/11); em 2022 e 2023 abriu nesses dias.
+#
+# As contagens usam `np.busday_count`/`np.busday_offset` com um
+# `np.busdaycalendar`, e aceitam arrays de datas.
+#
+# COMPONENTES:
+# - pascoa() / feriados_b3(): As regras de feriados.
+# - eh_pregao() / sessoes_entre() / proxima_sessao() / sessao_anterior():
+#   Operações sobre o calendário (vetorizadas).
+# - ultima_sessao_encerrada(): O último pregão já encerrado, no horário de
+#   Brasília.
+#
+# ==============================================================================
+
+import datetime as dt
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+try:
+    FUSO_B3 = ZoneInfo("America/Sao_Paulo")
+except ZoneInfoNotFoundError:
+    # Sem a base de fusos do sistema (ex: Windows sem `tzdata`): o Brasil não
+    # tem horário de verão desde 2019.
+    FUSO_B3 = dt.timezone(dt.timedelta(hours=-3), "BRT")
+
+# O pregão regular termina às 17h; a barra diária do provedor fica estável
+# algum tempo depois.
+HORARIO_FECHAMENTO = dt.time(18, 0)
+
+# Primeiro ano com os feriados de São Paulo fora do calendário da bolsa.
+_FIM_FERIADOS_SP = 2021
+
+
+def pascoa(ano: int) -> dt.date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)."""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(ano, mes, dia + 1)
+
+
+@lru_cache(maxsize=None)
+def feriados_b3(ano: int) -> tuple[dt.date, ...]:
+    """
+    Dias sem pregão na B3 em `ano` (além dos fins de semana), em ordem.
+
+    >>> dt.date(2022, 12, 30) in feriados_b3(2022)
+    True
+    >>> dt.date(2023, 12, 29) in feriados_b3(2023)
+    True
+    """
+    fixos = [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15)]
+    fixos += [(12, 24), (12, 25), (12, 31)]
+    if ano <= _FIM_FERIADOS_SP:
+        fixos += [(1, 25), (7, 9), (11, 20)]
+    elif ano >= 2024:
+        fixos.append((11, 20))
+
+    domingo_de_pascoa = pascoa(ano)
+    moveis = [
+        domingo_de_pascoa + dt.timedelta(days=delta)
+        for delta in (-48, -47, -2, 60)  # Carnaval (seg/ter), Paixão, Corpus Christi
+    ]
+
+    # 31/12 já não tem pregão; quando cai em fim de semana, a B3 fecha no
+    # último dia útil do ano.
+    ultimo_dia_util = dt.date(ano, 12, 31)
+    while ultimo_dia_util.weekday() >= 5:
+        ultimo_dia_util -= dt.timedelta(days=1)
+    moveis.append(ultimo_dia_util)
+    return tuple(sorted({dt.date(ano, m, d) for m, d in fixos} | set(moveis)))
+
+
+@lru_cache(maxsize=8)
+def _calendario(ano_inicial: int, ano_final: int) -> np.busdaycalendar:
+    feriados = [
+        f for ano in range(ano_inicial, ano_final + 1) for f in feriados_b3(ano)
+    ]
+    return np.busdaycalendar(holidays=np.array(feriados, dtype="datetime64[D]"))
+
+
+def _como_dias(datas) -> np.ndarray:
+    return np.asarray(datas, dtype="datetime64[D]")
+
+
+def calendario_para(*datas) -> np.busdaycalendar:
+    """Um `busdaycalendar` com os feriados de todos os anos das `datas`."""
+    anos = [
+        _como_dias(d).astype("datetime64[Y]").astype(int) + 1970
+        for d in datas
+        if np.size(d)
+    ]
+    anos = np.concatenate([np.ravel(a) for a in anos]) if anos else np.array([])
+    hoje = dt.date.today().year
+    # Faixa arredondada para reaproveitar o mesmo calendário entre chamadas.
+    inicio = min(int(anos.min()) if anos.size else hoje, 2000)
+    fim = max(int(anos.max()) if anos.size else hoje, hoje + 1)
+    return _calendario(inicio, fim)
+
+
+def eh_pregao(datas):
+    """
+    Se cada data é dia de pregão.
+
+    >>> eh_pregao(["2022-12-30", "2023-12-29", "2024-12-30"]).tolist()
+    [False, False, True]
+    """
+    datas = _como_dias(datas)
+    return np.is_busday(datas, busdaycal=calendario_para(datas))
+
+
+def sessoes_entre(inicio, fim):
+    """
+    Número de pregões no intervalo [inicio, fim) (fim exclusivo), para datas
+    ou arrays de datas. Intervalos vazios ou invertidos contam zero.
+    """
+    inicio, fim = _como_dias(inicio), _como_dias(fim)
+    contagem = np.busday_count(inicio, fim, busdaycal=calendario_para(inicio, fim))
+    return np.maximum(contagem, 0)
+
+
+def proxima_sessao(datas):
+    """Primeiro pregão estritamente posterior a cada data."""
+    datas = _como_dias(datas) + 1
+    return np.busday_offset(
+        datas, 0, roll="forward", busdaycal=calendario_para(datas + 7)
+    )
+
+
+def sessao_anterior(datas):
+    """Último pregão estritamente anterior a cada data."""
+    datas = _como_dias(datas) - 1
+    return np.busday_offset(
+        datas, 0, roll="backward", busdaycal=calendario_para(datas - 7)
+    )
+
+
+def ultima_sessao_encerrada(agora: dt.datetime | None = None) -> dt.date:
+    """
+    O último pregão já encerrado em `agora` (padrão: o momento atual), no
+    horário da B3. Antes do fechamento, o pregão do dia ainda não conta.
+    """
+    agora = (agora or dt.datetime.now(FUSO_B3)).astimezone(FUSO_B3)
+    hoje = agora.date()
+    if agora.time() >= HORARIO_FECHAMENTO and eh_pregao(hoje):
+        return hoje
+    return sessao_anterior(hoje).astype(dt.date)
@@ -0,0 +1,328 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/CLI.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Ponto de entrada único das tarefas do projeto:
+#
+#   python -m diversify refresh-indices   # CSVs da B3 -> processed_data/*.json
+#   python -m diversify sync-assets       # processed_data/*.json -> banco
+#   python -m diversify update-quotes     # cotações do yfinance -> banco
+#   python -m diversify fill-gaps         # buracos no meio das séries
+#   python -m diversify all               # as três primeiras, em um pipeline
+#
+# Este módulo só importa a biblioteca padrão e módulos leves do pacote
+# (manifesto, métricas, tipos). requests, Selenium, numpy, pandas, SQLAlchemy e
+# yfinance são importados dentro de cada subcomando, e apenas quando ele tem
+# trabalho a fazer: um cron que não encontra nada para fazer (fora da janela de
+# rebalanceamento, JSONs já sincronizados) termina em milissegundos.
+#
+# O `all` não roda as etapas uma depois da outra: usa o `PipelineDiario`, em
+# que as cotações de um índice começam a ser baixadas enquanto os outros
+# índices ainda estão sendo baixados e gravados.
+#
+# COMPONENTES:
+# - main(): Lê os argumentos e executa o subcomando.
+# - refresh_indices() / sync_assets() / update_quotes() / fill_gaps() /
+#   executar_tudo():
+#   Os subcomandos; cada um recebe os argumentos já lidos e retorna o código
+#   de saída.
+# - abrir_banco(): O gerenciador de sessões com o perfil, as métricas e as
+#   migrações (usado também por `tasks/pipeline_diario.py`).
+#
+# ==============================================================================
+
+import argparse
+import json
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+
+from diversify.metrics import (
+    cronometro,
+    definir_silencioso,
+    gravar_resumo,
+    log,
+    log_erro,
+    metricas,
+)
+
+DB_URL_PADRAO = "sqlite:///diversify.db"
+
+
+def abrir_banco(db_url: str):
+    """
+    Cria o gerenciador de sessões com o perfil do SQLite e as métricas, e
+    converte bancos de versões anteriores para o esquema atual.
+    """
+    from db_nexus.session import DatabaseSessionManager
+
+    # Os modelos precisam estar registrados na Base antes do `create_all_tables`.
+    from diversify.database import models  # noqa: F401
+    from diversify.database.migrations import migrar_banco
+    from diversify.database.performance import aplicar_perfil_sqlite
+    from diversify.metrics import instrumentar_banco
+
+    db_manager = DatabaseSessionManager(db_url)
+    # WAL: leitores (notebooks, relatórios) não bloqueiam a gravação, e cada
+    # commit custa menos fsyncs.
+    aplicar_perfil_sqlite(db_manager)
+    instrumentar_banco(db_manager)
+    db_manager.create_all_tables()
+    migrar_banco(db_manager)
+    return db_manager
+
+
+def _banco_sqlite_tem_ativos(db_url: str) -> bool | None:
+    """
+    Diz se um banco SQLite já tem algum ativo, usando o `sqlite3` da
+    biblioteca padrão. Retorna None se não for possível saber sem o SQLAlchemy
+    (outro banco, arquivo inexistente, tabela ausente).
+    """
+    prefixo = "sqlite:///"
+    if not db_url.startswith(prefixo):
+        return None
+    caminho = Path(db_url[len(prefixo) :])
+    if not caminho.is_file():
+        return None
+    try:
+        with sqlite3.connect(f"file:{caminho}?mode=ro", uri=True) as conexao:
+            return (
+                conexao.execute("SELECT 1 FROM ativos LIMIT 1").fetchone() is not None
+            )
+    except sqlite3.Error:
+        return None
+
+
+# --- SUBCOMANDOS --------------------------------------------------------------
+
+
+def refresh_indices(args: argparse.Namespace) -> int:
+    """Baixa e processa os CSVs de composição da B3, se for o momento."""
+    from diversify.b3_services import B3Service
+
+    with cronometro("etapa", etapa="refresh_indices"):
+        B3Service().refresh_index(forcar=args.forcar)
+    return 0
+
+
+def sync_assets(args: argparse.Namespace) -> int:
+    """
+    Grava no banco os ativos (e o histórico de composição) dos JSONs em
+    `processed_data/`. Composições já sincronizadas com este banco, segundo o
+    manifesto, são puladas.
+    """
+    from diversify.database.tipos import tipo_do_indice
+    from diversify.manifest import Manifest, etapa_db, hash_arquivo, hash_dados
+
+    processed_data_dir = Path(args.processed_dir)
+    if not processed_data_dir.exists():
+        log_erro(
+            f"❌ ERRO: O diretório '{processed_data_dir}' não foi encontrado. "
+            "Execute o refresh-indices primeiro."
+        )
+        return 1
+
+    json_files = sorted(processed_data_dir.glob("*_composition.json"))
+    if not json_files:
+        log("Nenhum arquivo JSON de composição encontrado para processar.")
+        return 0
+
+    # O manifesto guarda o hash de cada composição já sincronizada com este
+    # banco. Um banco sem nenhum ativo (ex: recém-criado) ignora o manifesto
+    # e recebe tudo.
+    manifest = Manifest(processed_data_dir / "manifest.json")
+    etapa = etapa_db(args.db_url)
+    pendentes = []
+    for json_file in json_files:
+        # Ex: "IFIX_composition.json" -> "IFIX"
+        index_name = json_file.stem.replace("_composition", "")
+        tipo = tipo_do_indice(index_name)
+        hash_sync = hash_dados(hash_arquivo(json_file), tipo.name)
+        pendentes.append((json_file, index_name, tipo, hash_sync))
+
+    alterados = [p for p in pendentes if not manifest.inalterado(p[1], etapa, p[3])]
+    if not alterados and _banco_sqlite_tem_ativos(args.db_url):
+        log("Todas as composições já estão sincronizadas com o banco.")
+        return 0
+
+    db_manager = abrir_banco(args.db_url)
+
+    from diversify.database.models import Ativo
+    from diversify.database.services import AtivoService
+
+    ativo_service = AtivoService(session_manager=db_manager)
+    with db_manager.get_session() as session:
+        db_vazio = session.query(Ativo.id).first() is None
+    if not db_vazio:
+        pendentes = alterados
+
+    for json_file, index_name, tipo, hash_sync in pendentes:
+        log(f"\nLendo dados do arquivo: {json_file.name}")
+        with open(json_file, "r", encoding="utf-8") as f:
+            composition_data = json.load(f)
+
+        if not composition_data:
+            log_erro(
+                f"⚠️ Arquivo para '{index_name}' está vazio. Pulando inserção no DB."
+            )
+            continue
+
+        # Primeiro, popula a tabela de ativos
+        ativo_service.populate_assets(composition_data, db_manager, tipo)
+        # Depois, registra a composição vigente no histórico do índice
+        # Vigente desde a data da carteira da B3, não desde o dia da sincronização.
+        ativo_service.record_index_composition(
+            index_name,
+            composition_data,
+            db_manager,
+            data=manifest.data_carteira(index_name),
+        )
+        manifest.set(index_name, etapa, hash_sync)
+
+    manifest.save()
+    return 0
+
+
+def update_quotes(args: argparse.Namespace) -> int:
+    """Atualiza as cotações históricas de todos os ativos do banco."""
+    db_manager = abrir_banco(args.db_url)
+
+    from diversify.quote_cache import CacheCotacoes
+    from diversify.quotes_services import QuoteService
+
+    # Séries já baixadas hoje (ex: numa execução interrompida) vêm do cache.
+    stats = QuoteService().update_historical_prices(
+        db_manager,
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+        cache=None if args.sem_cache else CacheCotacoes(),
+    )
+    return 1 if stats.falhas else 0
+
+
+def fill_gaps(args: argparse.Namespace) -> int:
+    """Busca só as faixas de pregões que faltam no meio das séries salvas."""
+    db_manager = abrir_banco(args.db_url)
+
+    from diversify.quote_cache import CacheCotacoes
+    from diversify.quotes_services import QuoteService
+
+    stats = QuoteService().fill_gaps(
+        db_manager,
+        desde=args.desde,
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+        cache=None if args.sem_cache else CacheCotacoes(),
+    )
+    return 1 if stats.falhas else 0
+
+
+def executar_tudo(args: argparse.Namespace) -> int:
+    """
+    refresh-indices, sync-assets e update-quotes em um único pipeline, com as
+    etapas sobrepostas. Fora da janela de rebalanceamento (e sem `--forcar`),
+    as composições já processadas alimentam direto a sincronização.
+    """
+    db_manager = abrir_banco(args.db_url)
+
+    from diversify.pipeline import PipelineDiario
+    from diversify.quote_cache import CacheCotacoes
+
+    resultado = PipelineDiario(
+        db_manager,
+        db_url=args.db_url,
+        processed_data_dir=Path(args.processed_dir),
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+        cache=None if args.sem_cache else CacheCotacoes(),
+    ).executar(baixar_indices=True if args.forcar else None)
+    return 1 if any(etapa.falhas for etapa in resultado.etapas.values()) else 0
+
+
+# --- ARGUMENTOS ---------------------------------------------------------------
+
+
+def _criar_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="diversify",
+        description="Tarefas de atualização dos dados da B3 e das cotações.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Omite as mensagens de progresso (erros continuam na saída de erro).",
+    )
+    parser.add_argument("--db-url", default=DB_URL_PADRAO)
+    parser.add_argument("--processed-dir", default="processed_data")
+    parser.add_argument(
+        "--metrics-dir",
+        default=str(Path("data") / "metrics"),
+        help="Onde gravar o resumo de métricas da execução.",
+    )
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    def adicionar(nome: str, funcao, ajuda: str) -> argparse.ArgumentParser:
+        sub = subparsers.add_parser(nome, help=ajuda, description=ajuda)
+        sub.set_defaults(funcao=funcao)
+        return sub
+
+    def opcoes_indices(sub: argparse.ArgumentParser):
+        sub.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Atualiza mesmo fora da janela de rebalanceamento da B3.",
+        )
+
+    def opcoes_cotacoes(sub: argparse.ArgumentParser):
+        sub.add_argument("--workers", type=int, default=4)
+        sub.add_argument(
+            "--rps", type=float, default=2.0, help="Requisições por segundo."
+        )
+        sub.add_argument("--sem-cache", action="store_true")
+
+    opcoes_indices(
+        adicionar("refresh-indices", refresh_indices, "Baixa e processa os CSVs da B3.")
+    )
+    adicionar("sync-assets", sync_assets, "Sincroniza os ativos com o banco.")
+    opcoes_cotacoes(
+        adicionar("update-quotes", update_quotes, "Atualiza as cotações históricas.")
+    )
+    lacunas = adicionar(
+        "fill-gaps", fill_gaps, "Preenche os pregões que faltam no meio das séries."
+    )
+    opcoes_cotacoes(lacunas)
+    lacunas.add_argument(
+        "--desde",
+        type=date.fromisoformat,
+        default=None,
+        help="Preenche também de DESDE (AAAA-MM-DD) até o primeiro preço de cada ativo.",
+    )
+    tudo = adicionar(
+        "all", executar_tudo, "Executa as três etapas em um único pipeline."
+    )
+    opcoes_indices(tudo)
+    opcoes_cotacoes(tudo)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _criar_parser().parse_args(argv)
+    # Cada chamada (ex: as duas de `tasks/b3_insert_db.py`) tem o seu resumo.
+    metricas.reiniciar()
+    if args.quiet:
+        definir_silencioso(True)
+
+    try:
+        codigo = args.funcao(args)
+    except KeyboardInterrupt:
+        log_erro("\n⚠️ Interrompido.")
+        codigo = 130
+    gravar_resumo(args.metrics_dir, nome_execucao=args.comando.replace("-", "_"))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
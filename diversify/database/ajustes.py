@@ -0,0 +1,183 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/AJUSTES.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Ajuste de preços por proventos e desdobramentos, calculado na leitura.
+#
+# O banco guarda o fechamento BRUTO de cada pregão (`precos_historicos`) e,
+# à parte, uma tabela compacta de eventos (`eventos_corporativos`): um
+# dividendo/rendimento ou desdobramento por linha, com o fator que o evento
+# aplica aos preços anteriores à data ex:
+#
+#   - provento de D por cota, com fechamento anterior P:  fator = 1 - D / P
+#   - desdobramento de r novas ações por antiga:          fator = 1 / r
+#
+# O preço ajustado de um pregão t é o bruto vezes o produto dos fatores dos
+# eventos com data ex posterior a t. Com os eventos de um ativo em ordem, esse
+# produto é um produto acumulado "de trás para frente"; para uma série de
+# datas, basta um `searchsorted` no vetor de datas ex.
+#
+# Assim, quando um FII paga o rendimento do mês, nenhum preço salvo muda: entra
+# uma linha em `eventos_corporativos` e só o cache de fatores daquele ativo é
+# descartado.
+#
+# O Yahoo devolve o `Close` (com `auto_adjust=False`) e os proventos já
+# corrigidos por todos os desdobramentos conhecidos no momento da busca;
+# `desfazer_desdobramentos()` os converte de volta para valores brutos antes
+# da gravação.
+#
+# COMPONENTES:
+# - FatoresAjuste: Os fatores acumulados de um ativo e a aplicação a datas.
+# - fator_provento(): O fator de um dividendo/rendimento.
+# - desfazer_desdobramentos(): Preços e proventos do provedor -> brutos.
+# - CacheFatores / cache_fatores: Cache em memória dos fatores por ativo.
+#
+# ==============================================================================
+
+import datetime
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+from diversify.metrics import contar
+
+
+@dataclass(frozen=True)
+class FatoresAjuste:
+    """
+    Fatores de ajuste de um ativo.
+
+    - `datas_ex`: datas ex dos eventos (`datetime64[D]`), em ordem crescente.
+    - `acumulados`: `acumulados[i]` é o produto dos fatores dos eventos
+      `i, i+1, ...`; tem um elemento a mais (1.0), para datas sem eventos
+      posteriores.
+    """
+
+    datas_ex: np.ndarray
+    acumulados: np.ndarray
+
+    @classmethod
+    def de_eventos(cls, datas_ex, fatores) -> "FatoresAjuste":
+        """Monta os fatores a partir dos eventos (já em ordem de data ex)."""
+        fatores = np.asarray(fatores, dtype=np.float64)
+        acumulados = np.ones(len(fatores) + 1)
+        acumulados[:-1] = np.cumprod(fatores[::-1])[::-1]
+        return cls(np.asarray(datas_ex, dtype="datetime64[D]"), acumulados)
+
+    @property
+    def vazio(self) -> bool:
+        return not len(self.datas_ex)
+
+    def para(self, datas: np.ndarray) -> np.ndarray:
+        """Multiplicador de cada data: o produto dos fatores com data ex posterior."""
+        return self.acumulados[np.searchsorted(self.datas_ex, datas, side="right")]
+
+
+SEM_EVENTOS = FatoresAjuste.de_eventos([], [])
+
+
+def fator_provento(valor: float, fechamento_anterior: float | None) -> float:
+    """
+    Fator de um provento de `valor` por cota. Sem o fechamento anterior à
+    data ex (ou com um provento maior que ele, que indica dado inválido), o
+    evento não altera os preços.
+    """
+    if not fechamento_anterior or not 0 < valor < fechamento_anterior:
+        return 1.0
+    return 1.0 - valor / fechamento_anterior
+
+
+def desfazer_desdobramentos(
+    registros: Iterable[dict],
+    desdobramentos: dict[int, list[tuple[datetime.date, float]]],
+    campo_data: str,
+    campo_valor: str,
+) -> list[dict]:
+    """
+    Converte valores corrigidos por desdobramentos (como o `Close` e os
+    `Dividends` do Yahoo) para valores brutos: cada valor é multiplicado pelas
+    razões dos desdobramentos com data ex posterior à sua data.
+
+    `desdobramentos` é {ativo_id: [(data_ex, razao), ...]} em ordem de data.
+    Registros de ativos sem desdobramentos são devolvidos sem cópia.
+    """
+    acumulados = {}
+    for ativo_id, eventos in desdobramentos.items():
+        datas = [data for data, _ in eventos]
+        razoes = np.cumprod([razao for _, razao in eventos][::-1])[::-1]
+        acumulados[ativo_id] = (datas, [*razoes.tolist(), 1.0])
+
+    brutos = []
+    for registro in registros:
+        acumulado = acumulados.get(registro["ativo_id"])
+        if acumulado is not None:
+            datas, razoes = acumulado
+            multiplicador = razoes[bisect_right(datas, registro[campo_data])]
+            if multiplicador != 1.0:
+                registro = {
+                    **registro,
+                    campo_valor: registro[campo_valor] * multiplicador,
+                }
+        brutos.append(registro)
+    return brutos
+
+
+class CacheFatores:
+    """
+    Cache em memória (seguro para várias threads) dos fatores de ajuste por
+    ativo, separado por banco (ver `cache.chave_banco`). Ativos sem eventos
+    também ficam em cache. Uma entrada só é descartada quando um evento do
+    ativo é gravado ou revisado (`invalidar`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fatores: dict[tuple[str, int], FatoresAjuste] = {}
+        self.acertos = 0
+        self.faltas = 0
+
+    def buscar(
+        self, banco: str, ativo_ids: Iterable[int]
+    ) -> tuple[dict[int, FatoresAjuste], list[int]]:
+        """Retorna os fatores em cache e a lista de ativos que faltam."""
+        encontrados, faltantes = {}, []
+        with self._lock:
+            for ativo_id in ativo_ids:
+                fatores = self._fatores.get((banco, ativo_id))
+                if fatores is None:
+                    faltantes.append(ativo_id)
+                else:
+                    encontrados[ativo_id] = fatores
+            self.acertos += len(encontrados)
+            self.faltas += len(faltantes)
+        contar("cache_fatores", len(encontrados), resultado="acerto")
+        contar("cache_fatores", len(faltantes), resultado="falta")
+        return encontrados, faltantes
+
+    def guardar(self, banco: str, fatores: dict[int, FatoresAjuste]):
+        with self._lock:
+            for ativo_id, fatores_ativo in fatores.items():
+                self._fatores[(banco, ativo_id)] = fatores_ativo
+
+    def invalidar(self, banco: str, ativo_ids: Iterable[int]):
+        """Descarta os fatores dos ativos que receberam eventos novos."""
+        with self._lock:
+            for ativo_id in ativo_ids:
+                self._fatores.pop((banco, ativo_id), None)
+
+    def limpar(self, banco: str | None = None):
+        """Descarta tudo, ou só os fatores de `banco`."""
+        with self._lock:
+            if banco is None:
+                self._fatores.clear()
+            else:
+                for chave in [c for c in self._fatores if c[0] == banco]:
+                    del self._fatores[chave]
+
+
+# Cache global do processo, usado por `EventoCorporativoRepository`.
+cache_fatores = CacheFatores()
@@ -0,0 +1,244 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/CACHE.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Cache em memória dos dados que os repositórios leem o tempo todo e que mudam
+# pouco dentro de uma execução:
+#
+#   - o índice ticker <-> ativo_id de todos os ativos (algumas centenas de
+#     linhas), usado por serviços, pelo pipeline e pelas avaliações;
+#   - o último fechamento salvo de cada ativo, usado para marcar carteiras a
+#     mercado.
+#
+# O cache é do processo e separado por banco (a URL do Engine). As gravações
+# feitas pelos repositórios o mantêm coerente: inserir ativos descarta o
+# índice (que é imutável e é recriado na próxima leitura, com uma query), e
+# gravar preços descarta só o último fechamento dos ativos afetados. Gravações
+# feitas por outros processos não são vistas até `limpar()`.
+#
+# As gravações só valem depois do commit. Por isso `registrar_gravacao()`
+# descarta as entradas afetadas na hora e as anota na sessão: até o commit,
+# as leituras da própria sessão vão ao banco para essas entradas e não as
+# guardam (o valor ainda não confirmado não entra no cache). No commit
+# (`after_commit`) as entradas são descartadas de novo, pois outra sessão
+# pode ter guardado o valor antigo nesse meio-tempo; num rollback
+# (`after_rollback`), o cache do banco é descartado inteiro.
+#
+# COMPONENTES:
+# - IndiceTickers: O índice imutável ticker <-> ativo_id.
+# - CacheRepositorios / cache_repositorios: O cache, com as contagens de
+#   acertos e faltas.
+# - chave_banco(): Identifica o banco de uma sessão nas chaves dos caches.
+# - GravacoesPendentes / registrar_gravacao() / gravacoes_pendentes(): As
+#   entradas afetadas por gravações ainda não confirmadas de uma sessão.
+#
+# ==============================================================================
+
+import datetime
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from diversify.metrics import contar
+
+from .ajustes import cache_fatores
+
+# Último fechamento de um ativo: (data do pregão, preço), ou None se o ativo
+# não tem nenhum preço salvo.
+UltimoPreco = tuple[datetime.date, float] | None
+
+
+def chave_banco(session: Session) -> str:
+    """
+    Identifica o banco da sessão nas chaves dos caches: a URL do Engine ou,
+    para bancos SQLite em memória (um banco por Engine), a URL e o Engine.
+    """
+    engine = session.get_bind()
+    if engine.url.database in (None, "", ":memory:"):
+        return f"{engine.url}#{id(engine)}"
+    return str(engine.url)
+
+
+@dataclass(frozen=True)
+class IndiceTickers:
+    """Índice imutável ticker <-> ativo_id de todos os ativos do banco."""
+
+    por_ticker: Mapping[str, int]
+    por_id: Mapping[int, str]
+
+    @classmethod
+    def de_pares(cls, pares: Iterable[tuple[int, str]]) -> "IndiceTickers":
+        por_id = dict(pares)
+        por_ticker = {ticker: ativo_id for ativo_id, ticker in por_id.items()}
+        return cls(MappingProxyType(por_ticker), MappingProxyType(por_id))
+
+    def __len__(self) -> int:
+        return len(self.por_id)
+
+
+class CacheRepositorios:
+    """
+    Cache (seguro para várias threads) do índice de tickers e dos últimos
+    fechamentos, com as contagens de acertos e faltas de cada um.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indices: dict[str, IndiceTickers] = {}
+        self._ultimos: dict[str, dict[int, UltimoPreco]] = {}
+        self.acertos = {"indice": 0, "ultimo_preco": 0}
+        self.faltas = {"indice": 0, "ultimo_preco": 0}
+
+    def _contar(self, tipo: str, acertos: int, faltas: int):
+        self.acertos[tipo] += acertos
+        self.faltas[tipo] += faltas
+        contar("cache_repositorio", acertos, tipo=tipo, resultado="acerto")
+        contar("cache_repositorio", faltas, tipo=tipo, resultado="falta")
+
+    # --- Índice de tickers ---
+
+    def indice(self, banco: str) -> IndiceTickers | None:
+        with self._lock:
+            indice = self._indices.get(banco)
+            self._contar("indice", int(indice is not None), int(indice is None))
+        return indice
+
+    def guardar_indice(self, banco: str, indice: IndiceTickers):
+        with self._lock:
+            self._indices[banco] = indice
+
+    def invalidar_indice(self, banco: str):
+        """Descarta o índice (ex: depois de inserir ativos)."""
+        with self._lock:
+            self._indices.pop(banco, None)
+
+    # --- Últimos fechamentos ---
+
+    def ultimos(
+        self, banco: str, ativo_ids: Iterable[int]
+    ) -> tuple[dict[int, UltimoPreco], list[int]]:
+        """Retorna os últimos fechamentos em cache e os ativos que faltam."""
+        encontrados, faltantes = {}, []
+        with self._lock:
+            cache = self._ultimos.get(banco, {})
+            for ativo_id in ativo_ids:
+                if ativo_id in cache:
+                    encontrados[ativo_id] = cache[ativo_id]
+                else:
+                    faltantes.append(ativo_id)
+            self._contar("ultimo_preco", len(encontrados), len(faltantes))
+        return encontrados, faltantes
+
+    def tem_ultimos(self, banco: str) -> bool:
+        """Se o retrato dos últimos fechamentos do banco já foi carregado."""
+        with self._lock:
+            return banco in self._ultimos
+
+    def guardar_ultimos(self, banco: str, ultimos: dict[int, UltimoPreco]):
+        with self._lock:
+            self._ultimos.setdefault(banco, {}).update(ultimos)
+
+    def invalidar_ultimos(self, banco: str, ativo_ids: Iterable[int]):
+        """Descarta o último fechamento dos ativos que receberam preços."""
+        with self._lock:
+            cache = self._ultimos.get(banco)
+            if cache:
+                for ativo_id in ativo_ids:
+                    cache.pop(ativo_id, None)
+
+    # --- Geral ---
+
+    def estatisticas(self) -> dict[str, dict[str, int]]:
+        """{tipo: {"acertos": n, "faltas": n}} desde o início do processo."""
+        with self._lock:
+            return {
+                tipo: {"acertos": self.acertos[tipo], "faltas": self.faltas[tipo]}
+                for tipo in self.acertos
+            }
+
+    def limpar(self, banco: str | None = None):
+        """
+        Descarta tudo, ou só o que é de `banco` (ex: depois de gravações
+        feitas por outro processo).
+        """
+        with self._lock:
+            if banco is None:
+                self._indices.clear()
+                self._ultimos.clear()
+            else:
+                self._indices.pop(banco, None)
+                self._ultimos.pop(banco, None)
+
+
+# Cache global do processo, usado pelos repositórios.
+cache_repositorios = CacheRepositorios()
+
+
+# --- Gravações ainda não confirmadas ---
+
+_CHAVE_SESSAO = "diversify.gravacoes_pendentes"
+
+
+@dataclass
+class GravacoesPendentes:
+    """Entradas dos caches afetadas pelas gravações de uma sessão."""
+
+    banco: str
+    indice: bool = False
+    ultimos: set[int] = field(default_factory=set)
+    fatores: set[int] = field(default_factory=set)
+
+    def descartar(self):
+        """Descarta as entradas afetadas nos caches do processo."""
+        if self.indice:
+            cache_repositorios.invalidar_indice(self.banco)
+        cache_repositorios.invalidar_ultimos(self.banco, self.ultimos)
+        cache_fatores.invalidar(self.banco, self.fatores)
+
+
+def gravacoes_pendentes(session: Session) -> GravacoesPendentes | None:
+    """As gravações da sessão ainda não confirmadas (None se não houver)."""
+    return session.info.get(_CHAVE_SESSAO)
+
+
+def registrar_gravacao(
+    session: Session,
+    indice: bool = False,
+    ultimos: Iterable[int] = (),
+    fatores: Iterable[int] = (),
+):
+    """
+    Chamada pelos repositórios a cada gravação que afeta os caches: o índice
+    de tickers, o último fechamento dos ativos `ultimos` e os fatores de
+    ajuste dos ativos `fatores`.
+    """
+    pendentes = session.info.get(_CHAVE_SESSAO)
+    if pendentes is None:
+        pendentes = session.info[_CHAVE_SESSAO] = GravacoesPendentes(
+            chave_banco(session)
+        )
+    agora = GravacoesPendentes(pendentes.banco, indice, set(ultimos), set(fatores))
+    pendentes.indice |= agora.indice
+    pendentes.ultimos |= agora.ultimos
+    pendentes.fatores |= agora.fatores
+    agora.descartar()
+
+
+@event.listens_for(Session, "after_commit")
+def _ao_confirmar(session: Session):
+    pendentes = session.info.pop(_CHAVE_SESSAO, None)
+    if pendentes is not None:
+        pendentes.descartar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _ao_desfazer(session: Session):
+    pendentes = session.info.pop(_CHAVE_SESSAO, None)
+    if pendentes is not None:
+        cache_repositorios.limpar(pendentes.banco)
+        cache_fatores.limpar(pendentes.banco)
@@ -0,0 +1,86 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/MATRIZ_PRECOS.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Estrutura de dados usada pelas análises que trabalham com muitos ativos ao
+# mesmo tempo: uma matriz densa "data × ativo" de preços de fechamento,
+# alinhada em um eixo único de pregões.
+#
+# A matriz é montada por `PrecoHistoricoRepository.load_price_matrix`, que lê
+# as linhas do banco diretamente para arrays NumPy pré-alocados, sem criar um
+# objeto ORM por preço.
+#
+# COMPONENTES:
+# - MatrizPrecos: A matriz de preços, o eixo de datas, os tickers e a máscara
+#   de dados faltantes.
+# - tickers_do_indice(): Resolve o nome de um índice (ex: "IDIV") para a lista
+#   de tickers da sua composição mais recente.
+#
+# ==============================================================================
+
+import json
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class MatrizPrecos:
+    """
+    Preços de fechamento em formato "data × ativo".
+
+    - `datas`: eixo de pregões (`datetime64[D]`), em ordem crescente.
+    - `tickers`: um ticker por coluna.
+    - `valores`: matriz `float64` de formato `(len(datas), len(tickers))`,
+      com NaN onde o ativo não tem preço.
+    - `faltantes`: máscara booleana dos preços ausentes no banco. Ela continua
+      marcando os dados originais mesmo depois de um `preencher_adiante()`.
+    """
+
+    datas: np.ndarray
+    tickers: list[str]
+    valores: np.ndarray
+    faltantes: np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.valores.shape
+
+    def preencher_adiante(self) -> "MatrizPrecos":
+        """
+        Repete o último preço conhecido de cada ativo nos pregões sem preço
+        (forward-fill vetorizado). Lacunas antes do primeiro preço continuam NaN.
+        """
+        linhas = np.arange(self.valores.shape[0])[:, None]
+        origem = np.where(self.faltantes, 0, linhas)
+        np.maximum.accumulate(origem, axis=0, out=origem)
+        colunas = np.arange(self.valores.shape[1])[None, :]
+        valores = self.valores[origem, colunas]
+        # Onde nem a primeira linha tinha preço, o índice 0 aponta para um NaN.
+        return replace(self, valores=valores)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Converte a matriz em um DataFrame (índice = datas, colunas = tickers)."""
+        return pd.DataFrame(
+            self.valores,
+            index=pd.DatetimeIndex(self.datas, name="data_pregao"),
+            columns=pd.Index(self.tickers, name="ticker"),
+        )
+
+
+def tickers_do_indice(
+    index_name: str, processed_data_dir: Path = Path("processed_data")
+) -> list[str]:
+    """
+    Lê a composição mais recente de um índice (ex: "IFIX") salva em
+    `processed_data/<INDICE>_composition.json` e retorna seus tickers.
+    """
+    file_path = processed_data_dir / f"{index_name.upper()}_composition.json"
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return [ativo["ticker"] for ativo in json.load(f)]
+    except FileNotFoundError:
+        raise ValueError(f"Composição do índice '{index_name}' não encontrada.")
@@ -0,0 +1,132 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/MIGRATIONS.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Migrações manuais de esquema para bancos criados por versões anteriores do
+# projeto. O `create_all_tables()` só cria tabelas que ainda não existem, então
+# mudanças no layout de tabelas já existentes precisam ser aplicadas aqui.
+#
+# Cada migração é idempotente: ela verifica o estado atual do banco e não faz
+# nada se ele já estiver no formato esperado.
+#
+# COMPONENTES:
+# - migrar_layout_precos(): Converte `precos_historicos` para o layout
+#   agrupado por ativo (chave `(ativo_id, data_pregao)`, `WITHOUT ROWID`).
+# - migrar_precos_brutos(): Cria a coluna `ativos.precos_brutos`, marcando os
+#   ativos de bancos antigos (preços ajustados) para uma nova carga bruta.
+# - migrar_banco(): Aplica todas as migrações, em ordem.
+#
+# ==============================================================================
+
+from db_nexus.session import DatabaseSessionManager
+from sqlalchemy import Index, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from diversify.metrics import log
+
+from .models import Ativo, PrecoHistorico
+
+
+def _layout_precos_atual(conn) -> bool:
+    """Verifica se `precos_historicos` já está no layout agrupado por ativo."""
+    pk = inspect(conn).get_pk_constraint(PrecoHistorico.__tablename__)
+    if pk["constrained_columns"][:1] != ["ativo_id"]:
+        return False
+    if conn.dialect.name != "sqlite":
+        return True
+    ddl = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:nome"),
+        {"nome": PrecoHistorico.__tablename__},
+    ).scalar()
+    return "WITHOUT ROWID" in ddl.upper()
+
+
+def migrar_layout_precos(db_manager: DatabaseSessionManager) -> bool:
+    """
+    Converte a tabela `precos_historicos` de bancos antigos (chave primária
+    `(data_pregao, ativo_id)`) para o layout agrupado por ativo.
+
+    - SQLite: recria a tabela como `WITHOUT ROWID` com chave
+      `(ativo_id, data_pregao)` e copia os dados já ordenados pela nova chave.
+    - Outros bancos: cria um índice de cobertura
+      `(ativo_id, data_pregao, preco_fechamento)`, que atende às mesmas buscas.
+
+    Retorna True se alguma alteração foi feita.
+    """
+    tabela = PrecoHistorico.__table__
+    with db_manager.get_session() as session:
+        conn = session.connection()
+        if not inspect(conn).has_table(tabela.name) or _layout_precos_atual(conn):
+            return False
+
+        if conn.dialect.name != "sqlite":
+            log("Criando índice de cobertura por ativo em 'precos_historicos'...")
+            Index(
+                "ix_precos_historicos_ativo_data_preco",
+                tabela.c.ativo_id,
+                tabela.c.data_pregao,
+                tabela.c.preco_fechamento,
+            ).create(conn, checkfirst=True)
+            return True
+
+        log("Migrando 'precos_historicos' para o layout agrupado por ativo...")
+        antiga = f"{tabela.name}_antiga"
+        colunas_antigas = {c["name"] for c in inspect(conn).get_columns(tabela.name)}
+        colunas = ", ".join(c.name for c in tabela.columns if c.name in colunas_antigas)
+
+        # Os nomes de índices são globais no SQLite: removemos os da tabela
+        # antiga antes de criar a nova com os mesmos nomes.
+        for indice in inspect(conn).get_indexes(tabela.name):
+            conn.execute(text(f'DROP INDEX IF EXISTS "{indice["name"]}"'))
+        conn.execute(text(f'ALTER TABLE "{tabela.name}" RENAME TO "{antiga}"'))
+        tabela.create(conn)
+        conn.execute(
+            text(
+                f'INSERT INTO "{tabela.name}" ({colunas}) '
+                f'SELECT {colunas} FROM "{antiga}" ORDER BY ativo_id, data_pregao'
+            )
+        )
+        conn.execute(text(f'DROP TABLE "{antiga}"'))
+
+    log("✅ Migração de 'precos_historicos' concluída.")
+    return True
+
+
+def migrar_precos_brutos(db_manager: DatabaseSessionManager) -> bool:
+    """
+    Adiciona a coluna `precos_brutos` à tabela `ativos` de bancos antigos.
+
+    Esses bancos guardam o fechamento já ajustado pelo provedor
+    (`auto_adjust=True`), que não combina com os fechamentos brutos gravados
+    agora. Os ativos existentes ficam com `precos_brutos = False`, e a
+    próxima atualização de cotações baixa a série bruta de cada um deles
+    desde o primeiro preço salvo, uma única vez, regravando os preços antigos.
+
+    Retorna True se a coluna foi criada.
+    """
+    tabela = Ativo.__table__
+    with db_manager.get_session() as session:
+        conn = session.connection()
+        inspetor = inspect(conn)
+        if not inspetor.has_table(tabela.name):
+            return False
+        colunas = {c["name"] for c in inspetor.get_columns(tabela.name)}
+        if "precos_brutos" in colunas:
+            return False
+
+        log("Adicionando a coluna 'precos_brutos' em 'ativos'...")
+        coluna = CreateColumn(tabela.c.precos_brutos).compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE "{tabela.name}" ADD COLUMN {coluna}'))
+
+    log(
+        "✅ Coluna criada. Os preços já salvos (ajustados) serão substituídos "
+        "pelos fechamentos brutos na próxima atualização de cotações."
+    )
+    return True
+
+
+def migrar_banco(db_manager: DatabaseSessionManager) -> bool:
+    """Aplica todas as migrações. Retorna True se alguma alteração foi feita."""
+    alterado = migrar_layout_precos(db_manager)
+    return migrar_precos_brutos(db_manager) or alterado
@@ -1,5 +1,4 @@
 import datetime
-import enum
 from typing import List, Optional
 
 # Importa a Base do seu projeto db_nexus. É o catálogo central!
@@ -7,34 +6,29 @@ from db_nexus.base import Base
 
 # Importe o Enum do SQLAlchemy também
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
     Date,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     PrimaryKeyConstraint,
     String,
+    false,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-
-# ==============================================================================
-# ENUMS
-# ==============================================================================
-# Colocamos o Enum aqui para ser usado pelo modelo da tabela.
-# Usar Enums em vez de strings evita erros de digitação e torna o código mais claro.
-class TipoAtivo(enum.Enum):
-    ACAO = "Ação"
-    FII = "Fundo Imobiliário"
-    FIAGRO = "FiAgro"
-    FIINFRA = "FI-Infra"
-    RENDA_FIXA = "Renda Fixa"
-    ETF_BR = "ETF Brasil"
-    ETF_EXTERIOR = "ETF Exterior"
-    BDR = "BDR"
-    CRIPTOMOEDA = "Criptomoeda"
-    INDICE = "Índice"
-
+# O enum e o mapa de tipos por índice vivem em `tipos.py`, que não depende do
+# SQLAlchemy; continuam disponíveis por aqui.
+from .tipos import (  # noqa: F401
+    TIPO_POR_INDICE,
+    TipoAtivo,
+    TipoEvento,
+    TipoTransacao,
+    tipo_do_indice,
+)
 
 # ==============================================================================
 # MODELOS DAS TABELAS (TABLE MODELS)
@@ -58,6 +52,13 @@ class Ativo(Base):
     nome: Mapped[str] = mapped_column(String(100))
     # Usamos o Enum que criamos para garantir que o tipo seja sempre um dos valores válidos.
     tipo: Mapped[TipoAtivo] = mapped_column(Enum(TipoAtivo))
+    # Se os preços salvos do ativo são fechamentos brutos (com os eventos em
+    # `eventos_corporativos`). Ativos de bancos antigos, com preços já
+    # ajustados pelo provedor, ficam com False até a próxima atualização
+    # baixar a série bruta de novo.
+    precos_brutos: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false()
+    )
 
     def __repr__(self) -> str:
         return f"Ativo(ticker='{self.ticker}', nome='{self.nome}', tipo='{self.tipo.value}')"
@@ -77,6 +78,8 @@ class PrecoHistorico(Base):
     ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"))
 
     data_pregao: Mapped[datetime.date] = mapped_column(Date, index=True)
+    # Fechamento bruto do pregão. O preço ajustado por proventos e
+    # desdobramentos é calculado na leitura (ver `ajustes.py`).
     preco_fechamento: Mapped[float] = mapped_column(Float)
 
     # Adicionamos um relacionamento para facilitar a navegação no código.
@@ -85,9 +88,171 @@ class PrecoHistorico(Base):
 
     # --- Definição das Regras da Tabela --
     # é o lugar correto para chaves primárias compostas.
+    # A chave começa por `ativo_id` porque o acesso típico é "todas as datas de
+    # um ativo" (intervalos, último pregão). No SQLite, `WITHOUT ROWID` faz a
+    # própria chave primária ser o armazenamento físico da tabela, deixando as
+    # linhas de cada ativo contíguas e ordenadas por data.
+    # Bancos antigos, com a chave (data_pregao, ativo_id), são convertidos por
+    # `migrations.migrar_layout_precos`.
     __table_args__ = (
-        PrimaryKeyConstraint("data_pregao", "ativo_id", name="pk_preco_historico"),
+        PrimaryKeyConstraint("ativo_id", "data_pregao", name="pk_preco_historico"),
+        {"sqlite_with_rowid": False},
     )
 
     def __repr__(self) -> str:
         return f"PrecoHistorico(ativo_id='{self.ativo_id}', data='{self.data_pregao}', preco='{self.preco_fechamento}')"
+
+
+# --- TABELA COM OS EVENTOS CORPORATIVOS ---
+class EventoCorporativo(Base):
+    """
+    Um provento ou desdobramento de um ativo, na sua data ex.
+
+    `valor` é o provento bruto por cota ou a razão do desdobramento (novas
+    por antigas). `fator` é o multiplicador que o evento aplica a todos os
+    preços anteriores à data ex, calculado na gravação.
+    """
+
+    __tablename__ = "eventos_corporativos"
+
+    ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"))
+    data_ex: Mapped[datetime.date] = mapped_column(Date)
+    tipo: Mapped[TipoEvento] = mapped_column(Enum(TipoEvento))
+    valor: Mapped[float] = mapped_column(Float)
+    fator: Mapped[float] = mapped_column(Float)
+
+    ativo: Mapped["Ativo"] = relationship()
+
+    # Mesmo layout dos preços: os eventos de cada ativo ficam contíguos e em
+    # ordem de data.
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            "ativo_id", "data_ex", "tipo", name="pk_evento_corporativo"
+        ),
+        {"sqlite_with_rowid": False},
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"EventoCorporativo(ativo_id='{self.ativo_id}', data_ex='{self.data_ex}', "
+            f"tipo='{self.tipo.value}', valor='{self.valor}')"
+        )
+
+
+# --- TABELA COM O HISTÓRICO DE COMPOSIÇÃO DOS ÍNDICES ---
+class MembroIndice(Base):
+    """
+    Um período de participação de um ativo em um índice (ex: IDIV, IFIX).
+
+    Cada linha vale de `valid_from` (inclusive) até `valid_to` (exclusive);
+    `valid_to` nulo indica que a participação ainda está vigente. Entradas,
+    saídas e mudanças de quantidade teórica fecham a linha atual e/ou abrem
+    uma nova, então a tabela guarda apenas as diferenças entre carteiras.
+    """
+
+    __tablename__ = "index_membership"
+
+    indice: Mapped[str] = mapped_column(String(20))
+    ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"))
+    valid_from: Mapped[datetime.date] = mapped_column(Date)
+    valid_to: Mapped[Optional[datetime.date]] = mapped_column(Date, nullable=True)
+    # Quantidade teórica e participação (%) na data em que a linha foi aberta.
+    qtde_teorica: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    peso: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    ativo: Mapped["Ativo"] = relationship()
+
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            "indice", "ativo_id", "valid_from", name="pk_index_membership"
+        ),
+        # Atende às consultas "composição do índice X na data D".
+        Index("ix_index_membership_as_of", "indice", "valid_from", "valid_to"),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"MembroIndice(indice='{self.indice}', ativo_id='{self.ativo_id}', "
+            f"valid_from='{self.valid_from}', valid_to='{self.valid_to}')"
+        )
+
+
+# --- TABELA COM AS CARTEIRAS ---
+class Carteira(Base):
+    """Uma carteira de investimentos (de um cliente ou de uma estratégia)."""
+
+    __tablename__ = "carteiras"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    nome: Mapped[str] = mapped_column(String(100), unique=True, index=True)
+
+    def __repr__(self) -> str:
+        return f"Carteira(id='{self.id}', nome='{self.nome}')"
+
+
+# --- TABELA COM AS TRANSAÇÕES DAS CARTEIRAS ---
+class Transacao(Base):
+    """
+    Uma compra ou venda de um ativo em uma carteira. É o registro de origem:
+    as posições (`Posicao`) são derivadas das transações e podem ser
+    reconstruídas a partir delas a qualquer momento.
+    """
+
+    __tablename__ = "transacoes"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    carteira_id: Mapped[int] = mapped_column(ForeignKey("carteiras.id"))
+    ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"))
+    data: Mapped[datetime.date] = mapped_column(Date)
+    tipo: Mapped[TipoTransacao] = mapped_column(Enum(TipoTransacao))
+    quantidade: Mapped[float] = mapped_column(Float)
+    preco_unitario: Mapped[float] = mapped_column(Float)
+    # Corretagem e emolumentos: entram no custo das compras.
+    taxas: Mapped[float] = mapped_column(Float, default=0.0)
+
+    ativo: Mapped["Ativo"] = relationship()
+
+    # A reconstrução das posições lê as transações de cada (carteira, ativo)
+    # em ordem cronológica.
+    __table_args__ = (
+        Index("ix_transacoes_carteira_ativo_data", "carteira_id", "ativo_id", "data"),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"Transacao(carteira_id='{self.carteira_id}', ativo_id='{self.ativo_id}', "
+            f"data='{self.data}', tipo='{self.tipo.value}', "
+            f"quantidade='{self.quantidade}', preco='{self.preco_unitario}')"
+        )
+
+
+# --- TABELA COM AS POSIÇÕES CONSOLIDADAS ---
+class Posicao(Base):
+    """
+    Posição materializada de uma carteira em um ativo: quantidade e custo
+    médio. É atualizada a cada nova transação, sem reler o histórico.
+
+    `data_ultima_transacao` guarda a data da última transação aplicada;
+    uma transação com data anterior a ela obriga a refazer a posição do par
+    (carteira, ativo) a partir do histórico.
+    """
+
+    __tablename__ = "posicoes"
+
+    carteira_id: Mapped[int] = mapped_column(ForeignKey("carteiras.id"))
+    ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"))
+    quantidade: Mapped[float] = mapped_column(Float)
+    custo_medio: Mapped[float] = mapped_column(Float)
+    data_ultima_transacao: Mapped[datetime.date] = mapped_column(Date)
+
+    ativo: Mapped["Ativo"] = relationship()
+
+    __table_args__ = (
+        PrimaryKeyConstraint("carteira_id", "ativo_id", name="pk_posicao"),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"Posicao(carteira_id='{self.carteira_id}', ativo_id='{self.ativo_id}', "
+            f"quantidade='{self.quantidade}', custo_medio='{self.custo_medio}')"
+        )
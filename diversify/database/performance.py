@@ -0,0 +1,209 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/PERFORMANCE.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Perfil de desempenho opcional para o banco SQLite usado pelas tarefas.
+#
+# Por padrão o SQLite usa o journal de rollback com `synchronous=FULL`: cada
+# commit faz vários fsyncs e, enquanto o escritor grava, nenhum leitor (um
+# notebook, um relatório) consegue abrir o banco. O perfil liga:
+#
+#   - journal_mode=WAL: leitores e o escritor não se bloqueiam mais;
+#   - synchronous=NORMAL: em WAL, só o checkpoint faz fsync (um commit pode
+#     ser perdido em uma queda de energia, mas o banco nunca corrompe);
+#   - cache_size / mmap_size maiores e temp_store=MEMORY;
+#   - busy_timeout, para um leitor esperar em vez de falhar com "locked".
+#
+# Além disso, `GrupoDeCommits` agrupa o trabalho de vários ativos em uma
+# única transação, isolando cada ativo em um SAVEPOINT: se um ativo falhar,
+# só o trabalho dele é desfeito. No SQLite, os SAVEPOINTs dependem dos hooks
+# de transação do perfil: no modo padrão do driver `sqlite3`, cada
+# SAVEPOINT/RELEASE é confirmado sozinho. Sem o perfil, o grupo volta a um
+# commit por item.
+#
+# O perfil é opcional: quem quiser usá-lo chama `aplicar_perfil_sqlite()`
+# logo após criar o `DatabaseSessionManager`.
+#
+# COMPONENTES:
+# - PerfilSQLite: Os valores dos PRAGMAs.
+# - registrar_perfil_sqlite(): Instala os hooks de conexão em um Engine.
+# - aplicar_perfil_sqlite(): O mesmo, a partir de um DatabaseSessionManager.
+# - savepoints_confiaveis(): Se um Engine isola SAVEPOINTs corretamente.
+# - GrupoDeCommits: Commits agrupados com um SAVEPOINT por item.
+#
+# ==============================================================================
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from db_nexus.session import DatabaseSessionManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from diversify.metrics import log, log_erro
+
+
+@dataclass(frozen=True)
+class PerfilSQLite:
+    """PRAGMAs aplicados a cada nova conexão."""
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size_kib: int = 64 * 1024  # 64 MiB de cache de páginas
+    mmap_size: int = 256 * 1024 * 1024
+    temp_store: str = "MEMORY"
+    busy_timeout_ms: int = 5000
+
+    def pragmas(self) -> list[str]:
+        return [
+            f"PRAGMA journal_mode={self.journal_mode}",
+            f"PRAGMA synchronous={self.synchronous}",
+            # Valor negativo = tamanho em KiB, independente do tamanho da página.
+            f"PRAGMA cache_size=-{self.cache_size_kib}",
+            f"PRAGMA mmap_size={self.mmap_size}",
+            f"PRAGMA temp_store={self.temp_store}",
+            f"PRAGMA busy_timeout={self.busy_timeout_ms}",
+        ]
+
+
+def registrar_perfil_sqlite(engine: Engine, perfil: PerfilSQLite | None = None) -> bool:
+    """
+    Instala o perfil em um Engine SQLite. Retorna False (sem fazer nada) para
+    outros bancos, para bancos em memória ou se o perfil já estiver instalado.
+    """
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return False
+    if getattr(engine, "_perfil_sqlite", None) is not None:
+        return False
+    perfil = perfil or PerfilSQLite()
+
+    def ao_conectar(dbapi_connection, connection_record):
+        # O driver sqlite3 abre transações por conta própria e ignora
+        # SAVEPOINTs emitidos antes do primeiro INSERT; desligamos esse
+        # comportamento e deixamos o SQLAlchemy emitir o BEGIN (ver `ao_iniciar`).
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in perfil.pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+    def ao_iniciar(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    event.listen(engine, "connect", ao_conectar)
+    event.listen(engine, "begin", ao_iniciar)
+    engine._perfil_sqlite = perfil
+    # Conexões já abertas no pool não passaram pelo hook: descarta todas.
+    engine.dispose()
+    return True
+
+
+def aplicar_perfil_sqlite(
+    db_manager: DatabaseSessionManager, perfil: PerfilSQLite | None = None
+) -> bool:
+    """Instala o perfil no Engine usado pelo `db_manager`."""
+    with db_manager.get_session() as session:
+        engine = session.get_bind()
+    aplicado = registrar_perfil_sqlite(engine, perfil)
+    if aplicado:
+        log(f"⚡ Perfil de desempenho do SQLite ativado em '{engine.url.database}'.")
+    return aplicado
+
+
+def savepoints_confiaveis(engine: Engine) -> bool:
+    """
+    Se o Engine isola SAVEPOINTs dentro de uma transação. No SQLite, só com
+    os hooks de transação instalados por `registrar_perfil_sqlite()`: sem
+    eles, o driver `sqlite3` abre e confirma transações por conta própria.
+    """
+    if engine.dialect.name != "sqlite":
+        return True
+    return getattr(engine, "_perfil_sqlite", None) is not None
+
+
+class GrupoDeCommits:
+    """
+    Agrupa o trabalho de vários itens (ex: ativos) em poucas transações.
+
+    Cada item roda em um SAVEPOINT; a cada `itens_por_commit` itens a
+    transação é confirmada. Um item que falha tem apenas o seu SAVEPOINT
+    desfeito, e os demais itens do grupo seguem normalmente:
+
+        with db_manager.get_session() as session:
+            grupo = GrupoDeCommits(session, itens_por_commit=50)
+            for ativo in ativos:
+                with grupo.item(ativo.ticker):
+                    ...
+            grupo.commit()
+
+    Em um SQLite sem o perfil (ver `savepoints_confiaveis`), cada item é
+    confirmado ao terminar e uma falha desfaz só a transação do item.
+    """
+
+    def __init__(self, session: Session, itens_por_commit: int = 50):
+        self.session = session
+        self.itens_por_commit = itens_por_commit
+        self.commits = 0
+        self.falhas: list[tuple[str, Exception]] = []
+        self._pendentes = 0
+        self.agrupado = savepoints_confiaveis(session.get_bind())
+        if not self.agrupado:
+            log(
+                "⚠️ SQLite sem o perfil de desempenho (`aplicar_perfil_sqlite`): "
+                "commits não agrupados, um por item."
+            )
+
+    @contextmanager
+    def item(self, nome: str = "", suprimir_erros: bool = True):
+        """
+        Executa um item dentro de um SAVEPOINT. Com `suprimir_erros`, uma falha
+        é registrada em `falhas` e não interrompe o grupo; sem ele, o SAVEPOINT
+        é desfeito e a exceção é propagada.
+        """
+        if not self.agrupado:
+            with self._item_isolado(nome, suprimir_erros):
+                yield self.session
+            return
+
+        savepoint = self.session.begin_nested()
+        try:
+            yield self.session
+        except Exception as e:
+            savepoint.rollback()
+            if not suprimir_erros:
+                raise
+            self.falhas.append((nome, e))
+            log_erro(
+                f"❌ Erro ao processar {nome or 'item'}: {e}. Alterações desfeitas."
+            )
+            return
+        savepoint.commit()
+        self._pendentes += 1
+        if self._pendentes >= self.itens_por_commit:
+            self.commit()
+
+    @contextmanager
+    def _item_isolado(self, nome: str, suprimir_erros: bool):
+        """Um item na sua própria transação (sem SAVEPOINT)."""
+        try:
+            yield self.session
+        except Exception as e:
+            self.session.rollback()
+            if not suprimir_erros:
+                raise
+            self.falhas.append((nome, e))
+            log_erro(
+                f"❌ Erro ao processar {nome or 'item'}: {e}. Alterações desfeitas."
+            )
+            return
+        self.session.commit()
+        self.commits += 1
+
+    def commit(self):
+        """Confirma os itens pendentes."""
+        if self._pendentes:
+            self.session.commit()
+            self.commits += 1
+            self._pendentes = 0
@@ -35,21 +35,87 @@
 #   (simular) o repositório em vez de interagir com o banco de dados real.
 #
 # COMPONENTES:
-# - AtivoRepository: Gerencia as operações para o modelo 'Ativo'.
-# - TransacaoRepository: Gerencia as operações para o modelo 'Transacao'.
-# - DadoHistoricoRepository: Gerencia as operações para 'DadoHistorico'.
+# - AtivoRepository: Gerencia as operações para o modelo 'Ativo', incluindo o
+#   índice ticker <-> id (em cache).
+# - PrecoHistoricoRepository: Gerencia as operações para 'PrecoHistorico':
+#   matriz de preços, últimos fechamentos (em cache), plano de atualização e
+#   lacunas das séries.
 # - CarteiraRepository: Gerencia as operações para o modelo 'Carteira'.
+# - TransacaoRepository: Gerencia as operações para o modelo 'Transacao'.
+# - PosicaoRepository: Posições materializadas das carteiras, atualizadas a
+#   cada transação e reconstruídas a partir do histórico quando preciso.
+# - EventoCorporativoRepository: Proventos e desdobramentos, e os fatores de
+#   ajuste (em cache) usados na leitura dos preços ajustados.
+# - MembroIndiceRepository: Histórico de composição dos índices
+#   ('index_membership').
+#
+# Os caches em memória (`cache.py` e `ajustes.py`) são mantidos coerentes
+# pelas gravações feitas por estes repositórios (ver `registrar_gravacao`).
 #
 # ==============================================================================
 
 import datetime
-from typing import List, Tuple
+import math
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, List, Tuple
 
+import numpy as np
+import pandas as pd
 from db_nexus import BaseRepository
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
-from .models import Ativo, PrecoHistorico, TipoAtivo
+from diversify.calendario_b3 import (
+    proxima_sessao,
+    sessao_anterior,
+    sessoes_entre,
+    ultima_sessao_encerrada,
+)
+from diversify.metrics import contar, log
+
+from .ajustes import SEM_EVENTOS, FatoresAjuste, cache_fatores, fator_provento
+from .cache import (
+    IndiceTickers,
+    UltimoPreco,
+    cache_repositorios,
+    chave_banco,
+    gravacoes_pendentes,
+    registrar_gravacao,
+)
+from .matriz_precos import MatrizPrecos, tickers_do_indice
+from .models import (
+    Ativo,
+    Carteira,
+    EventoCorporativo,
+    MembroIndice,
+    Posicao,
+    PrecoHistorico,
+    TipoAtivo,
+    TipoEvento,
+    TipoTransacao,
+    Transacao,
+)
+
+# `date.toordinal()` de 1970-01-01, a origem do `datetime64`.
+_ORDINAL_EPOCA = datetime.date(1970, 1, 1).toordinal()
+
+# Quantidades abaixo disto (resíduo de ponto flutuante) zeram a posição.
+_QUANTIDADE_MINIMA = 1e-9
+
+# Funções `insert` com suporte a `ON CONFLICT`, por dialeto do banco.
+_INSERT_COM_CONFLITO = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+@dataclass
+class ResultadoUpsertAtivos:
+    """Contagens de uma sincronização em massa da tabela de ativos."""
+
+    inseridos: int = 0
+    atualizados: int = 0
+    inalterados: int = 0
 
 
 # --- Classe para interagir com a tabela AtivoRepository ---
@@ -75,30 +141,200 @@ class AtivoRepository(BaseRepository[Ativo]):
         """
         instance = session.query(self.model).filter_by(ticker=ticker).first()
         if not instance:
-            print(f"Ativo não encontrado, criando: {ticker}")
+            log(f"Ativo não encontrado, criando: {ticker}")
             instance = Ativo(ticker=ticker, nome=nome, tipo=tipo)
             session.add(instance)
+            registrar_gravacao(session, indice=True)
         else:
             # Opcional: Atualiza os dados se eles mudaram
             if instance.nome != nome or instance.tipo != tipo:
                 instance.nome = nome
                 instance.tipo = tipo
-                print(f"Ativo encontrado, atualizando dados: {ticker}")
+                log(f"Ativo encontrado, atualizando dados: {ticker}")
         return instance
 
+    def bulk_upsert(
+        self,
+        session: Session,
+        ativos: list[dict],
+        tipo: TipoAtivo,
+        chunk_size: int = 500,
+    ) -> ResultadoUpsertAtivos:
+        """
+        Versão em massa do `find_or_create` para uma lista de ativos
+        (dicionários com `ticker`, `nome` e, opcionalmente, `tipo`).
+
+        Carrega os ativos existentes com `SELECT ... WHERE ticker IN (...)` e
+        grava apenas os novos ou alterados com `INSERT ... ON CONFLICT(ticker)
+        DO UPDATE`, em blocos de `chunk_size`. Tudo acontece na transação da
+        sessão recebida.
+        """
+        # Um ticker repetido na entrada vale pela sua última ocorrência.
+        desejados = {
+            a["ticker"]: {
+                "ticker": a["ticker"],
+                "nome": a["nome"],
+                "tipo": a.get("tipo", tipo),
+            }
+            for a in ativos
+        }
+        tickers = list(desejados)
+
+        existentes = {}
+        for i in range(0, len(tickers), chunk_size):
+            bloco = tickers[i : i + chunk_size]
+            query = select(self.model.ticker, self.model.nome, self.model.tipo).where(
+                self.model.ticker.in_(bloco)
+            )
+            for ticker, nome, tipo_atual in session.execute(query):
+                existentes[ticker] = (nome, tipo_atual)
+
+        resultado = ResultadoUpsertAtivos()
+        mudancas = []
+        for ticker, ativo in desejados.items():
+            atual = existentes.get(ticker)
+            if atual is None:
+                resultado.inseridos += 1
+            elif atual != (ativo["nome"], ativo["tipo"]):
+                resultado.atualizados += 1
+            else:
+                resultado.inalterados += 1
+                continue
+            mudancas.append(ativo)
+
+        for situacao in ("inseridos", "atualizados", "inalterados"):
+            contar("ativos", getattr(resultado, situacao), situacao=situacao)
+        if not mudancas:
+            return resultado
+        if resultado.inseridos:
+            # Nome e tipo não fazem parte do índice; só tickers novos o mudam.
+            registrar_gravacao(session, indice=True)
+
+        insert = _INSERT_COM_CONFLITO.get(session.get_bind().dialect.name)
+        if insert is None:
+            # Dialeto sem `ON CONFLICT`: recorre ao caminho linha a linha.
+            for ativo in mudancas:
+                self.find_or_create(session, **ativo)
+            return resultado
+
+        stmt = insert(self.model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.ticker],
+            set_={"nome": stmt.excluded.nome, "tipo": stmt.excluded.tipo},
+        )
+        for i in range(0, len(mudancas), chunk_size):
+            session.execute(stmt, mudancas[i : i + chunk_size])
+        return resultado
+
+    def indice(self, session: Session) -> IndiceTickers:
+        """
+        O índice ticker <-> id de todos os ativos, do cache do processo. Só a
+        primeira leitura (ou a primeira depois da inserção de ativos) consulta
+        o banco.
+
+        Se a sessão inseriu ativos ainda não confirmados, o índice é lido do
+        banco e não vai para o cache.
+        """
+        pendentes = gravacoes_pendentes(session)
+        if pendentes is not None and pendentes.indice:
+            return self._indice_do_banco(session)
+        banco = chave_banco(session)
+        indice = cache_repositorios.indice(banco)
+        if indice is None:
+            indice = self._indice_do_banco(session)
+            cache_repositorios.guardar_indice(banco, indice)
+        return indice
+
+    def _indice_do_banco(self, session: Session) -> IndiceTickers:
+        return IndiceTickers.de_pares(
+            session.execute(select(self.model.id, self.model.ticker)).tuples().all()
+        )
+
+    def map_tickers_to_ids(
+        self, session: Session, tickers: Iterable[str]
+    ) -> dict[str, int]:
+        """Retorna {ticker: id} para os tickers informados que existem no banco."""
+        por_ticker = self.indice(session).por_ticker
+        return {t: por_ticker[t] for t in tickers if t in por_ticker}
+
+    def marcar_precos_brutos(self, session: Session, ativo_ids: Iterable[int]) -> int:
+        """
+        Marca os ativos cuja série bruta acabou de ser gravada. Retorna quantos
+        ainda não estavam marcados.
+        """
+        ativo_ids = list(ativo_ids)
+        if not ativo_ids:
+            return 0
+        return session.execute(
+            update(self.model)
+            .where(self.model.id.in_(ativo_ids), self.model.precos_brutos.is_(False))
+            .values(precos_brutos=True)
+        ).rowcount
+
     def list_all_ids_and_tickers(self, session: Session) -> List[Tuple[int, str]]:
         """
         Busca e retorna uma lista de tuplas contendo o ID e o Ticker de todos os ativos.
         """
-        print("Buscando ID e Ticker de todos os ativos...")
-        # A query seleciona especificamente as colunas 'id' e 'ticker'
-        resultados = (
-            session.query(self.model.id, self.model.ticker)
-            .order_by(self.model.ticker)
-            .all()
-        )
-        # O resultado já vem no formato [ (1, 'ABCB4'), (2, 'BBDC4'), ... ]
-        return resultados
+        log("Buscando ID e Ticker de todos os ativos...")
+        # Vem do índice em cache, no formato [ (1, 'ABCB4'), (2, 'BBDC4'), ... ]
+        por_ticker = self.indice(session).por_ticker
+        return [(por_ticker[ticker], ticker) for ticker in sorted(por_ticker)]
+
+
+@dataclass
+class ResultadoUpsertPrecos:
+    """
+    Contagens de uma gravação de preços em massa.
+
+    `revisados` são os preços que já existiam com outro valor (ex: o pregão
+    parcial do dia anterior); eles só são regravados no modo "atualizar".
+    """
+
+    novos: int = 0
+    inalterados: int = 0
+    revisados: int = 0
+
+
+# --- Estruturas do planejador de atualização incremental ---
+@dataclass(frozen=True)
+class ItemPlano:
+    """Um ativo que precisa de novas cotações."""
+
+    ativo_id: int
+    ticker: str
+    tipo: TipoAtivo
+    ultima_data: datetime.date | None
+
+
+@dataclass(frozen=True)
+class Lacuna:
+    """Pregões consecutivos sem preço de um ativo, no intervalo [inicio, fim)."""
+
+    ativo_id: int
+    inicio: datetime.date
+    fim: datetime.date  # exclusivo: dia seguinte ao último pregão faltante
+    sessoes: int
+
+
+@dataclass
+class PlanoAtualizacao:
+    """
+    Resultado do planejador: ativos pendentes agrupados pela janela de busca.
+
+    A chave de `grupos` é a data inicial da busca (dia seguinte ao último
+    preço salvo) ou None para ativos sem nenhum histórico. `legados` conta os
+    ativos com preços ajustados de bancos antigos, que são buscados de novo
+    desde o primeiro preço salvo.
+    """
+
+    grupos: dict[datetime.date | None, list[ItemPlano]] = field(default_factory=dict)
+    total_ativos: int = 0
+    atualizados: int = 0
+    legados: int = 0
+
+    @property
+    def pendentes(self) -> int:
+        return sum(len(itens) for itens in self.grupos.values())
 
 
 # --- Classe para interagir com a tabela PrecoHistorico ---
@@ -119,22 +355,255 @@ class PrecoHistoricoRepository(BaseRepository[PrecoHistorico]):
         """
         return (
             session.query(self.model)
-            .filter(self.model.ticker == ticker.upper())
-            .filter(self.model.data.between(start_date, end_date))
-            .order_by(self.model.data.asc())
+            .join(Ativo, self.model.ativo_id == Ativo.id)
+            .filter(Ativo.ticker == ticker.upper())
+            .filter(self.model.data_pregao.between(start_date, end_date))
+            .order_by(self.model.data_pregao.asc())
             .all()
         )
 
-    def get_latest_price(self, session: Session, ticker: str) -> PrecoHistorico | None:
+    def load_price_matrix(
+        self,
+        session: Session,
+        ativos: list[str] | TipoAtivo | str,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        forward_fill: bool = False,
+        yield_per: int = 50_000,
+        ajustado: bool = True,
+    ) -> MatrizPrecos:
         """
-        Busca o registro de dado histórico mais recente para um ticker.
+        Carrega os preços de vários ativos como uma matriz densa
+        "data × ativo" (`MatrizPrecos`).
+
+        `ativos` pode ser uma lista de tickers, um `TipoAtivo` (todos os ativos
+        daquele tipo) ou o nome de um índice (ex: "IFIX", com a composição
+        vigente em `end_date`). O eixo de datas é o
+        conjunto de pregões com algum preço entre os ativos selecionados.
+
+        As linhas da query (com join em `ativos`) são lidas em blocos de
+        `yield_per` e gravadas direto em arrays NumPy pré-alocados.
+
+        Com `ajustado` (o padrão), os fechamentos brutos são corrigidos por
+        proventos e desdobramentos: cada coluna é multiplicada pelos fatores
+        acumulados do ativo (`EventoCorporativoRepository.fatores`, em cache).
         """
-        return (
-            session.query(self.model)
-            .filter(self.model.ticker == ticker.upper())
-            .order_by(self.model.data.desc())
-            .first()
+        if isinstance(ativos, TipoAtivo):
+            filtro = Ativo.tipo == ativos
+        elif isinstance(ativos, str):
+            # Nome de índice: composição vigente em `end_date` pelo histórico
+            # de `index_membership` ou, se ele estiver vazio, pelo JSON mais recente.
+            ids = MembroIndiceRepository().ids_em(session, ativos, end_date)
+            filtro = (
+                Ativo.id.in_(ids)
+                if ids
+                else Ativo.ticker.in_(tickers_do_indice(ativos))
+            )
+        else:
+            filtro = Ativo.ticker.in_([t.upper() for t in ativos])
+        no_periodo = self.model.data_pregao.between(start_date, end_date)
+
+        # 1. Colunas (ativos) e eixo de datas: consultas pequenas e indexadas.
+        colunas = session.execute(
+            select(Ativo.id, Ativo.ticker).where(filtro).order_by(Ativo.ticker)
+        ).all()
+        eixo = session.scalars(
+            select(self.model.data_pregao)
+            .join(Ativo, self.model.ativo_id == Ativo.id)
+            .where(filtro, no_periodo)
+            .distinct()
+            .order_by(self.model.data_pregao)
+        ).all()
+        datas = np.array(eixo, dtype="datetime64[D]")
+
+        valores = np.full((len(datas), len(colunas)), np.nan, dtype=np.float64)
+        if not colunas or not len(datas):
+            return MatrizPrecos(datas, [], valores, np.isnan(valores))
+
+        # Tabelas de consulta ativo_id -> coluna e data -> linha da matriz.
+        ids = np.array([ativo_id for ativo_id, _ in colunas], dtype=np.int64)
+        posicao = np.full(ids.max() + 1, -1, dtype=np.int64)
+        posicao[ids] = np.arange(len(ids))
+        linha_da_data = {data: i for i, data in enumerate(eixo)}
+
+        # 2. Preços: uma única query com join, lida em blocos pelo Core (sem
+        #    a camada ORM de carregamento de linhas).
+        query = (
+            select(
+                self.model.ativo_id,
+                self.model.data_pregao,
+                self.model.preco_fechamento,
+            )
+            .join(Ativo, self.model.ativo_id == Ativo.id)
+            .where(filtro, no_periodo)
+            .execution_options(yield_per=yield_per)
+        )
+        for bloco in session.connection().execute(query).partitions():
+            ativo_ids, datas_bloco, precos = zip(*bloco)
+            linhas = np.fromiter(
+                map(linha_da_data.__getitem__, datas_bloco),
+                dtype=np.int64,
+                count=len(bloco),
+            )
+            cols = posicao[np.fromiter(ativo_ids, dtype=np.int64, count=len(bloco))]
+            valores[linhas, cols] = np.fromiter(
+                precos, dtype=np.float64, count=len(bloco)
+            )
+
+        if ajustado:
+            fatores = EventoCorporativoRepository().fatores(session, ids.tolist())
+            for coluna, ativo_id in enumerate(ids.tolist()):
+                if not fatores[ativo_id].vazio:
+                    valores[:, coluna] *= fatores[ativo_id].para(datas)
+
+        matriz = MatrizPrecos(
+            datas, [ticker for _, ticker in colunas], valores, np.isnan(valores)
+        )
+        return matriz.preencher_adiante() if forward_fill else matriz
+
+    def get_latest_price(self, session: Session, ticker: str) -> UltimoPreco:
+        """
+        Último fechamento (bruto) salvo de um ticker, como `(data, preço)`, ou
+        None se o ticker não existir ou não tiver preços. Vem do cache do
+        processo: chamadas repetidas não consultam o banco.
+        """
+        ativo_id = AtivoRepository().indice(session).por_ticker.get(ticker.upper())
+        if ativo_id is None:
+            return None
+        return self.ultimos_precos(session, [ativo_id])[ativo_id]
+
+    def get_latest_prices(
+        self,
+        session: Session,
+        tickers: Iterable[str] | None = None,
+        as_of: datetime.date | None = None,
+    ) -> pd.Series:
+        """
+        Último fechamento (bruto) de vários ativos em `as_of` ou antes (por
+        padrão, o último salvo), como uma `pd.Series` indexada pelo ticker, na
+        ordem pedida. `tickers` None pede todos os ativos, em ordem
+        alfabética. Tickers inexistentes ou sem preço até `as_of` ficam NaN.
+
+        É a leitura usada para marcar carteiras a mercado: os fechamentos vêm
+        do retrato em cache (`ultimos_precos`), e só os ativos com preço
+        posterior a `as_of` são buscados no banco, com uma única query
+        agrupada.
+        """
+        por_ticker = AtivoRepository().indice(session).por_ticker
+        if tickers is None:
+            tickers = sorted(por_ticker)
+        else:
+            tickers = [ticker.upper() for ticker in tickers]
+        ids = [por_ticker.get(ticker) for ticker in tickers]
+        conhecidos = [ativo_id for ativo_id in dict.fromkeys(ids) if ativo_id]
+
+        ultimos = self.ultimos_precos(session, conhecidos)
+        if as_of is not None:
+            posteriores = [
+                ativo_id
+                for ativo_id, ultimo in ultimos.items()
+                if ultimo is not None and ultimo[0] > as_of
+            ]
+            if posteriores:
+                ultimos.update(
+                    dict.fromkeys(posteriores)
+                    | self._ultimos_do_banco(session, posteriores, as_of)
+                )
+
+        precos = np.array(
+            [
+                (
+                    np.nan
+                    if ativo_id is None or ultimos[ativo_id] is None
+                    else ultimos[ativo_id][1]
+                )
+                for ativo_id in ids
+            ],
+            dtype=np.float64,
         )
+        return pd.Series(
+            precos, index=pd.Index(tickers, name="ticker"), name="preco_fechamento"
+        )
+
+    def ultimos_precos(
+        self, session: Session, ativo_ids: Iterable[int]
+    ) -> dict[int, UltimoPreco]:
+        """
+        {ativo_id: (data, preço) ou None} com o último fechamento de cada
+        ativo, do cache do processo. A primeira leitura de um banco carrega o
+        retrato de todos os ativos com uma única query agrupada; depois, só os
+        ativos que receberam preços desde então são lidos de novo.
+
+        Os ativos com preços gravados pela sessão e ainda não confirmados são
+        lidos do banco e não vão para o cache.
+        """
+        banco = chave_banco(session)
+        pendentes = gravacoes_pendentes(session)
+        sujos = pendentes.ultimos if pendentes is not None else set()
+        ativo_ids = list(ativo_ids)
+        encontrados, faltantes = cache_repositorios.ultimos(
+            banco, [ativo_id for ativo_id in ativo_ids if ativo_id not in sujos]
+        )
+        faltantes += [ativo_id for ativo_id in ativo_ids if ativo_id in sujos]
+        if not faltantes:
+            return encontrados
+
+        if cache_repositorios.tem_ultimos(banco):
+            carregados = dict.fromkeys(faltantes) | self._ultimos_do_banco(
+                session, faltantes
+            )
+        else:
+            todos = AtivoRepository().indice(session).por_id
+            carregados = dict.fromkeys([*todos, *faltantes]) | self._ultimos_do_banco(
+                session
+            )
+        cache_repositorios.guardar_ultimos(
+            banco, {k: v for k, v in carregados.items() if k not in sujos}
+        )
+        return encontrados | {ativo_id: carregados[ativo_id] for ativo_id in faltantes}
+
+    def _ultimos_do_banco(
+        self,
+        session: Session,
+        ativo_ids: list[int] | None = None,
+        as_of: datetime.date | None = None,
+        chunk_size: int = 500,
+    ) -> dict[int, tuple[datetime.date, float]]:
+        """
+        Último fechamento de cada ativo (em `as_of` ou antes), com um join
+        entre a tabela e `MAX(data_pregao)` agrupado por ativo. Os dois lados
+        são resolvidos pela chave primária `(ativo_id, data_pregao)`.
+        Sem `ativo_ids`, lê todos os ativos em uma única query.
+        """
+        blocos = (
+            [None]
+            if ativo_ids is None
+            else [
+                ativo_ids[i : i + chunk_size]
+                for i in range(0, len(ativo_ids), chunk_size)
+            ]
+        )
+        resultado = {}
+        for bloco in blocos:
+            ultima = select(
+                self.model.ativo_id,
+                func.max(self.model.data_pregao).label("data_pregao"),
+            ).group_by(self.model.ativo_id)
+            if bloco is not None:
+                ultima = ultima.where(self.model.ativo_id.in_(bloco))
+            if as_of is not None:
+                ultima = ultima.where(self.model.data_pregao <= as_of)
+            ultima = ultima.subquery()
+            query = select(
+                self.model.ativo_id, self.model.data_pregao, self.model.preco_fechamento
+            ).join(
+                ultima,
+                (self.model.ativo_id == ultima.c.ativo_id)
+                & (self.model.data_pregao == ultima.c.data_pregao),
+            )
+            for ativo_id, data, preco in session.execute(query):
+                resultado[ativo_id] = (data, preco)
+        return resultado
 
     def get_latest_date(self, session: Session, ativo_id: int) -> datetime.date | None:
         """
@@ -151,9 +620,908 @@ class PrecoHistoricoRepository(BaseRepository[PrecoHistorico]):
         )
         return latest_date
 
-    def bulk_insert(self, session: Session, precos: list[dict]):
-        """Insere uma lista de preços de forma otimizada."""
-        if not precos:
-            return
-        session.bulk_insert_mappings(self.model, precos)
-        print(f"{len(precos)} novos registros de preços inseridos.")
+    def plan_updates(
+        self,
+        session: Session,
+        hoje: datetime.date | None = None,
+        ultima_sessao: datetime.date | None = None,
+        ativo_ids: Iterable[int] | None = None,
+    ) -> PlanoAtualizacao:
+        """
+        Monta o plano de atualização de todo o universo (ou só de `ativo_ids`)
+        com UMA única query agrupada: `(ativo_id, ticker, tipo,
+        MAX(data_pregao))`.
+
+        Ativos que já têm o preço de `ultima_sessao` (o último pregão
+        encerrado; por padrão, o pregão anterior a `hoje`, ou o último já
+        fechado se `hoje` não for informado) são descartados: o próximo pregão
+        esperado deles ainda não aconteceu. Os demais são agrupados pela data
+        inicial da busca.
+
+        Ativos com preços ajustados de bancos antigos (`precos_brutos` falso)
+        entram em um grupo único que começa no primeiro preço salvo entre
+        eles, para que a série inteira seja regravada com os fechamentos
+        brutos. É uma passada só: a gravação marca os ativos do lote mesmo
+        quando o provedor não retorna nada para eles.
+        """
+        if ultima_sessao is None:
+            ultima_sessao = (
+                ultima_sessao_encerrada()
+                if hoje is None
+                else sessao_anterior(hoje).astype(datetime.date)
+            )
+        query = session.query(
+            Ativo.id,
+            Ativo.ticker,
+            Ativo.tipo,
+            Ativo.precos_brutos,
+            func.min(self.model.data_pregao),
+            func.max(self.model.data_pregao),
+        ).outerjoin(self.model, self.model.ativo_id == Ativo.id)
+        if ativo_ids is not None:
+            query = query.filter(Ativo.id.in_(list(ativo_ids)))
+        resultados = query.group_by(
+            Ativo.id, Ativo.ticker, Ativo.tipo, Ativo.precos_brutos
+        ).all()
+
+        # Pregões esperados entre o último preço salvo (exclusive) e o último
+        # pregão encerrado (inclusive), para todos os ativos de uma vez.
+        ultimas = np.array(
+            [linha[-1] or ultima_sessao for linha in resultados],
+            dtype="datetime64[D]",
+        )
+        faltantes = sessoes_entre(ultimas + 1, np.datetime64(ultima_sessao) + 1)
+        inicio_legados = min(
+            (
+                primeira
+                for *_, brutos, primeira, _ in resultados
+                if not brutos and primeira is not None
+            ),
+            default=None,
+        )
+
+        plano = PlanoAtualizacao(total_ativos=len(resultados))
+        for (ativo_id, ticker, tipo, brutos, _, data), n in zip(resultados, faltantes):
+            inicio = None
+            if data is not None:
+                if not brutos:
+                    inicio = inicio_legados
+                    plano.legados += 1
+                elif n == 0:
+                    plano.atualizados += 1
+                    continue
+                else:
+                    inicio = data + datetime.timedelta(days=1)
+            plano.grupos.setdefault(inicio, []).append(
+                ItemPlano(ativo_id, ticker, tipo, data)
+            )
+        return plano
+
+    def find_gaps(
+        self,
+        session: Session,
+        desde: datetime.date | None = None,
+        ativo_ids: Iterable[int] | None = None,
+        yield_per: int = 100_000,
+    ) -> list[Lacuna]:
+        """
+        Procura, em uma única passada pela tabela, os pregões sem preço no
+        meio da série de cada ativo e os devolve como faixas contíguas
+        mínimas (uma `Lacuna` por sequência de pregões faltantes).
+
+        As linhas vêm na ordem da chave primária (ativo, data) e, para cada
+        par de datas consecutivas de um mesmo ativo, o calendário da B3 diz
+        quantos pregões existem entre elas; tudo com operações sobre arrays.
+        Com `desde`, os pregões entre `desde` e o primeiro preço de cada ativo
+        também contam como lacuna.
+
+        O trecho depois do último preço não entra aqui: é o caminho
+        incremental (`plan_updates`) que cuida dele.
+        """
+        query = select(self.model.ativo_id, self.model.data_pregao).order_by(
+            self.model.ativo_id, self.model.data_pregao
+        )
+        if ativo_ids is not None:
+            query = query.where(self.model.ativo_id.in_(list(ativo_ids)))
+        query = query.execution_options(yield_per=yield_per)
+
+        inicios, fins, ids_lacunas = [], [], []
+        ultimo_id, ultima_data = None, None
+        for bloco in session.connection().execute(query).partitions():
+            ids_bloco, datas_bloco = zip(*bloco)
+            ids = np.fromiter(ids_bloco, dtype=np.int64, count=len(bloco))
+            # `toordinal` é bem mais rápido que converter objetos `date` direto.
+            datas = (
+                np.fromiter(
+                    map(datetime.date.toordinal, datas_bloco),
+                    dtype=np.int64,
+                    count=len(bloco),
+                )
+                - _ORDINAL_EPOCA
+            ).astype("datetime64[D]")
+            if ultimo_id is not None:
+                # A última linha do bloco anterior faz par com a primeira deste.
+                ids = np.concatenate(([ultimo_id], ids))
+                datas = np.concatenate(([ultima_data], datas))
+
+            # Pares (data anterior, data seguinte) de um mesmo ativo.
+            mesmo_ativo = ids[1:] == ids[:-1]
+            anteriores, seguintes = datas[:-1][mesmo_ativo], datas[1:][mesmo_ativo]
+            inicios.append(anteriores + 1)
+            fins.append(seguintes)
+            ids_lacunas.append(ids[1:][mesmo_ativo])
+
+            if desde is not None:
+                # Primeira data de cada ativo: início do bloco ou troca de ativo.
+                primeiras = np.flatnonzero(
+                    np.concatenate(([ultimo_id is None], ~mesmo_ativo))
+                )
+                inicios.append(np.full(len(primeiras), np.datetime64(desde, "D")))
+                fins.append(datas[primeiras])
+                ids_lacunas.append(ids[primeiras])
+
+            ultimo_id, ultima_data = ids[-1], datas[-1]
+
+        if not inicios:
+            return []
+        inicios = np.concatenate(inicios)
+        fins = np.concatenate(fins)
+        ids_lacunas = np.concatenate(ids_lacunas)
+
+        sessoes = sessoes_entre(inicios, fins)
+        com_lacuna = sessoes > 0
+        inicios, fins = inicios[com_lacuna], fins[com_lacuna]
+        ids_lacunas, sessoes = ids_lacunas[com_lacuna], sessoes[com_lacuna]
+        # Faixa mínima: do primeiro ao último pregão faltante.
+        primeiro = proxima_sessao(inicios - 1)
+        depois_do_ultimo = sessao_anterior(fins) + 1
+
+        return [
+            Lacuna(int(ativo_id), inicio, fim, int(n))
+            for ativo_id, inicio, fim, n in zip(
+                ids_lacunas.tolist(),
+                primeiro.tolist(),
+                depois_do_ultimo.tolist(),
+                sessoes.tolist(),
+            )
+        ]
+
+    def bulk_insert(
+        self,
+        session: Session,
+        precos: Iterable[dict],
+        modo: str = "inserir",
+        chunk_size: int = 5000,
+    ) -> ResultadoUpsertPrecos:
+        """
+        Grava preços em massa, em blocos de `chunk_size` linhas enviadas via
+        `executemany` na tabela do Core (sem objetos ORM).
+
+        Modos:
+        - "inserir": INSERT simples; falha se o preço já existir.
+        - "ignorar": `ON CONFLICT(data_pregao, ativo_id) DO NOTHING`.
+        - "atualizar": `ON CONFLICT(data_pregao, ativo_id) DO UPDATE`,
+          regravando apenas os preços que mudaram.
+
+        `precos` pode ser qualquer iterável (inclusive um gerador), o que
+        permite cargas de vários anos sem montar uma lista gigante.
+
+        O último fechamento em cache dos ativos que recebem preços é
+        descartado na gravação e de novo no commit (ver `registrar_gravacao`).
+        """
+        if modo not in ("inserir", "ignorar", "atualizar"):
+            raise ValueError(f"Modo de gravação inválido: {modo!r}")
+
+        tabela = self.model.__table__
+        insert_fn = _INSERT_COM_CONFLITO.get(session.get_bind().dialect.name)
+        resultado = ResultadoUpsertPrecos()
+
+        iterador = iter(precos)
+        while bloco := list(islice(iterador, chunk_size)):
+            if modo == "inserir":
+                registrar_gravacao(session, ultimos={p["ativo_id"] for p in bloco})
+                session.execute(insert(tabela), bloco)
+                resultado.novos += len(bloco)
+                continue
+
+            existentes = self._precos_existentes(session, bloco)
+            novos, revisados = [], []
+            for preco in bloco:
+                atual = existentes.get((preco["ativo_id"], preco["data_pregao"]))
+                if atual is None:
+                    novos.append(preco)
+                elif math.isclose(atual, preco["preco_fechamento"], rel_tol=1e-9):
+                    resultado.inalterados += 1
+                else:
+                    revisados.append(preco)
+
+            resultado.novos += len(novos)
+            resultado.revisados += len(revisados)
+            gravar = novos + revisados if modo == "atualizar" else novos
+            if not gravar:
+                continue
+            registrar_gravacao(session, ultimos={p["ativo_id"] for p in gravar})
+
+            if insert_fn is not None:
+                stmt = insert_fn(tabela)
+                if modo == "atualizar":
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[tabela.c.data_pregao, tabela.c.ativo_id],
+                        set_={"preco_fechamento": stmt.excluded.preco_fechamento},
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(
+                        index_elements=[tabela.c.data_pregao, tabela.c.ativo_id]
+                    )
+                session.execute(stmt, gravar)
+            else:
+                # Dialeto sem `ON CONFLICT`: a pré-consulta já separou os
+                # preços novos dos revisados.
+                if novos:
+                    session.execute(insert(tabela), novos)
+                if revisados and modo == "atualizar":
+                    session.execute(
+                        update(tabela)
+                        .where(tabela.c.ativo_id == bindparam("b_ativo_id"))
+                        .where(tabela.c.data_pregao == bindparam("b_data_pregao"))
+                        .values(preco_fechamento=bindparam("b_preco")),
+                        [
+                            {
+                                "b_ativo_id": p["ativo_id"],
+                                "b_data_pregao": p["data_pregao"],
+                                "b_preco": p["preco_fechamento"],
+                            }
+                            for p in revisados
+                        ],
+                    )
+
+        for situacao in ("novos", "revisados", "inalterados"):
+            contar("precos", getattr(resultado, situacao), situacao=situacao)
+        log(
+            f"Preços gravados: {resultado.novos} novos, "
+            f"{resultado.revisados} revisados, {resultado.inalterados} inalterados."
+        )
+        return resultado
+
+    def _precos_existentes(
+        self, session: Session, bloco: list[dict]
+    ) -> dict[tuple[int, datetime.date], float]:
+        """
+        Busca os preços já salvos que podem colidir com um bloco, usando
+        uma única query por intervalo de datas e lista de ativos.
+        """
+        ids = {p["ativo_id"] for p in bloco}
+        datas = [p["data_pregao"] for p in bloco]
+        query = select(
+            self.model.ativo_id, self.model.data_pregao, self.model.preco_fechamento
+        ).where(
+            self.model.ativo_id.in_(ids),
+            self.model.data_pregao.between(min(datas), max(datas)),
+        )
+        return {(a, d): p for a, d, p in session.execute(query)}
+
+
+@dataclass
+class ResultadoEventos:
+    """Contagens de uma gravação de eventos corporativos."""
+
+    novos: int = 0
+    revisados: int = 0
+    inalterados: int = 0
+
+
+# --- Classe para interagir com a tabela EventoCorporativo ---
+class EventoCorporativoRepository(BaseRepository[EventoCorporativo]):
+    """
+    Repositório para os proventos e desdobramentos dos ativos, e para os
+    fatores de ajuste derivados deles.
+    """
+
+    def __init__(self):
+        super().__init__(EventoCorporativo)
+
+    def desdobramentos(
+        self, session: Session, ativo_ids: Iterable[int]
+    ) -> dict[int, list[tuple[datetime.date, float]]]:
+        """{ativo_id: [(data_ex, razao), ...]} dos ativos com desdobramentos."""
+        query = (
+            select(self.model.ativo_id, self.model.data_ex, self.model.valor)
+            .where(
+                self.model.tipo == TipoEvento.DESDOBRAMENTO,
+                self.model.ativo_id.in_(list(ativo_ids)),
+            )
+            .order_by(self.model.ativo_id, self.model.data_ex)
+        )
+        resultado = {}
+        for ativo_id, data_ex, razao in session.execute(query):
+            resultado.setdefault(ativo_id, []).append((data_ex, razao))
+        return resultado
+
+    def bulk_upsert(
+        self, session: Session, eventos: list[dict], precos: Iterable[dict] = ()
+    ) -> ResultadoEventos:
+        """
+        Grava eventos (dicionários com `ativo_id`, `data_ex`, `tipo` e `valor`
+        brutos), calculando o `fator` de cada um. Eventos já salvos com o
+        mesmo valor são ignorados.
+
+        O fator de um provento usa o fechamento bruto do pregão anterior à
+        data ex, procurado primeiro em `precos` (os preços do mesmo lote) e,
+        se não estiver lá, no banco. Os fatores em cache dos ativos com
+        eventos novos ou revisados são descartados.
+        """
+        resultado = ResultadoEventos()
+        if not eventos:
+            return resultado
+
+        ids = {e["ativo_id"] for e in eventos}
+        datas = [e["data_ex"] for e in eventos]
+        existentes = {
+            (a, d, t): v
+            for a, d, t, v in session.execute(
+                select(
+                    self.model.ativo_id,
+                    self.model.data_ex,
+                    self.model.tipo,
+                    self.model.valor,
+                ).where(
+                    self.model.ativo_id.in_(ids),
+                    self.model.data_ex.between(min(datas), max(datas)),
+                )
+            )
+        }
+        gravar = []
+        for evento in eventos:
+            atual = existentes.get(
+                (evento["ativo_id"], evento["data_ex"], evento["tipo"])
+            )
+            if atual is None:
+                resultado.novos += 1
+            elif math.isclose(atual, evento["valor"], rel_tol=1e-9):
+                resultado.inalterados += 1
+                continue
+            else:
+                resultado.revisados += 1
+            gravar.append(evento)
+
+        for situacao in ("novos", "revisados", "inalterados"):
+            contar("eventos", getattr(resultado, situacao), situacao=situacao)
+        if not gravar:
+            return resultado
+
+        # Fechamentos do lote por ativo, em ordem de data.
+        fechamentos: dict[int, tuple[list, list]] = {}
+        for preco in sorted(precos, key=lambda p: p["data_pregao"]):
+            datas_ativo, valores = fechamentos.setdefault(preco["ativo_id"], ([], []))
+            datas_ativo.append(preco["data_pregao"])
+            valores.append(preco["preco_fechamento"])
+
+        linhas = []
+        for evento in gravar:
+            if evento["tipo"] == TipoEvento.DESDOBRAMENTO:
+                fator = 1.0 / evento["valor"]
+            else:
+                anterior = self._fechamento_anterior(
+                    session, fechamentos, evento["ativo_id"], evento["data_ex"]
+                )
+                fator = fator_provento(evento["valor"], anterior)
+            linhas.append({**evento, "fator": fator})
+
+        tabela = self.model.__table__
+        chave = [tabela.c.ativo_id, tabela.c.data_ex, tabela.c.tipo]
+        insert_fn = _INSERT_COM_CONFLITO.get(session.get_bind().dialect.name)
+        if insert_fn is not None:
+            stmt = insert_fn(tabela)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=chave,
+                set_={"valor": stmt.excluded.valor, "fator": stmt.excluded.fator},
+            )
+            session.execute(stmt, linhas)
+        else:
+            # Dialeto sem `ON CONFLICT`: remove os revisados e insere tudo.
+            for linha in linhas:
+                session.execute(
+                    tabela.delete().where(
+                        *(coluna == linha[coluna.name] for coluna in chave)
+                    )
+                )
+            session.execute(insert(tabela), linhas)
+
+        registrar_gravacao(session, fatores={linha["ativo_id"] for linha in linhas})
+        log(
+            f"Eventos corporativos gravados: {resultado.novos} novos, "
+            f"{resultado.revisados} revisados."
+        )
+        return resultado
+
+    def _fechamento_anterior(
+        self,
+        session: Session,
+        fechamentos: dict[int, tuple[list, list]],
+        ativo_id: int,
+        data_ex: datetime.date,
+    ) -> float | None:
+        """Fechamento do último pregão antes de `data_ex`: do lote ou do banco."""
+        datas, valores = fechamentos.get(ativo_id, ([], []))
+        posicao = bisect_left(datas, data_ex)
+        if posicao > 0:
+            return valores[posicao - 1]
+        preco = PrecoHistorico
+        return session.execute(
+            select(preco.preco_fechamento)
+            .where(preco.ativo_id == ativo_id, preco.data_pregao < data_ex)
+            .order_by(preco.data_pregao.desc())
+            .limit(1)
+        ).scalar()
+
+    def fatores(
+        self, session: Session, ativo_ids: Iterable[int], chunk_size: int = 500
+    ) -> dict[int, FatoresAjuste]:
+        """
+        Fatores de ajuste de cada ativo. Os que não estão em cache são lidos
+        com uma query por bloco de `chunk_size` ativos e guardados no cache
+        (menos os de ativos com eventos gravados pela sessão e ainda não
+        confirmados).
+        """
+        banco = chave_banco(session)
+        pendentes = gravacoes_pendentes(session)
+        sujos = pendentes.fatores if pendentes is not None else set()
+        ativo_ids = list(ativo_ids)
+        encontrados, faltantes = cache_fatores.buscar(
+            banco, [ativo_id for ativo_id in ativo_ids if ativo_id not in sujos]
+        )
+        faltantes += [ativo_id for ativo_id in ativo_ids if ativo_id in sujos]
+        if not faltantes:
+            return encontrados
+
+        eventos: dict[int, tuple[list, list]] = {}
+        for i in range(0, len(faltantes), chunk_size):
+            query = (
+                select(self.model.ativo_id, self.model.data_ex, self.model.fator)
+                .where(self.model.ativo_id.in_(faltantes[i : i + chunk_size]))
+                .order_by(self.model.ativo_id, self.model.data_ex)
+            )
+            for ativo_id, data_ex, fator in session.execute(query):
+                datas, fatores = eventos.setdefault(ativo_id, ([], []))
+                datas.append(data_ex)
+                fatores.append(fator)
+
+        carregados = {
+            ativo_id: (
+                FatoresAjuste.de_eventos(*eventos[ativo_id])
+                if ativo_id in eventos
+                else SEM_EVENTOS
+            )
+            for ativo_id in faltantes
+        }
+        cache_fatores.guardar(
+            banco, {k: v for k, v in carregados.items() if k not in sujos}
+        )
+        return {**encontrados, **carregados}
+
+
+@dataclass
+class ResultadoDiffIndice:
+    """Diferenças aplicadas entre duas composições consecutivas de um índice."""
+
+    entradas: int = 0
+    saidas: int = 0
+    alteracoes: int = 0
+    inalterados: int = 0
+
+
+# --- Classe para interagir com a tabela MembroIndice ---
+class MembroIndiceRepository(BaseRepository[MembroIndice]):
+    """
+    Repositório para o histórico de composição dos índices.
+    """
+
+    def __init__(self):
+        super().__init__(MembroIndice)
+
+    def _vigentes_em(self, indice: str, data: datetime.date):
+        """Filtro das participações vigentes em uma data."""
+        return (
+            self.model.indice == indice,
+            self.model.valid_from <= data,
+            (self.model.valid_to.is_(None)) | (self.model.valid_to > data),
+        )
+
+    def apply_composition(
+        self,
+        session: Session,
+        indice: str,
+        data: datetime.date,
+        composicao: dict[int, tuple[int | None, float | None]],
+        tolerancia_peso: float | None = None,
+    ) -> ResultadoDiffIndice:
+        """
+        Aplica uma nova composição ({ativo_id: (qtde_teorica, peso)}) do índice
+        a partir de `data`, gravando apenas as diferenças em relação à
+        composição vigente:
+
+        - ativos que saíram têm a linha fechada (`valid_to = data`);
+        - ativos que entraram ganham uma linha nova;
+        - ativos cuja quantidade teórica mudou (ou cujo peso variou mais que
+          `tolerancia_peso`, se informada) têm a linha fechada e reaberta.
+
+        A participação (%) muda todo dia com os preços; por isso, por padrão,
+        só a quantidade teórica (que muda nos rebalanceamentos) gera alteração.
+        """
+        vigentes = {
+            m.ativo_id: m
+            for m in session.scalars(
+                select(self.model).where(
+                    self.model.indice == indice, self.model.valid_to.is_(None)
+                )
+            )
+        }
+        if any(m.valid_from > data for m in vigentes.values()):
+            raise ValueError(
+                f"Já existe composição do {indice} posterior a {data}; "
+                "as composições devem ser aplicadas em ordem."
+            )
+
+        resultado = ResultadoDiffIndice()
+        novos = []
+        for ativo_id, membro in vigentes.items():
+            if ativo_id not in composicao:
+                membro.valid_to = data
+                resultado.saidas += 1
+
+        for ativo_id, (qtde, peso) in composicao.items():
+            membro = vigentes.get(ativo_id)
+            if membro is None:
+                resultado.entradas += 1
+            elif membro.qtde_teorica != qtde or (
+                tolerancia_peso is not None
+                and membro.peso is not None
+                and peso is not None
+                and abs(membro.peso - peso) > tolerancia_peso
+            ):
+                resultado.alteracoes += 1
+                if membro.valid_from == data:
+                    # Mesma data: apenas corrige a linha aberta hoje.
+                    membro.qtde_teorica, membro.peso = qtde, peso
+                    continue
+                membro.valid_to = data
+            else:
+                resultado.inalterados += 1
+                continue
+            novos.append(
+                {
+                    "indice": indice,
+                    "ativo_id": ativo_id,
+                    "valid_from": data,
+                    "valid_to": None,
+                    "qtde_teorica": qtde,
+                    "peso": peso,
+                }
+            )
+
+        # Fecha as linhas antigas antes de inserir as novas.
+        session.flush()
+        if novos:
+            session.execute(insert(self.model.__table__), novos)
+        return resultado
+
+    def ids_em(self, session: Session, indice: str, data: datetime.date) -> list[int]:
+        """IDs dos ativos que compunham o índice em uma data."""
+        return list(
+            session.scalars(
+                select(self.model.ativo_id).where(*self._vigentes_em(indice, data))
+            )
+        )
+
+    def composition_as_of(
+        self, session: Session, indice: str, data: datetime.date
+    ) -> list[tuple[str, int | None, float | None]]:
+        """
+        Composição do índice em uma data: lista de (ticker, qtde_teorica, peso),
+        resolvida por uma busca no índice `ix_index_membership_as_of`.
+        """
+        query = (
+            select(Ativo.ticker, self.model.qtde_teorica, self.model.peso)
+            .join(Ativo, self.model.ativo_id == Ativo.id)
+            .where(*self._vigentes_em(indice, data))
+            .order_by(Ativo.ticker)
+        )
+        return [tuple(linha) for linha in session.execute(query)]
+
+
+# --- Classe para interagir com a tabela Carteira ---
+class CarteiraRepository(BaseRepository[Carteira]):
+    """
+    Repositório para as carteiras.
+    """
+
+    def __init__(self):
+        super().__init__(Carteira)
+
+    def find_by_nome(self, session: Session, nome: str) -> Carteira | None:
+        return session.scalars(
+            select(self.model).where(self.model.nome == nome)
+        ).first()
+
+    def find_or_create(self, session: Session, nome: str) -> Carteira:
+        """Busca uma carteira pelo nome. Se não existir, cria uma nova."""
+        carteira = self.find_by_nome(session, nome)
+        if carteira is None:
+            log(f"Carteira não encontrada, criando: {nome}")
+            carteira = Carteira(nome=nome)
+            session.add(carteira)
+            session.flush()  # atribui o id
+        return carteira
+
+
+# --- Classe para interagir com a tabela Transacao ---
+class TransacaoRepository(BaseRepository[Transacao]):
+    """
+    Repositório para as transações das carteiras.
+    """
+
+    def __init__(self):
+        super().__init__(Transacao)
+
+    def registrar(
+        self,
+        session: Session,
+        carteira_id: int,
+        ativo_id: int,
+        data: datetime.date,
+        tipo: TipoTransacao,
+        quantidade: float,
+        preco_unitario: float,
+        taxas: float = 0.0,
+    ) -> Transacao:
+        """Valida e grava uma transação (sem atualizar a posição)."""
+        if quantidade <= 0:
+            raise ValueError(f"Quantidade inválida: {quantidade!r}")
+        if preco_unitario < 0 or taxas < 0:
+            raise ValueError("Preço e taxas não podem ser negativos.")
+        transacao = Transacao(
+            carteira_id=carteira_id,
+            ativo_id=ativo_id,
+            data=data,
+            tipo=tipo,
+            quantidade=quantidade,
+            preco_unitario=preco_unitario,
+            taxas=taxas,
+        )
+        session.add(transacao)
+        session.flush()  # atribui o id e torna a transação visível às queries
+        return transacao
+
+    def listar(
+        self, session: Session, carteira_id: int, ativo_id: int | None = None
+    ) -> list[Transacao]:
+        """Transações de uma carteira (opcionalmente de um ativo), em ordem."""
+        query = select(self.model).where(self.model.carteira_id == carteira_id)
+        if ativo_id is not None:
+            query = query.where(self.model.ativo_id == ativo_id)
+        return list(session.scalars(query.order_by(self.model.data, self.model.id)))
+
+
+def _aplicar_transacao(
+    quantidade: float,
+    custo_medio: float,
+    tipo: TipoTransacao,
+    quantidade_transacao: float,
+    preco_unitario: float,
+    taxas: float,
+) -> tuple[float, float]:
+    """
+    Um passo do cálculo por preço médio: (quantidade, custo médio) depois de
+    uma transação.
+
+    - Compra: o custo (preço × quantidade + taxas) entra na média ponderada.
+    - Venda: reduz a quantidade sem mudar o custo médio; zerada a posição, o
+      custo médio volta a zero. Vender mais do que se tem gera ValueError.
+    """
+    if tipo == TipoTransacao.COMPRA:
+        nova_quantidade = quantidade + quantidade_transacao
+        custo = quantidade * custo_medio + quantidade_transacao * preco_unitario
+        return nova_quantidade, (custo + taxas) / nova_quantidade
+
+    nova_quantidade = quantidade - quantidade_transacao
+    if nova_quantidade < -_QUANTIDADE_MINIMA:
+        raise ValueError(
+            f"Venda de {quantidade_transacao} maior que a posição de {quantidade}."
+        )
+    if nova_quantidade <= _QUANTIDADE_MINIMA:
+        return 0.0, 0.0
+    return nova_quantidade, custo_medio
+
+
+# --- Classe para interagir com a tabela Posicao ---
+class PosicaoRepository(BaseRepository[Posicao]):
+    """
+    Repositório para as posições materializadas das carteiras.
+
+    Cada transação nova atualiza só a linha do seu par (carteira, ativo), com
+    uma busca pela chave primária: o custo não depende do tamanho do
+    histórico. A reconstrução a partir das transações (`reconstruir`,
+    `auditar`) fica para auditorias e para transações com data retroativa.
+    """
+
+    def __init__(self):
+        super().__init__(Posicao)
+
+    def aplicar(self, session: Session, transacao: Transacao) -> Posicao:
+        """
+        Atualiza a posição com uma transação já gravada. Se a transação for
+        anterior à última aplicada ao par, a posição do par é refeita a partir
+        do histórico dele.
+        """
+        chave = (transacao.carteira_id, transacao.ativo_id)
+        posicao = session.get(self.model, chave)
+        if posicao is not None and transacao.data < posicao.data_ultima_transacao:
+            log(
+                f"Transação retroativa em {transacao.data}: refazendo a posição "
+                f"da carteira {transacao.carteira_id} no ativo {transacao.ativo_id}."
+            )
+            self.reconstruir(session, *chave)
+            return session.get(self.model, chave, populate_existing=True)
+
+        if posicao is None:
+            posicao = Posicao(
+                carteira_id=transacao.carteira_id,
+                ativo_id=transacao.ativo_id,
+                quantidade=0.0,
+                custo_medio=0.0,
+            )
+            session.add(posicao)
+        posicao.quantidade, posicao.custo_medio = _aplicar_transacao(
+            posicao.quantidade,
+            posicao.custo_medio,
+            transacao.tipo,
+            transacao.quantidade,
+            transacao.preco_unitario,
+            transacao.taxas,
+        )
+        posicao.data_ultima_transacao = transacao.data
+        return posicao
+
+    def _recalcular(
+        self,
+        session: Session,
+        carteira_id: int | None = None,
+        ativo_id: int | None = None,
+        yield_per: int = 50_000,
+    ) -> dict[tuple[int, int], tuple[float, float, datetime.date]]:
+        """
+        Refaz as posições a partir das transações, lidas em uma única query
+        na ordem (carteira, ativo, data) e em blocos de `yield_per` linhas.
+        Retorna {(carteira_id, ativo_id): (quantidade, custo_medio, data)}.
+        """
+        t = Transacao
+        query = select(
+            t.carteira_id,
+            t.ativo_id,
+            t.data,
+            t.tipo,
+            t.quantidade,
+            t.preco_unitario,
+            t.taxas,
+        ).order_by(t.carteira_id, t.ativo_id, t.data, t.id)
+        if carteira_id is not None:
+            query = query.where(t.carteira_id == carteira_id)
+        if ativo_id is not None:
+            query = query.where(t.ativo_id == ativo_id)
+
+        posicoes = {}
+        query = query.execution_options(yield_per=yield_per)
+        for bloco in session.connection().execute(query).partitions():
+            for carteira, ativo, data, tipo, quantidade, preco, taxas in bloco:
+                anterior = posicoes.get((carteira, ativo), (0.0, 0.0, data))
+                try:
+                    novo = _aplicar_transacao(
+                        anterior[0], anterior[1], tipo, quantidade, preco, taxas or 0.0
+                    )
+                except ValueError as e:
+                    raise ValueError(
+                        f"Histórico inválido da carteira {carteira} no ativo "
+                        f"{ativo} em {data}: {e}"
+                    ) from e
+                posicoes[(carteira, ativo)] = (*novo, data)
+        return posicoes
+
+    def reconstruir(
+        self,
+        session: Session,
+        carteira_id: int | None = None,
+        ativo_id: int | None = None,
+        chunk_size: int = 5000,
+    ) -> int:
+        """
+        Apaga e recria as posições (de todas as carteiras, de uma carteira
+        ou de um par carteira/ativo) a partir do histórico de transações.
+        Retorna o número de posições gravadas.
+        """
+        session.flush()
+        posicoes = self._recalcular(session, carteira_id, ativo_id)
+
+        tabela = self.model.__table__
+        apagar = tabela.delete()
+        if carteira_id is not None:
+            apagar = apagar.where(tabela.c.carteira_id == carteira_id)
+        if ativo_id is not None:
+            apagar = apagar.where(tabela.c.ativo_id == ativo_id)
+        session.execute(apagar)
+
+        linhas = [
+            {
+                "carteira_id": carteira,
+                "ativo_id": ativo,
+                "quantidade": quantidade,
+                "custo_medio": custo_medio,
+                "data_ultima_transacao": data,
+            }
+            for (carteira, ativo), (quantidade, custo_medio, data) in posicoes.items()
+        ]
+        for i in range(0, len(linhas), chunk_size):
+            session.execute(insert(tabela), linhas[i : i + chunk_size])
+        contar("posicoes_reconstruidas", len(linhas))
+        return len(linhas)
+
+    def auditar(
+        self, session: Session, carteira_id: int | None = None, rel_tol: float = 1e-9
+    ) -> list[tuple[int, int, tuple | None, tuple | None]]:
+        """
+        Compara as posições materializadas com as refeitas a partir do
+        histórico, sem alterar nada. Retorna as divergências como
+        (carteira_id, ativo_id, (quantidade, custo) gravados,
+        (quantidade, custo) recalculados); None indica posição ausente.
+        """
+        session.flush()
+        recalculadas = {
+            chave: (quantidade, custo)
+            for chave, (quantidade, custo, _) in self._recalcular(
+                session, carteira_id
+            ).items()
+        }
+        query = select(
+            self.model.carteira_id,
+            self.model.ativo_id,
+            self.model.quantidade,
+            self.model.custo_medio,
+        )
+        if carteira_id is not None:
+            query = query.where(self.model.carteira_id == carteira_id)
+        gravadas = {(c, a): (q, cm) for c, a, q, cm in session.execute(query)}
+
+        divergencias = []
+        for chave in sorted(recalculadas.keys() | gravadas.keys()):
+            gravada, recalculada = gravadas.get(chave), recalculadas.get(chave)
+            if (
+                gravada is None
+                or recalculada is None
+                or not all(
+                    math.isclose(x, y, rel_tol=rel_tol, abs_tol=_QUANTIDADE_MINIMA)
+                    for x, y in zip(gravada, recalculada)
+                )
+            ):
+                divergencias.append((*chave, gravada, recalculada))
+        return divergencias
+
+    def posicoes_abertas(
+        self, session: Session, carteira_ids: Iterable[int] | None = None
+    ) -> list[tuple[int, str, float, float]]:
+        """
+        (carteira_id, ticker, quantidade, custo_medio) das posições com
+        quantidade, de várias carteiras em uma única query.
+        """
+        query = (
+            select(
+                self.model.carteira_id,
+                Ativo.ticker,
+                self.model.quantidade,
+                self.model.custo_medio,
+            )
+            .join(Ativo, self.model.ativo_id == Ativo.id)
+            .where(self.model.quantidade > 0)
+            .order_by(self.model.carteira_id, Ativo.ticker)
+        )
+        if carteira_ids is not None:
+            query = query.where(self.model.carteira_id.in_(list(carteira_ids)))
+        return [tuple(linha) for linha in session.execute(query)]
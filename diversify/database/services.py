@@ -48,12 +48,27 @@
 #
 # ==============================================================================
 
-from typing import List, Tuple
+import datetime
+import math
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
 
+import pandas as pd
 from db_nexus import DatabaseSessionManager
 
-from .models import TipoAtivo
-from .repositories import AtivoRepository
+from diversify.metrics import cronometro, log, log_erro
+
+from .models import TipoAtivo, TipoTransacao
+from .repositories import (
+    AtivoRepository,
+    CarteiraRepository,
+    MembroIndiceRepository,
+    PosicaoRepository,
+    PrecoHistoricoRepository,
+    ResultadoDiffIndice,
+    ResultadoUpsertAtivos,
+    TransacaoRepository,
+)
 
 
 class AtivoService:
@@ -64,32 +79,71 @@ class AtivoService:
     def __init__(self, session_manager: DatabaseSessionManager):
         self.session_manager = session_manager
         self.ativo_repo = AtivoRepository()
+        self.membro_repo = MembroIndiceRepository()
 
     def populate_assets(
         self,
         composition_data: list[dict],
         db_manager: DatabaseSessionManager,
         tipo: TipoAtivo,
-    ):
+    ) -> ResultadoUpsertAtivos:
         """
         Recebe dados de composição e popula a tabela 'ativos' no banco de dados.
+
+        Todos os ativos são sincronizados de uma vez, em uma única transação,
+        e o retorno traz quantos foram inseridos, atualizados ou mantidos.
         """
-        print("\n--- Populando/Atualizando tabela de ativos ---")
-        ativo_repo = AtivoRepository()
-        created_or_updated_assets = []
+        log("\n--- Populando/Atualizando tabela de ativos ---")
+
+        with cronometro("etapa", etapa="populate_assets"):
+            with db_manager.get_session() as session:
+                resultado = self.ativo_repo.bulk_upsert(session, composition_data, tipo)
 
-        with db_manager.get_session() as session:
-            for asset_info in composition_data:
-                ticker = asset_info["ticker"]
-                nome = asset_info["nome"]
+        log(
+            f"--- Tabela de ativos sincronizada: {resultado.inseridos} inseridos, "
+            f"{resultado.atualizados} atualizados, {resultado.inalterados} inalterados. ---"
+        )
+        return resultado
 
-                # 2. Usa o repositório para buscar ou criar o ativo
-                ativo = ativo_repo.find_or_create(session, ticker, nome, tipo)
-                created_or_updated_assets.append(ativo)
+    def record_index_composition(
+        self,
+        index_name: str,
+        composition_data: list[dict],
+        db_manager: DatabaseSessionManager,
+        data: datetime.date | None = None,
+    ) -> ResultadoDiffIndice:
+        """
+        Registra a composição do índice no histórico (`index_membership`),
+        vigente a partir de `data`: a data da carteira da B3 (ver
+        `Manifest.data_carteira`). Sem ela, vale a partir de hoje. Só as
+        entradas, saídas e mudanças de quantidade teórica geram linhas novas.
+        """
+        if data is None:
+            data = datetime.date.today()
+            log(f"⚠️ Carteira do {index_name} sem data; registrando como de hoje.")
+        with cronometro(
+            "etapa", etapa="index_composition"
+        ), db_manager.get_session() as session:
+            ids = self.ativo_repo.map_tickers_to_ids(
+                session, [item["ticker"] for item in composition_data]
+            )
+            composicao = {
+                ids[item["ticker"]]: (
+                    item.get("qtde_teorica"),
+                    item.get("participacao"),
+                )
+                for item in composition_data
+                if item["ticker"] in ids
+            }
+            resultado = self.membro_repo.apply_composition(
+                session, index_name, data, composicao
+            )
 
-        print(
-            f"--- Tabela de ativos populada/atualizada com {len(created_or_updated_assets)} registros. ---"
+        log(
+            f"--- Histórico do {index_name}: {resultado.entradas} entradas, "
+            f"{resultado.saidas} saídas, {resultado.alteracoes} alterações. ---"
         )
+        return resultado
 
     def get_all_asset_ids_and_tickers(self) -> List[Tuple[int, str]]:
         """
@@ -98,7 +152,7 @@ class AtivoService:
         Gerencia a sessão do banco de dados, garantindo que a conexão
         seja aberta e fechada corretamente.
         """
-        print("Serviço solicitado para buscar IDs e Tickers.")
+        log("Serviço solicitado para buscar IDs e Tickers.")
         # O 'with' statement do seu db_nexus cuida de TUDO:
         # 1. Abre a conexão e inicia a sessão.
         # 2. Executa o código dentro do bloco.
@@ -107,5 +161,173 @@ class AtivoService:
         with self.session_manager.get_session() as session:
             # Delega a busca ao repositório, que sabe como falar com o banco
             lista_de_ativos = self.ativo_repo.list_all_ids_and_tickers(session)
-            print(f"Encontrados {len(lista_de_ativos)} ativos.")
+            log(f"Encontrados {len(lista_de_ativos)} ativos.")
             return lista_de_ativos
+
+
+@dataclass(frozen=True)
+class PosicaoAtivo:
+    """Posição consolidada de um ativo em uma carteira."""
+
+    ticker: str
+    quantidade: float
+    custo_medio: float
+    preco_atual: float = math.nan  # NaN: ativo sem preço salvo
+
+    @property
+    def custo_total(self) -> float:
+        return self.quantidade * self.custo_medio
+
+    @property
+    def valor_mercado(self) -> float:
+        return self.quantidade * self.preco_atual
+
+    @property
+    def resultado(self) -> float:
+        return self.valor_mercado - self.custo_total
+
+
+class PortfolioService:
+    """
+    Contém a lógica de negócio das carteiras: registro de transações,
+    posições e valor de mercado.
+
+    As posições vêm da tabela materializada `posicoes`, atualizada a cada
+    transação; o histórico de transações só é relido para reconstruir ou
+    auditar as posições.
+    """
+
+    def __init__(self, session_manager: DatabaseSessionManager):
+        self.session_manager = session_manager
+        self.ativo_repo = AtivoRepository()
+        self.preco_repo = PrecoHistoricoRepository()
+        self.carteira_repo = CarteiraRepository()
+        self.transacao_repo = TransacaoRepository()
+        self.posicao_repo = PosicaoRepository()
+
+    def _ativo_id(self, session, ticker: str) -> int:
+        # Mesma normalização das buscas por ticker dos repositórios.
+        ticker = ticker.strip().upper()
+        ativo_id = self.ativo_repo.indice(session).por_ticker.get(ticker)
+        if ativo_id is None:
+            raise ValueError(f"Ativo não encontrado no banco: {ticker}")
+        return ativo_id
+
+    def _carteira_id(self, session, nome: str) -> int:
+        carteira = self.carteira_repo.find_by_nome(session, nome)
+        if carteira is None:
+            raise ValueError(f"Carteira não encontrada: {nome}")
+        return carteira.id
+
+    def adicionar_transacao_completa(
+        self,
+        nome_carteira: str,
+        ticker: str,
+        data: datetime.date,
+        tipo: TipoTransacao,
+        quantidade: float,
+        preco_unitario: float,
+        taxas: float = 0.0,
+    ) -> PosicaoAtivo:
+        """
+        Registra uma compra ou venda (criando a carteira, se preciso) e
+        atualiza a posição do ativo na mesma transação do banco. Retorna a
+        posição resultante.
+        """
+        ticker = ticker.strip().upper()
+        with self.session_manager.get_session() as session:
+            carteira = self.carteira_repo.find_or_create(session, nome_carteira)
+            transacao = self.transacao_repo.registrar(
+                session,
+                carteira.id,
+                self._ativo_id(session, ticker),
+                data,
+                tipo,
+                quantidade,
+                preco_unitario,
+                taxas,
+            )
+            posicao = self.posicao_repo.aplicar(session, transacao)
+            return PosicaoAtivo(ticker, posicao.quantidade, posicao.custo_medio)
+
+    def calcular_posicoes(
+        self, nome_carteira: str, as_of: datetime.date | None = None
+    ) -> List[PosicaoAtivo]:
+        """
+        Posições abertas de uma carteira, com o último fechamento de cada
+        ativo em `as_of` ou antes (por padrão, o último salvo).
+        """
+        with self.session_manager.get_session() as session:
+            carteira_id = self._carteira_id(session, nome_carteira)
+            linhas = self.posicao_repo.posicoes_abertas(session, [carteira_id])
+            precos = self.preco_repo.get_latest_prices(
+                session, [ticker for _, ticker, _, _ in linhas], as_of=as_of
+            )
+        return [
+            PosicaoAtivo(ticker, quantidade, custo_medio, float(precos[ticker]))
+            for _, ticker, quantidade, custo_medio in linhas
+        ]
+
+    def valor_de_mercado(
+        self,
+        carteiras: Iterable[str] | None = None,
+        as_of: datetime.date | None = None,
+    ) -> pd.Series:
+        """
+        Valor de mercado de várias carteiras (por padrão, todas), como uma
+        `pd.Series` indexada pelo nome da carteira. São duas leituras para
+        qualquer número de carteiras: as posições abertas e os fechamentos
+        (estes, do cache do processo). Ativos sem preço contam zero.
+        """
+        with self.session_manager.get_session() as session:
+            if carteiras is None:
+                nomes = {c.id: c.nome for c in self.carteira_repo.list_all(session)}
+            else:
+                nomes = {self._carteira_id(session, nome): nome for nome in carteiras}
+            linhas = self.posicao_repo.posicoes_abertas(session, nomes)
+            posicoes = pd.DataFrame(
+                linhas, columns=["carteira_id", "ticker", "quantidade", "custo_medio"]
+            )
+            precos = self.preco_repo.get_latest_prices(
+                session, posicoes["ticker"].unique(), as_of=as_of
+            )
+
+        valores = posicoes["quantidade"] * posicoes["ticker"].map(precos).fillna(0.0)
+        total = valores.groupby(posicoes["carteira_id"]).sum()
+        total = total.reindex(list(nomes), fill_value=0.0)
+        total.index = [nomes[carteira_id] for carteira_id in total.index]
+        return total.rename("valor_mercado")
+
+    def reconstruir_posicoes(self, nome_carteira: str | None = None) -> int:
+        """
+        Refaz as posições (de uma carteira ou de todas) a partir do histórico
+        de transações. Uso em auditorias e correções, não no dia a dia.
+        """
+        with cronometro("etapa", etapa="reconstruir_posicoes"):
+            with self.session_manager.get_session() as session:
+                carteira_id = (
+                    None
+                    if nome_carteira is None
+                    else self._carteira_id(session, nome_carteira)
+                )
+                total = self.posicao_repo.reconstruir(session, carteira_id)
+        log(f"--- {total} posições reconstruídas a partir das transações. ---")
+        return total
+
+    def auditar_posicoes(self, nome_carteira: str | None = None) -> list[tuple]:
+        """
+        Compara as posições gravadas com as refeitas a partir do histórico e
+        retorna as divergências (vazia se tudo confere).
+        """
+        with self.session_manager.get_session() as session:
+            carteira_id = (
+                None
+                if nome_carteira is None
+                else self._carteira_id(session, nome_carteira)
+            )
+            divergencias = self.posicao_repo.auditar(session, carteira_id)
+        if divergencias:
+            log_erro(f"⚠️ {len(divergencias)} posições divergem do histórico.")
+        else:
+            log("Posições conferem com o histórico de transações.")
+        return divergencias
@@ -0,0 +1,60 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/DATABASE/TIPOS.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Os tipos de ativo, de evento corporativo e de transação, e o tipo dos
+# ativos de cada índice da B3. Fica separado de `models.py` para que a linha
+# de comando possa decidir se há algo a sincronizar (hashes do manifesto) sem
+# importar o SQLAlchemy.
+#
+# ==============================================================================
+
+import enum
+
+
+# ==============================================================================
+# ENUMS
+# ==============================================================================
+# Colocamos o Enum aqui para ser usado pelo modelo da tabela.
+# Usar Enums em vez de strings evita erros de digitação e torna o código mais claro.
+class TipoAtivo(enum.Enum):
+    ACAO = "Ação"
+    FII = "Fundo Imobiliário"
+    FIAGRO = "FiAgro"
+    FIINFRA = "FI-Infra"
+    RENDA_FIXA = "Renda Fixa"
+    ETF_BR = "ETF Brasil"
+    ETF_EXTERIOR = "ETF Exterior"
+    BDR = "BDR"
+    CRIPTOMOEDA = "Criptomoeda"
+    INDICE = "Índice"
+
+
+class TipoEvento(enum.Enum):
+    """Eventos corporativos que ajustam a série de preços de um ativo."""
+
+    PROVENTO = "Provento"  # dividendo, JCP ou rendimento de FII, por cota
+    DESDOBRAMENTO = "Desdobramento"  # razão novas/antigas (grupamento < 1)
+
+
+class TipoTransacao(enum.Enum):
+    """Operações que alteram a posição de uma carteira em um ativo."""
+
+    COMPRA = "Compra"
+    VENDA = "Venda"
+
+
+# Tipo dos ativos de cada arquivo de composição da B3. Índices fora deste mapa
+# são compostos por ações.
+TIPO_POR_INDICE = {
+    "IFIX": TipoAtivo.FII,
+    "FIAGROS": TipoAtivo.FIAGRO,  # Chave para a lista de Fiagros
+    "FIINFRAS": TipoAtivo.FIINFRA,  # Índice oficial de FI-Infra
+    "INDEX": TipoAtivo.INDICE,
+}
+
+
+def tipo_do_indice(index_name: str) -> TipoAtivo:
+    """Tipo dos ativos que compõem o índice `index_name`."""
+    return TIPO_POR_INDICE.get(index_name, TipoAtivo.ACAO)
@@ -0,0 +1,154 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/FILE_WATCHER.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Detecta o fim de um download do navegador assim que ele acontece, em vez de
+# comparar `os.listdir` a cada segundo.
+#
+# O Firefox grava o download em um arquivo temporário `<nome>.csv.part` (e às
+# vezes cria um `<nome>.csv` vazio como marcador) e, ao terminar, renomeia o
+# `.part` para o nome final. Um download só é considerado concluído quando:
+#   - existe um `.csv` com o prefixo do índice, que não existia antes;
+#   - não há mais nenhum arquivo temporário (`.part`) correspondente;
+#   - o tamanho do arquivo é maior que zero e não muda por um breve intervalo.
+#
+# ARQUITETURA:
+# - DirectoryWatcher: Acorda o chamador a cada mudança no diretório. No Linux
+#   usa o inotify do kernel (via ctypes, sem dependências extras); nos demais
+#   sistemas, ou se o inotify não estiver disponível, faz polling curto.
+# - aguardar_csv_final(): A lógica de "download concluído" descrita acima.
+#
+# ==============================================================================
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from pathlib import Path
+
+# Eventos do inotify que indicam que um arquivo apareceu ou terminou de ser escrito.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+SUFIXOS_TEMPORARIOS = (".part", ".crdownload", ".tmp")
+
+
+def eh_temporario(nome: str) -> bool:
+    """Indica se o arquivo é um download ainda em andamento."""
+    return nome.lower().endswith(SUFIXOS_TEMPORARIOS)
+
+
+class DirectoryWatcher:
+    """
+    Observa um diretório e permite esperar pela próxima mudança nele.
+
+    Deve ser criado ANTES da ação que gera o arquivo (ex: o clique em
+    "Download"), para que nenhum evento seja perdido.
+    """
+
+    def __init__(self, directory: str | Path, intervalo_polling: float = 0.1):
+        self.directory = str(directory)
+        self.intervalo_polling = intervalo_polling
+        self._fd = None
+
+    def __enter__(self) -> "DirectoryWatcher":
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(
+                    ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+                )
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                mascara = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                if fd >= 0 and (
+                    libc.inotify_add_watch(fd, self.directory.encode(), mascara) >= 0
+                ):
+                    self._fd = fd
+                elif fd >= 0:
+                    os.close(fd)
+            except (OSError, AttributeError):
+                self._fd = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def usando_inotify(self) -> bool:
+        return self._fd is not None
+
+    def aguardar(self, timeout: float) -> bool:
+        """
+        Bloqueia até a próxima mudança no diretório ou até `timeout` segundos.
+        Retorna True se houve algum evento. No modo polling, apenas espera o
+        intervalo de polling e retorna True.
+        """
+        if self._fd is None:
+            time.sleep(max(0.0, min(timeout, self.intervalo_polling)))
+            return True
+
+        prontos, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not prontos:
+            return False
+        # Só precisamos saber que algo mudou: descartamos os eventos lidos.
+        try:
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+
+def aguardar_csv_final(
+    watcher: DirectoryWatcher,
+    index_name: str,
+    arquivos_anteriores: set[str],
+    timeout: float = 30,
+    estabilidade: float = 0.2,
+) -> Path | None:
+    """
+    Espera até que um `.csv` novo do índice esteja completo no diretório do
+    `watcher`. Retorna o caminho do arquivo ou None se o tempo acabar.
+    """
+    directory = Path(watcher.directory)
+    prefixo = index_name.lower()
+    limite = time.monotonic() + timeout
+    # nome -> (tamanho, instante em que esse tamanho foi visto pela primeira vez)
+    vistos: dict[str, tuple[int, float]] = {}
+
+    while True:
+        agora = time.monotonic()
+        nomes = os.listdir(directory)
+        temporarios = [n for n in nomes if eh_temporario(n)]
+
+        for nome in nomes:
+            if (
+                nome in arquivos_anteriores
+                or not nome.lower().endswith(".csv")
+                or not nome.lower().startswith(prefixo)
+                # Ainda existe um `.part` deste arquivo: a escrita não terminou.
+                or any(t.startswith(nome) for t in temporarios)
+            ):
+                continue
+            try:
+                tamanho = os.path.getsize(directory / nome)
+            except FileNotFoundError:
+                continue
+            anterior = vistos.get(nome)
+            if anterior is None or anterior[0] != tamanho:
+                vistos[nome] = (tamanho, agora)
+            elif tamanho > 0 and agora - anterior[1] >= estabilidade:
+                return directory / nome
+
+        restante = limite - agora
+        if restante <= 0:
+            return None
+        # Com um candidato em observação, acorda a tempo de confirmar a
+        # estabilidade mesmo que nenhum novo evento chegue.
+        watcher.aguardar(min(restante, estabilidade) if vistos else restante)
@@ -0,0 +1,134 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/MANIFEST.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Detecção de mudanças por hash de conteúdo ao longo do fluxo de composições:
+#
+#     CSV bruto da B3  ->  composição processada (JSON)  ->  sincronização no DB
+#
+# Para cada índice, o manifesto guarda o hash (SHA-256) da entrada de cada
+# etapa na última vez em que ela foi executada com sucesso. Se a entrada não
+# mudou, a etapa é pulada. Fora da janela de rebalanceamento da B3 as carteiras
+# quase nunca mudam, então uma execução completa fica praticamente de graça.
+#
+# O manifesto é um JSON em `processed_data/manifest.json`:
+#
+#     {"indices": {"IFIX": {"csv": "<sha256>", "composicao": "<sha256>",
+#                           "db:sqlite:///diversify.db": "<sha256>",
+#                           "data_carteira": "2025-09-02"}}}
+#
+# Além dos hashes, cada índice guarda a data da carteira (lida do título do
+# CSV) da composição salva em JSON: é a data de vigência usada no histórico
+# de composição do banco, mesmo quando o JSON é sincronizado dias depois.
+#
+# COMPONENTES:
+# - write_json_atomic(): Grava JSON via arquivo temporário + rename, para que
+#   um leitor nunca encontre um arquivo escrito pela metade.
+# - hash_arquivo() / hash_dados(): Hashes de conteúdo.
+# - Manifest: Leitura, consulta e gravação do manifesto.
+#
+# ==============================================================================
+
+import datetime as dt
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+# Nomes das etapas registradas no manifesto.
+ETAPA_CSV = "csv"
+ETAPA_COMPOSICAO = "composicao"
+# Chave da data da carteira (não é uma etapa nem um hash).
+DATA_CARTEIRA = "data_carteira"
+
+
+def etapa_db(db_url: str) -> str:
+    """Nome da etapa de sincronização com um banco específico."""
+    return f"db:{db_url}"
+
+
+def write_json_atomic(file_path: Path, data, **dump_kwargs):
+    """
+    Grava `data` como JSON em `file_path` de forma atômica: escreve em um
+    arquivo temporário no mesmo diretório e o renomeia por cima do destino.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def hash_arquivo(file_path: str | Path) -> str:
+    """SHA-256 do conteúdo bruto de um arquivo."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def hash_dados(*partes) -> str:
+    """SHA-256 de dados serializáveis em JSON (forma canônica, chaves ordenadas)."""
+    texto = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """
+    Manifesto de hashes por índice e por etapa.
+
+    As alterações ficam em memória até `save()`; assim uma execução grava o
+    arquivo uma única vez, e só se algo mudou.
+    """
+
+    def __init__(self, file_path: Path = Path("processed_data") / "manifest.json"):
+        self.file_path = Path(file_path)
+        self._alterado = False
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                self._dados = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._dados = {"indices": {}}
+
+    def get(self, index_name: str, etapa: str) -> str | None:
+        return self._dados["indices"].get(index_name, {}).get(etapa)
+
+    def inalterado(self, index_name: str, etapa: str, hash_atual: str) -> bool:
+        """Indica se a etapa já foi executada com exatamente esta entrada."""
+        return self.get(index_name, etapa) == hash_atual
+
+    def set(self, index_name: str, etapa: str, hash_atual: str):
+        indice = self._dados["indices"].setdefault(index_name, {})
+        if indice.get(etapa) != hash_atual:
+            indice[etapa] = hash_atual
+            self._alterado = True
+
+    def data_carteira(self, index_name: str) -> dt.date | None:
+        """Data da carteira da composição salva do índice (None se não houver)."""
+        data = self.get(index_name, DATA_CARTEIRA)
+        return dt.date.fromisoformat(data) if data else None
+
+    def set_data_carteira(self, index_name: str, data: dt.date):
+        self.set(index_name, DATA_CARTEIRA, data.isoformat())
+
+    def invalidate(self, index_name: str, etapa: str):
+        """Força a próxima execução da etapa (ex: após uma falha)."""
+        if self._dados["indices"].get(index_name, {}).pop(etapa, None) is not None:
+            self._alterado = True
+
+    def save(self):
+        if self._alterado:
+            write_json_atomic(self.file_path, self._dados, indent=2, sort_keys=True)
+            self._alterado = False
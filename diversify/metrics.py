@@ -0,0 +1,261 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/METRICS.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Instrumentação das execuções: cronômetros e contadores por etapa e por
+# chamada externa (navegador, download de cada índice, parsing dos CSVs,
+# queries no banco, chamadas ao yfinance, linhas gravadas).
+#
+# Ao final de uma execução, `gravar_resumo()` grava:
+#   - um resumo em JSON, legível por scripts de comparação;
+#   - um arquivo texto no formato do Prometheus (para o "textfile collector"
+#     do node_exporter), que permite alertar sobre regressões do job noturno.
+#
+# Também centraliza as mensagens de progresso: `log()` substitui o `print()`
+# e pode ser silenciado (modo silencioso, para o cron) com
+# `definir_silencioso(True)` ou com a variável de ambiente DIVERSIFY_QUIET=1.
+# Erros e avisos (`log_erro()`) são sempre exibidos, na saída de erro.
+#
+# COMO USAR:
+#     with cronometro("b3_download", indice="IBOV"):
+#         ...
+#     contar("precos_inseridos", 250)
+#     gravar_resumo(Path("data/metrics"))
+#
+# COMPONENTES:
+# - Metricas: O registro (seguro para várias threads) de contadores e tempos.
+# - cronometro() / contar() / registrar_tempo(): Atalhos para o registro global.
+# - instrumentar_banco(): Conta e cronometra as queries de um banco.
+# - log() / log_erro() / definir_silencioso(): Mensagens de progresso.
+# - gravar_resumo(): Resumo em JSON e no formato do Prometheus.
+#
+# ==============================================================================
+
+import datetime as dt
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from diversify.manifest import write_json_atomic
+
+PREFIXO_PROMETHEUS = "diversify"
+
+_silencioso = os.environ.get("DIVERSIFY_QUIET", "").lower() in ("1", "true", "sim")
+
+
+def definir_silencioso(silencioso: bool = True):
+    """Liga ou desliga as mensagens de progresso."""
+    global _silencioso
+    _silencioso = silencioso
+
+
+def log(*partes, **kwargs):
+    """Mensagem de progresso (omitida no modo silencioso)."""
+    if not _silencioso:
+        print(*partes, **kwargs)
+
+
+def log_erro(*partes, **kwargs):
+    """Erro ou aviso: sempre exibido, na saída de erro."""
+    print(*partes, file=sys.stderr, **kwargs)
+
+
+def _chave(nome: str, labels: dict) -> tuple:
+    return (nome, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _escapar_label(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metricas:
+    """Registro de contadores e tempos de uma execução."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta tudo e marca o início de uma nova execução."""
+        with self._lock:
+            self.inicio = dt.datetime.now().astimezone()
+            self._inicio_perf = time.perf_counter()
+            self.contadores: dict[tuple, float] = {}
+            # chave -> [chamadas, tempo total, tempo máximo]
+            self.tempos: dict[tuple, list] = {}
+
+    def contar(self, nome: str, valor: float = 1, **labels):
+        chave = _chave(nome, labels)
+        with self._lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def registrar_tempo(self, nome: str, segundos: float, **labels):
+        chave = _chave(nome, labels)
+        with self._lock:
+            registro = self.tempos.setdefault(chave, [0, 0.0, 0.0])
+            registro[0] += 1
+            registro[1] += segundos
+            registro[2] = max(registro[2], segundos)
+
+    @contextmanager
+    def cronometro(self, nome: str, **labels):
+        """Mede o bloco. Se ele falhar, conta também `<nome>_falhas`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.contar(f"{nome}_falhas", **labels)
+            raise
+        finally:
+            self.registrar_tempo(nome, time.perf_counter() - inicio, **labels)
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {
+                "inicio": self.inicio.isoformat(timespec="seconds"),
+                "duracao_segundos": round(time.perf_counter() - self._inicio_perf, 4),
+                "contadores": [
+                    {"nome": nome, "labels": dict(labels), "valor": valor}
+                    for (nome, labels), valor in sorted(self.contadores.items())
+                ],
+                "tempos": [
+                    {
+                        "nome": nome,
+                        "labels": dict(labels),
+                        "chamadas": chamadas,
+                        "total_segundos": round(total, 6),
+                        "max_segundos": round(maximo, 6),
+                    }
+                    for (nome, labels), (chamadas, total, maximo) in sorted(
+                        self.tempos.items()
+                    )
+                ],
+            }
+
+    def formato_prometheus(self) -> str:
+        """O resumo no formato de exposição em texto do Prometheus."""
+        resumo = self.resumo()
+        linhas = []
+
+        def nome_metrica(nome: str) -> str:
+            return re.sub(r"[^a-zA-Z0-9_]", "_", f"{PREFIXO_PROMETHEUS}_{nome}")
+
+        def amostra(nome: str, labels: dict, valor: float):
+            texto = ",".join(f'{k}="{_escapar_label(v)}"' for k, v in labels.items())
+            linhas.append(f"{nome}{{{texto}}} {valor}" if texto else f"{nome} {valor}")
+
+        # As amostras de uma mesma métrica precisam ficar agrupadas.
+        grupos: dict[str, list] = {}
+        for c in resumo["contadores"]:
+            grupos.setdefault(c["nome"], []).append(c)
+        for nome, amostras in grupos.items():
+            metrica = nome_metrica(f"{nome}_total")
+            linhas.append(f"# TYPE {metrica} counter")
+            for c in amostras:
+                amostra(metrica, c["labels"], c["valor"])
+
+        grupos = {}
+        for t in resumo["tempos"]:
+            grupos.setdefault(t["nome"], []).append(t)
+        for nome, amostras in grupos.items():
+            metrica = nome_metrica(f"{nome}_seconds")
+            linhas.append(f"# TYPE {metrica} summary")
+            for t in amostras:
+                amostra(f"{metrica}_sum", t["labels"], t["total_segundos"])
+                amostra(f"{metrica}_count", t["labels"], t["chamadas"])
+            linhas.append(f"# TYPE {metrica}_max gauge")
+            for t in amostras:
+                amostra(f"{metrica}_max", t["labels"], t["max_segundos"])
+
+        for nome, valor in (
+            ("execucao_inicio_timestamp_seconds", int(self.inicio.timestamp())),
+            ("execucao_duracao_seconds", resumo["duracao_segundos"]),
+        ):
+            linhas.append(f"# TYPE {nome_metrica(nome)} gauge")
+            amostra(nome_metrica(nome), {}, valor)
+        return "\n".join(linhas) + "\n"
+
+
+# Registro global usado por todo o pacote.
+metricas = Metricas()
+cronometro = metricas.cronometro
+contar = metricas.contar
+registrar_tempo = metricas.registrar_tempo
+
+
+def instrumentar_banco(db_manager):
+    """
+    Conta e cronometra todas as queries do banco do `db_manager` (um
+    `DatabaseSessionManager`), agrupadas pelo tipo do comando (SELECT,
+    INSERT, UPDATE, ...). Retorna o Engine instrumentado.
+    """
+    # Importado aqui para que módulos leves (ex: o parser da B3) possam usar
+    # `log`/`cronometro` sem carregar o SQLAlchemy.
+    from sqlalchemy import event
+
+    with db_manager.get_session() as session:
+        engine = session.get_bind()
+    if getattr(engine, "_instrumentado", False):
+        return engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_inicio_query", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def depois(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["_inicio_query"].pop()
+        comando = statement.lstrip().split(None, 1)[0].upper() if statement else "?"
+        registrar_tempo("db_query", time.perf_counter() - inicio, comando=comando)
+
+    @event.listens_for(engine, "handle_error")
+    def erro(contexto):
+        pilha = (
+            contexto.connection.info.get("_inicio_query")
+            if contexto.connection
+            else None
+        )
+        if pilha:
+            pilha.pop()
+        contar("db_query_falhas")
+
+    engine._instrumentado = True
+    return engine
+
+
+def _gravar_texto_atomico(file_path: Path, texto: str):
+    fd, temp_path = tempfile.mkstemp(
+        dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(texto)
+        # O textfile collector lê arquivos com permissão de leitura comum.
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def gravar_resumo(
+    directory: Path = Path("data") / "metrics", nome_execucao: str = "diversify"
+) -> tuple[Path, Path]:
+    """
+    Grava o resumo da execução em `<directory>/<nome_execucao>.json` e
+    `<directory>/<nome_execucao>.prom`. Retorna os dois caminhos.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    json_path = directory / f"{nome_execucao}.json"
+    prom_path = directory / f"{nome_execucao}.prom"
+    write_json_atomic(json_path, metricas.resumo(), indent=2, ensure_ascii=False)
+    _gravar_texto_atomico(prom_path, metricas.formato_prometheus())
+    log(f"📊 Métricas da execução gravadas em {json_path} e {prom_path}.")
+    return json_path, prom_path
@@ -0,0 +1,486 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/PIPELINE.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Orquestra o fluxo diário completo em um pipeline assíncrono:
+#
+#   baixar_indice -> processar -> sincronizar -> baixar_cotacoes -> gravar_cotacoes
+#
+# Antes, cada etapa (`B3Service.refresh_index`, `tasks/b3_insert_db.py`,
+# `tasks/quotes_update.py`) esperava a anterior terminar por completo. Aqui
+# cada item segue adiante assim que fica pronto: o CSV de um índice é
+# processado, seus ativos são gravados no banco e as cotações deles entram na
+# fila de download enquanto outros índices ainda estão sendo baixados. O tempo
+# total fica próximo ao da etapa mais lenta, e não à soma de todas.
+#
+# ARQUITETURA:
+# - Pipeline: Um DAG genérico de etapas ligadas por filas `asyncio.Queue`
+#   limitadas (uma etapa lenta segura as anteriores, sem acumular memória).
+#   O trabalho de cada etapa é bloqueante (rede, Selenium, parsing,
+#   SQLAlchemy) e roda em um executor; o loop de eventos só move os itens.
+# - PipelineDiario: As etapas concretas do fluxo diário, com três executores:
+#   rede (downloads), cpu (parsing) e banco (uma única thread, pois o SQLite
+#   aceita um escritor por vez).
+#
+# COMPONENTES:
+# - Etapa / EstatisticasEtapa: Definição e números de uma etapa.
+# - Pipeline: Monta e executa o DAG.
+# - PipelineDiario / ResultadoPipeline: O fluxo diário.
+#
+# ==============================================================================
+
+import asyncio
+import datetime as dt
+import json
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import requests
+from db_nexus.session import DatabaseSessionManager
+from requests.adapters import HTTPAdapter
+
+from diversify.b3_services import B3Service
+from diversify.calendario_b3 import ultima_sessao_encerrada
+from diversify.database.models import Ativo, tipo_do_indice
+from diversify.database.repositories import AtivoRepository, PrecoHistoricoRepository
+from diversify.database.services import AtivoService
+from diversify.manifest import (
+    ETAPA_CSV,
+    Manifest,
+    etapa_db,
+    hash_arquivo,
+    hash_dados,
+)
+from diversify.metrics import contar, log, log_erro, registrar_tempo
+from diversify.quote_cache import CacheCotacoes
+from diversify.quotes_fetcher import (
+    FetchStats,
+    LoteCotacoes,
+    QuoteFetcher,
+    extrair_eventos,
+    extrair_precos,
+)
+from diversify.quotes_services import QuoteService
+
+# Marca de fim de fila: cada trabalhador de uma etapa recebe uma.
+_FIM = object()
+
+
+@dataclass
+class Etapa:
+    """
+    Uma etapa do pipeline. `funcao` recebe um item e retorna a lista de itens
+    a repassar para as etapas seguintes (ou None).
+    """
+
+    nome: str
+    funcao: Callable[[Any], Iterable | None]
+    executor: Executor
+    concorrencia: int = 1
+    tamanho_fila: int = 16
+
+
+@dataclass
+class EstatisticasEtapa:
+    processados: int = 0
+    emitidos: int = 0
+    falhas: int = 0
+    tempo_ocupado: float = 0.0  # soma do tempo gasto na função da etapa
+    # Instantes (em segundos desde o início do pipeline) do primeiro item
+    # iniciado e do último concluído: mostram a sobreposição entre etapas.
+    inicio: float | None = None
+    fim: float | None = None
+
+    def resumo(self) -> str:
+        janela = ""
+        if self.inicio is not None:
+            janela = f" | ativa de {self.inicio:.2f}s a {self.fim:.2f}s"
+        return (
+            f"{self.processados} itens, {self.emitidos} emitidos, "
+            f"{self.falhas} falhas, {self.tempo_ocupado:.2f}s ocupada{janela}"
+        )
+
+
+class Pipeline:
+    """
+    DAG de etapas ligadas por filas limitadas.
+
+    As etapas devem ser adicionadas depois das etapas de que dependem, o que
+    garante que o grafo não tem ciclos. Uma etapa termina quando todas as
+    anteriores (e a alimentação externa) terminaram e sua fila esvaziou.
+    """
+
+    def __init__(self):
+        self.etapas: dict[str, Etapa] = {}
+        self._anteriores: dict[str, list[str]] = {}
+        self._seguintes: dict[str, list[str]] = {}
+        self.estatisticas: dict[str, EstatisticasEtapa] = {}
+
+    def adicionar(self, etapa: Etapa, depois_de: Iterable[str] = ()) -> "Pipeline":
+        depois_de = list(depois_de)
+        for nome in depois_de:
+            if nome not in self.etapas:
+                raise ValueError(f"Etapa '{nome}' precisa ser adicionada antes.")
+        self.etapas[etapa.nome] = etapa
+        self._anteriores[etapa.nome] = depois_de
+        self._seguintes[etapa.nome] = []
+        for nome in depois_de:
+            self._seguintes[nome].append(etapa.nome)
+        return self
+
+    async def executar(self, entradas: dict[str, Iterable]) -> float:
+        """
+        Executa o pipeline alimentando cada etapa com os itens de
+        `entradas[nome]` (normalmente só a primeira). Retorna o tempo total.
+        """
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        self.estatisticas = {nome: EstatisticasEtapa() for nome in self.etapas}
+        filas = {
+            nome: asyncio.Queue(maxsize=etapa.tamanho_fila)
+            for nome, etapa in self.etapas.items()
+        }
+        # Produtores ainda ativos de cada etapa (+1: a alimentação externa).
+        produtores = {nome: len(ant) + 1 for nome, ant in self._anteriores.items()}
+
+        async def encerrar_produtor(nome: str):
+            produtores[nome] -= 1
+            if produtores[nome] == 0:
+                for _ in range(self.etapas[nome].concorrencia):
+                    await filas[nome].put(_FIM)
+
+        async def trabalhador(etapa: Etapa):
+            stats = self.estatisticas[etapa.nome]
+            while True:
+                item = await filas[etapa.nome].get()
+                if item is _FIM:
+                    return
+                inicio_item = time.perf_counter()
+                if stats.inicio is None:
+                    stats.inicio = inicio_item - inicio
+                try:
+                    saidas = await loop.run_in_executor(
+                        etapa.executor, etapa.funcao, item
+                    )
+                except Exception as e:
+                    stats.falhas += 1
+                    contar("pipeline_falhas", etapa=etapa.nome)
+                    log_erro(f"❌ Erro na etapa '{etapa.nome}': {e}")
+                    continue
+                finally:
+                    fim_item = time.perf_counter()
+                    stats.fim = fim_item - inicio
+                    stats.tempo_ocupado += fim_item - inicio_item
+                    registrar_tempo(
+                        "pipeline_item", fim_item - inicio_item, etapa=etapa.nome
+                    )
+                stats.processados += 1
+                for saida in saidas or ():
+                    stats.emitidos += 1
+                    for destino in self._seguintes[etapa.nome]:
+                        await filas[destino].put(saida)
+
+        async def rodar_etapa(etapa: Etapa):
+            await asyncio.gather(
+                *(trabalhador(etapa) for _ in range(etapa.concorrencia))
+            )
+            for destino in self._seguintes[etapa.nome]:
+                await encerrar_produtor(destino)
+
+        async def alimentar():
+            for nome in self.etapas:
+                for item in entradas.get(nome, ()):
+                    await filas[nome].put(item)
+                await encerrar_produtor(nome)
+
+        await asyncio.gather(
+            alimentar(), *(rodar_etapa(etapa) for etapa in self.etapas.values())
+        )
+        return time.perf_counter() - inicio
+
+
+@dataclass
+class ResultadoPipeline:
+    """Números de uma execução do fluxo diário."""
+
+    etapas: dict[str, EstatisticasEtapa]
+    cotacoes: FetchStats
+    tempo_total: float
+    soma_etapas: float = field(init=False)
+
+    def __post_init__(self):
+        self.soma_etapas = sum(e.tempo_ocupado for e in self.etapas.values())
+
+
+class PipelineDiario:
+    """
+    O fluxo diário completo (composições -> banco -> cotações) como pipeline.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseSessionManager,
+        db_url: str = "sqlite:///diversify.db",
+        b3_service: B3Service | None = None,
+        downloader=None,
+        download_dir: Path = Path("data"),
+        processed_data_dir: Path = Path("processed_data"),
+        downloads_simultaneos: int = 5,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        batch_size: int = 50,
+        cache: CacheCotacoes | None = None,
+    ):
+        self.db_manager = db_manager
+        self.db_url = db_url
+        self.b3_service = b3_service or B3Service()
+        self.download_dir = Path(download_dir).resolve()
+        self.processed_data_dir = Path(processed_data_dir)
+        self.downloads_simultaneos = downloads_simultaneos
+        self.max_workers = max_workers
+        self.fetcher = QuoteFetcher(
+            downloader=downloader,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+            batch_size=batch_size,
+            cache=cache,
+        )
+        self.ativo_service = AtivoService(session_manager=db_manager)
+        self.quote_service = QuoteService()
+        self.ativo_repo = AtivoRepository()
+        self.preco_repo = PrecoHistoricoRepository()
+        # Os downloads HTTP dos índices são simultâneos, mas o recurso ao
+        # navegador (um Firefox por chamada) passa por aqui um de cada vez.
+        self._navegador = threading.Lock()
+
+    # --- ETAPAS ---------------------------------------------------------------
+
+    def baixar_indice(self, item: tuple[str, str]) -> list:
+        """(índice, URL da página) -> (índice, CSV do dia)."""
+        index_name, url = item
+        file_path = self.b3_service.find_todays_file_for_index(
+            index_name, self.download_dir
+        )
+        if file_path:
+            log(f"✅ Arquivo para '{index_name}' já existe hoje. Pulando download.")
+        else:
+            file_path = self.b3_service.download_b3_file_http(
+                self._http, index_name, self.download_dir
+            )
+        if not file_path:
+            log_erro(f"⚠️ Download HTTP do {index_name} falhou. Usando o navegador.")
+            with self._navegador:
+                file_path = self.b3_service.refresh_indices_selenium(
+                    {index_name: url}, self.download_dir
+                ).get(index_name)
+        return [(index_name, file_path)] if file_path else []
+
+    def processar(self, item: tuple[str, str]) -> list:
+        """(índice, CSV) -> (índice, composição), regravando o JSON se mudou."""
+        index_name, file_path = item
+        hash_csv = hash_arquivo(file_path)
+        json_path = self.processed_data_dir / f"{index_name}_composition.json"
+        if self.manifest.inalterado(index_name, ETAPA_CSV, hash_csv) and (
+            json_path.exists()
+        ):
+            log(f"Arquivo do {index_name} não mudou. Usando a composição salva.")
+            return [(index_name, self._ler_json(json_path))]
+
+        lida = self.b3_service.ler_composicao(file_path, index_name)
+        if not lida:
+            log_erro(f"⚠️ Nenhuma composição para salvar para o índice {index_name}.")
+            return []
+        composicao = lida.to_records()
+        self.b3_service.save_composition_to_json(
+            index_name,
+            composicao,
+            self.processed_data_dir,
+            self.manifest,
+            data_carteira=lida.data,
+        )
+        if json_path.exists():
+            self.manifest.set(index_name, ETAPA_CSV, hash_csv)
+        return [(index_name, composicao)]
+
+    def sincronizar(self, item: tuple[str, list[dict]]) -> list[LoteCotacoes]:
+        """
+        (índice, composição) -> lotes de cotações a baixar. Grava os ativos e o
+        histórico do índice (se a composição mudou) e planeja as cotações só
+        dos ativos do índice que ainda não foram agendados por outro índice.
+        """
+        index_name, composicao = item
+        tipo = tipo_do_indice(index_name)
+        json_path = self.processed_data_dir / f"{index_name}_composition.json"
+        hash_sync = hash_dados(hash_arquivo(json_path), tipo.name)
+        etapa = etapa_db(self.db_url)
+        if self._db_vazio or not self.manifest.inalterado(index_name, etapa, hash_sync):
+            self.ativo_service.populate_assets(composicao, self.db_manager, tipo)
+            self.ativo_service.record_index_composition(
+                index_name,
+                composicao,
+                self.db_manager,
+                data=self.manifest.data_carteira(index_name),
+            )
+            self.manifest.set(index_name, etapa, hash_sync)
+
+        with self.db_manager.get_session() as session:
+            ids = self.ativo_repo.map_tickers_to_ids(
+                session, [ativo["ticker"] for ativo in composicao]
+            )
+            novos = set(ids.values()) - self._agendados
+            self._agendados |= novos
+            if not novos:
+                log(f"{index_name}: ativos já agendados por outros índices.")
+                return []
+            plano = self.preco_repo.plan_updates(
+                session, ultima_sessao=self.ultima_sessao, ativo_ids=novos
+            )
+
+        grupos = {
+            inicio: {
+                self.quote_service._get_yahoo_finance_ticker(i.ticker): i.ativo_id
+                for i in itens
+            }
+            for inicio, itens in plano.grupos.items()
+        }
+        lotes = self.fetcher.montar_lotes(grupos, self.fim)
+        log(f"{index_name}: {len(lotes)} lotes de cotações na fila.")
+        return lotes
+
+    def baixar_cotacoes(self, lote: LoteCotacoes) -> list:
+        """
+        Lote -> (lote, preços, eventos corporativos). Lotes sem dados também
+        seguem adiante, para que os ativos deles sejam marcados como brutos.
+        """
+        historico = self.fetcher.baixar_lote(lote, self.stats)
+        return [
+            (lote, extrair_precos(historico, lote), extrair_eventos(historico, lote))
+        ]
+
+    def gravar_cotacoes(
+        self, item: tuple[LoteCotacoes, list[dict], list[dict]]
+    ) -> None:
+        lote, precos, eventos = item
+        with self.db_manager.get_session() as session:
+            resultado = self.quote_service.gravar_cotacoes(
+                session,
+                precos,
+                eventos,
+                modo="atualizar",
+                marcar_brutos=True,
+                ativo_ids=lote.tickers.values(),
+            )
+        self.stats.linhas_inseridas += resultado.novos
+
+    # --- EXECUÇÃO -------------------------------------------------------------
+
+    def _ler_json(self, json_path: Path) -> list[dict]:
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _montar(self, rede: Executor, cpu: Executor, banco: Executor) -> Pipeline:
+        return (
+            Pipeline()
+            .adicionar(
+                Etapa(
+                    "baixar_indice",
+                    self.baixar_indice,
+                    rede,
+                    self.downloads_simultaneos,
+                )
+            )
+            .adicionar(Etapa("processar", self.processar, cpu, 2), ["baixar_indice"])
+            .adicionar(Etapa("sincronizar", self.sincronizar, banco), ["processar"])
+            .adicionar(
+                Etapa(
+                    "baixar_cotacoes",
+                    self.baixar_cotacoes,
+                    rede,
+                    self.max_workers,
+                ),
+                ["sincronizar"],
+            )
+            .adicionar(
+                Etapa("gravar_cotacoes", self.gravar_cotacoes, banco),
+                ["baixar_cotacoes"],
+            )
+        )
+
+    def executar(self, baixar_indices: bool | None = None) -> ResultadoPipeline:
+        """
+        Executa o fluxo diário. Com `baixar_indices` False (ou None fora da
+        janela de rebalanceamento da B3), as composições já processadas em
+        `processed_data/` alimentam diretamente a etapa de sincronização.
+        """
+        log("==========================================================")
+        log("🚀 INICIANDO PIPELINE DIÁRIO")
+        log("==========================================================")
+        if baixar_indices is None:
+            baixar_indices = self.b3_service.moment_index()
+
+        # Só pregões já encerrados entram nas janelas de cotações.
+        self.ultima_sessao = ultima_sessao_encerrada()
+        self.fim = self.ultima_sessao + dt.timedelta(days=1)
+        self.stats = FetchStats()
+        self.manifest = Manifest(self.processed_data_dir / "manifest.json")
+        self._agendados: set[int] = set()
+        with self.db_manager.get_session() as session:
+            self._db_vazio = session.query(Ativo.id).first() is None
+
+        if baixar_indices:
+            os.makedirs(self.download_dir, exist_ok=True)
+            entradas = {"baixar_indice": self.b3_service._load_indices_config().items()}
+        else:
+            entradas = {
+                "sincronizar": [
+                    (
+                        json_path.stem.replace("_composition", ""),
+                        self._ler_json(json_path),
+                    )
+                    for json_path in sorted(
+                        self.processed_data_dir.glob("*_composition.json")
+                    )
+                ]
+            }
+
+        n_rede = self.downloads_simultaneos + self.max_workers
+        with (
+            requests.Session() as self._http,
+            ThreadPoolExecutor(n_rede, thread_name_prefix="rede") as rede,
+            ThreadPoolExecutor(2, thread_name_prefix="cpu") as cpu,
+            ThreadPoolExecutor(1, thread_name_prefix="banco") as banco,
+        ):
+            adapter = HTTPAdapter(pool_maxsize=self.downloads_simultaneos)
+            self._http.mount("https://", adapter)
+            self._http.mount("http://", adapter)
+
+            pipeline = self._montar(rede, cpu, banco)
+            tempo_total = asyncio.run(pipeline.executar(entradas))
+
+        self.manifest.save()
+        self.stats.ativos = len(self._agendados)
+        cotacoes = pipeline.estatisticas["baixar_cotacoes"]
+        self.stats.lotes = cotacoes.processados + cotacoes.falhas
+        self.stats.falhas = cotacoes.falhas
+        self.stats.tempo_total = tempo_total
+        resultado = ResultadoPipeline(pipeline.estatisticas, self.stats, tempo_total)
+        registrar_tempo("etapa", tempo_total, etapa="pipeline_diario")
+
+        log("\n--- RESUMO DO PIPELINE ---")
+        for nome, etapa in resultado.etapas.items():
+            log(f"{nome:>16}: {etapa.resumo()}")
+        log(
+            f"Tempo total: {resultado.tempo_total:.2f}s "
+            f"(soma das etapas: {resultado.soma_etapas:.2f}s)"
+        )
+        log(f"Cotações: {self.stats.resumo()}")
+        log("\n==========================================================")
+        log("🏁 PIPELINE DIÁRIO FINALIZADO.")
+        log("==========================================================")
+        return resultado
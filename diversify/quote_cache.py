@@ -0,0 +1,190 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/QUOTE_CACHE.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Cache em disco das respostas do provedor de cotações (yfinance), por ativo.
+#
+# Quando uma atualização falha no meio, ou quando duas tarefas buscam as
+# mesmas janelas no mesmo dia, os mesmos intervalos seriam baixados de novo.
+# Com o cache, cada série (ticker, intervalo, início, fim, ajuste) baixada
+# fica gravada em disco e a repetição vira uma leitura local, sem consumir a
+# cota de requisições do Yahoo.
+#
+# Validade das entradas:
+#   - janelas que terminam antes de hoje (só pregões encerrados): validade
+#     longa, pois esses preços não mudam mais;
+#   - janelas que incluem hoje (ou buscas por período, que trazem o pregão
+#     em andamento): validade curta.
+#
+# O tamanho total é limitado; ao passar do limite, as entradas usadas há mais
+# tempo são removidas (LRU, pela data de modificação dos arquivos, que é
+# renovada a cada leitura).
+#
+# COMPONENTES:
+# - ChaveCotacao: A chave de uma série no cache.
+# - CacheCotacoes: Leitura, gravação e remoção das entradas.
+#
+# ==============================================================================
+
+import datetime as dt
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from diversify.metrics import log_erro
+
+
+@dataclass(frozen=True)
+class ChaveCotacao:
+    """Identifica uma série baixada do provedor."""
+
+    ticker: str
+    intervalo: str  # ex: "1d"
+    inicio: str  # data ISO ou "period=<período>"
+    fim: str  # data ISO (exclusiva)
+    ajustado: bool
+
+    def nome_arquivo(self) -> str:
+        texto = "|".join(
+            [self.ticker, self.intervalo, self.inicio, self.fim, str(self.ajustado)]
+        )
+        return hashlib.sha256(texto.encode()).hexdigest() + ".pkl"
+
+
+class CacheCotacoes:
+    """
+    Cache de séries de cotações em disco, com validade por entrada e limite
+    de tamanho (LRU). Seguro para uso por várias threads.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = Path("data") / "cache_cotacoes",
+        tamanho_maximo: int = 512 * 1024 * 1024,
+        ttl_fechado: dt.timedelta = dt.timedelta(days=30),
+        ttl_aberto: dt.timedelta = dt.timedelta(minutes=15),
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl_fechado = ttl_fechado
+        self.ttl_aberto = ttl_aberto
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        self._tamanho = sum(
+            e.stat().st_size
+            for e in os.scandir(self.directory)
+            if e.name.endswith(".pkl")
+        )
+
+    def ttl_para(
+        self, fim: dt.date | None, hoje: dt.date | None = None
+    ) -> dt.timedelta:
+        """Validade de uma janela com fim exclusivo `fim` (None = até agora)."""
+        hoje = hoje or dt.date.today()
+        if fim is None or fim > hoje:
+            return self.ttl_aberto
+        return self.ttl_fechado
+
+    def get(self, chave: ChaveCotacao) -> pd.DataFrame | None:
+        """
+        Retorna a série guardada ou None se não houver entrada válida. Uma
+        entrada que não pode ser lida (arquivo truncado ou corrompido, pickle
+        de outra versão do pandas) é apagada e conta como falta.
+        """
+        caminho = self.directory / chave.nome_arquivo()
+        try:
+            with open(caminho, "rb") as f:
+                expira, dados = pickle.load(f)
+            expirada = expira < time.time()
+        except FileNotFoundError:
+            with self._lock:
+                self.faltas += 1
+            return None
+        except Exception as e:
+            log_erro(f"⚠️ Entrada inválida no cache de cotações ({caminho.name}): {e}")
+            self._remover(caminho)
+            with self._lock:
+                self.faltas += 1
+            return None
+
+        if expirada:
+            self._remover(caminho)
+            with self._lock:
+                self.faltas += 1
+            return None
+
+        # Renova a data de modificação: é ela que define a ordem do LRU.
+        try:
+            os.utime(caminho)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.acertos += 1
+        return dados
+
+    def put(self, chave: ChaveCotacao, dados: pd.DataFrame, ttl: dt.timedelta):
+        """Grava a série (de forma atômica) e aplica o limite de tamanho."""
+        caminho = self.directory / chave.nome_arquivo()
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(
+                    (time.time() + ttl.total_seconds(), dados),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            tamanho_anterior = caminho.stat().st_size if caminho.exists() else 0
+            os.replace(temp_path, caminho)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            self._tamanho += caminho.stat().st_size - tamanho_anterior
+            if self._tamanho > self.tamanho_maximo:
+                self._despejar()
+
+    def _remover(self, caminho: Path):
+        try:
+            tamanho = caminho.stat().st_size
+            caminho.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._tamanho -= tamanho
+
+    def _despejar(self):
+        """Remove as entradas menos usadas até voltar a 90% do limite."""
+        entradas = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".pkl")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        alvo = int(self.tamanho_maximo * 0.9)
+        for entrada in entradas:
+            if self._tamanho <= alvo:
+                break
+            try:
+                tamanho = entrada.stat().st_size
+                os.unlink(entrada.path)
+            except FileNotFoundError:
+                continue
+            self._tamanho -= tamanho
+
+    def limpar(self):
+        """Remove todas as entradas."""
+        with self._lock:
+            for entrada in os.scandir(self.directory):
+                if entrada.name.endswith(".pkl"):
+                    os.unlink(entrada.path)
+            self._tamanho = 0
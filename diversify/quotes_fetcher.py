@@ -0,0 +1,389 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/QUOTES_FETCHER.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Motor de download de cotações usado pelo `QuoteService`. Em vez de baixar um
+# ativo por vez (com uma pausa fixa entre as chamadas), os ativos são
+# agrupados em LOTES que compartilham a mesma janela de busca e cada lote é
+# baixado com uma única chamada multi-ticker ao `yfinance`.
+#
+# ARQUITETURA:
+#
+# 1. TokenBucket:
+#    - Limitador de taxa configurado em requisições por segundo. Substitui o
+#      antigo `time.sleep(1)` e é compartilhado por todas as threads.
+#
+# 2. LoteCotacoes:
+#    - Um grupo de tickers com a mesma data inicial (ou sem data, quando o
+#      ativo ainda não tem histórico e buscamos o período completo).
+#
+# 3. QuoteFetcher:
+#    - Monta os lotes e os executa em um pool de threads com um número
+#      limitado de downloads simultâneos. Cada resultado é entregue ao
+#      chamador (na thread principal) assim que fica pronto, o que permite
+#      gravar no banco em transações curtas, uma por lote.
+#    - Os fechamentos vêm brutos (`auto_adjust=False`), acompanhados dos
+#      proventos e desdobramentos (`actions=True`); o ajuste é calculado na
+#      leitura (`database/ajustes.py`).
+#
+# 4. FetchStats:
+#    - Métricas da execução (tempo total, requisições, linhas inseridas),
+#      usadas para comparar com o caminho sequencial antigo.
+#
+# 5. Cache (opcional, `quote_cache.py`):
+#    - Com um `CacheCotacoes`, cada ticker do lote é procurado no cache em
+#      disco antes do download; só os que faltam são pedidos ao provedor, e
+#      um lote inteiramente em cache não consome a cota de requisições.
+#
+# ==============================================================================
+
+import datetime as dt
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable
+
+import pandas as pd
+
+from diversify.database.tipos import TipoEvento
+from diversify.metrics import contar, cronometro, log_erro
+from diversify.quote_cache import CacheCotacoes, ChaveCotacao
+
+
+class TokenBucket:
+    """
+    Limitador de taxa do tipo "token bucket", seguro para múltiplas threads.
+
+    A cada segundo são gerados `taxa_por_segundo` tokens, até o limite de
+    `capacidade`. Cada requisição consome um token; se não houver token
+    disponível, a thread espera apenas o tempo necessário para o próximo.
+    """
+
+    def __init__(self, taxa_por_segundo: float, capacidade: int | None = None):
+        if taxa_por_segundo <= 0:
+            raise ValueError("A taxa do limitador deve ser maior que zero.")
+        self.taxa = taxa_por_segundo
+        self.capacidade = capacidade or max(1, int(taxa_por_segundo))
+        self._tokens = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até que um token esteja disponível e o consome."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(
+                    self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa
+                )
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+@dataclass
+class LoteCotacoes:
+    """
+    Um lote de ativos baixados em uma única requisição.
+
+    `inicio` igual a None indica que os ativos ainda não têm histórico e o
+    período completo (`periodo`) deve ser buscado.
+    """
+
+    inicio: dt.date | None
+    fim: dt.date
+    tickers: dict[str, int]  # ticker do Yahoo -> ativo_id
+
+
+@dataclass
+class FetchStats:
+    """Métricas de uma execução de atualização de cotações."""
+
+    ativos: int = 0
+    lotes: int = 0
+    requisicoes: int = 0
+    linhas_inseridas: int = 0
+    falhas: int = 0
+    tempo_total: float = 0.0
+    series_em_cache: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def contar_requisicao(self):
+        with self._lock:
+            self.requisicoes += 1
+
+    def contar_cache(self, quantidade: int):
+        with self._lock:
+            self.series_em_cache += quantidade
+
+    def resumo(self) -> str:
+        return (
+            f"{self.ativos} ativos em {self.lotes} lotes | "
+            f"{self.requisicoes} requisições | "
+            f"{self.series_em_cache} séries do cache | "
+            f"{self.linhas_inseridas} linhas inseridas | "
+            f"{self.falhas} falhas | {self.tempo_total:.2f}s"
+        )
+
+
+def _campo_por_ticker(
+    historico: pd.DataFrame, lote: LoteCotacoes, campo: str
+) -> pd.DataFrame | None:
+    """Colunas de um campo (ex: "Close") do `yf.download`, uma por ticker."""
+    if historico is None or historico.empty:
+        return None
+
+    # Com `group_by="ticker"` as colunas vêm como (Ticker, Campo). Versões
+    # antigas do yfinance retornam colunas simples quando há um único ticker.
+    if isinstance(historico.columns, pd.MultiIndex):
+        nivel = next(
+            (
+                i
+                for i, valores in enumerate(historico.columns.levels)
+                if campo in valores
+            ),
+            None,
+        )
+        return None if nivel is None else historico.xs(campo, axis=1, level=nivel)
+    if campo not in historico.columns:
+        return None
+    (yf_ticker,) = lote.tickers
+    return historico[[campo]].rename(columns={campo: yf_ticker})
+
+
+def extrair_precos(historico: pd.DataFrame, lote: LoteCotacoes) -> list[dict]:
+    """
+    Converte o DataFrame retornado pelo `yf.download` (multi-ticker) na lista
+    de dicionários esperada por `PrecoHistoricoRepository.bulk_insert`.
+    """
+    fechamentos = _campo_por_ticker(historico, lote, "Close")
+    if fechamentos is None:
+        return []
+
+    datas = [d.date() for d in fechamentos.index]
+    precos = []
+    for yf_ticker, ativo_id in lote.tickers.items():
+        if yf_ticker not in fechamentos.columns:
+            continue
+        serie = fechamentos[yf_ticker].to_numpy()
+        precos.extend(
+            {"ativo_id": ativo_id, "data_pregao": data, "preco_fechamento": float(p)}
+            for data, p in zip(datas, serie)
+            if p == p  # descarta NaN (dias sem negociação do ativo)
+        )
+    return precos
+
+
+def extrair_eventos(historico: pd.DataFrame, lote: LoteCotacoes) -> list[dict]:
+    """
+    Proventos ("Dividends") e desdobramentos ("Stock Splits") do
+    `yf.download(actions=True)`, no formato esperado por
+    `EventoCorporativoRepository.bulk_upsert`.
+    """
+    eventos = []
+    for campo, tipo in (
+        ("Dividends", TipoEvento.PROVENTO),
+        ("Stock Splits", TipoEvento.DESDOBRAMENTO),
+    ):
+        colunas = _campo_por_ticker(historico, lote, campo)
+        if colunas is None:
+            continue
+        for yf_ticker, ativo_id in lote.tickers.items():
+            if yf_ticker not in colunas.columns:
+                continue
+            serie = colunas[yf_ticker]
+            serie = serie[serie.fillna(0).to_numpy() > 0]
+            eventos.extend(
+                {
+                    "ativo_id": ativo_id,
+                    "data_ex": data.date(),
+                    "tipo": tipo,
+                    "valor": float(valor),
+                }
+                for data, valor in serie.items()
+            )
+    return eventos
+
+
+def separar_por_ticker(
+    historico: pd.DataFrame, tickers: list[str]
+) -> dict[str, pd.DataFrame]:
+    """
+    Divide o retorno multi-ticker do `yf.download` em um DataFrame por ticker
+    (colunas Open, Close, ...). Tickers sem dados recebem um DataFrame vazio.
+    """
+    if historico is None or historico.empty:
+        return {ticker: pd.DataFrame() for ticker in tickers}
+    if not isinstance(historico.columns, pd.MultiIndex):
+        (ticker,) = tickers
+        return {ticker: historico.dropna(how="all")}
+
+    nivel = next(
+        i
+        for i, valores in enumerate(historico.columns.levels)
+        if any(ticker in valores for ticker in tickers)
+    )
+    presentes = set(historico.columns.get_level_values(nivel))
+    return {
+        ticker: (
+            historico.xs(ticker, axis=1, level=nivel).dropna(how="all")
+            if ticker in presentes
+            else pd.DataFrame()
+        )
+        for ticker in tickers
+    }
+
+
+class QuoteFetcher:
+    """
+    Executa downloads de cotações em lotes, de forma concorrente e com
+    limite de taxa.
+    """
+
+    def __init__(
+        self,
+        downloader: Callable[..., pd.DataFrame] | None = None,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        batch_size: int = 50,
+        periodo: str = "3y",
+        cache: CacheCotacoes | None = None,
+    ):
+        # O `downloader` segue a assinatura do `yf.download`; pode ser trocado
+        # por uma implementação local em testes e benchmarks. O yfinance (de
+        # import lento) só é carregado quando for mesmo usado.
+        if downloader is None:
+            import yfinance as yf
+
+            downloader = yf.download
+        self.downloader = downloader
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.periodo = periodo
+        self.limiter = TokenBucket(requests_per_second)
+        self.cache = cache
+
+    def montar_lotes(
+        self, grupos: dict[dt.date | None, dict[str, int]], fim: dt.date
+    ) -> list[LoteCotacoes]:
+        """
+        Divide cada grupo (data inicial -> {ticker: ativo_id}) em lotes de no
+        máximo `batch_size` tickers.
+        """
+        return self.montar_lotes_por_faixa(
+            {(inicio, fim): tickers for inicio, tickers in grupos.items()}
+        )
+
+    def montar_lotes_por_faixa(
+        self, faixas: dict[tuple[dt.date | None, dt.date], dict[str, int]]
+    ) -> list[LoteCotacoes]:
+        """
+        Como `montar_lotes`, mas cada grupo tem a sua própria janela
+        `(inicio, fim)` (ex: as lacunas encontradas por `find_gaps`).
+        """
+        lotes = []
+        for (inicio, fim), tickers in faixas.items():
+            itens = list(tickers.items())
+            for i in range(0, len(itens), self.batch_size):
+                lotes.append(
+                    LoteCotacoes(inicio, fim, dict(itens[i : i + self.batch_size]))
+                )
+        return lotes
+
+    def _chave(self, yf_ticker: str, lote: LoteCotacoes) -> ChaveCotacao:
+        inicio = (
+            f"period={self.periodo}" if lote.inicio is None else lote.inicio.isoformat()
+        )
+        return ChaveCotacao(yf_ticker, "1d", inicio, lote.fim.isoformat(), False)
+
+    def _baixar(self, tickers: list[str], lote: LoteCotacoes, stats: FetchStats):
+        self.limiter.acquire()
+        stats.contar_requisicao()
+        # Fechamento bruto e os eventos corporativos; o ajuste é feito na
+        # leitura (`database/ajustes.py`).
+        kwargs = dict(
+            auto_adjust=False,
+            actions=True,
+            group_by="ticker",
+            threads=False,
+            progress=False,
+        )
+        contar("yfinance_tickers", len(tickers))
+        with cronometro("yfinance_download"):
+            if lote.inicio is None:
+                return self.downloader(tickers, period=self.periodo, **kwargs)
+            return self.downloader(tickers, start=lote.inicio, end=lote.fim, **kwargs)
+
+    def baixar_lote(self, lote: LoteCotacoes, stats: FetchStats) -> pd.DataFrame:
+        """
+        Baixa um lote respeitando o limitador de taxa. Com cache, apenas os
+        tickers sem entrada válida são pedidos ao provedor.
+        """
+        if self.cache is None:
+            return self._baixar(list(lote.tickers), lote, stats)
+
+        series = {}
+        faltantes = []
+        for yf_ticker in lote.tickers:
+            em_cache = self.cache.get(self._chave(yf_ticker, lote))
+            if em_cache is None:
+                faltantes.append(yf_ticker)
+            else:
+                series[yf_ticker] = em_cache
+        stats.contar_cache(len(series))
+        contar("cache_cotacoes_acertos", len(series))
+
+        if faltantes:
+            historico = self._baixar(faltantes, lote, stats)
+            # Buscas por período incluem o pregão em andamento.
+            ttl = self.cache.ttl_para(None if lote.inicio is None else lote.fim)
+            for yf_ticker, serie in separar_por_ticker(historico, faltantes).items():
+                self.cache.put(self._chave(yf_ticker, lote), serie, ttl)
+                series[yf_ticker] = serie
+
+        series = {t: s for t, s in series.items() if not s.empty}
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1, names=["Ticker", "Price"])
+
+    def run(
+        self,
+        lotes: list[LoteCotacoes],
+        gravar: Callable[[LoteCotacoes, list[dict], list[dict]], int],
+    ) -> FetchStats:
+        """
+        Baixa todos os lotes no pool de threads. A função `gravar` é chamada
+        na thread atual para cada lote baixado sem erro, com os preços e os
+        eventos corporativos (listas vazias se o provedor não retornou nada),
+        e deve retornar o número de linhas inseridas.
+        """
+        stats = FetchStats(
+            ativos=sum(len(lote.tickers) for lote in lotes), lotes=len(lotes)
+        )
+        inicio = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futuros = {
+                executor.submit(self.baixar_lote, lote, stats): lote for lote in lotes
+            }
+            for futuro in as_completed(futuros):
+                lote = futuros[futuro]
+                try:
+                    historico = futuro.result()
+                    precos = extrair_precos(historico, lote)
+                    eventos = extrair_eventos(historico, lote)
+                    stats.linhas_inseridas += gravar(lote, precos, eventos)
+                except Exception as e:
+                    stats.falhas += 1
+                    log_erro(
+                        f"❌ Erro no lote iniciado em {lote.inicio} "
+                        f"({len(lote.tickers)} ativos): {e}"
+                    )
+
+        stats.tempo_total = time.perf_counter() - inicio
+        return stats
@@ -3,14 +3,31 @@
 
 import datetime as dt
 import time
+from typing import Iterable
 
-import pandas as pd
-import yfinance as yf
 from db_nexus.session import DatabaseSessionManager
 from sqlalchemy.orm import Session
 
+from diversify.calendario_b3 import ultima_sessao_encerrada
+from diversify.database.ajustes import desfazer_desdobramentos
 from diversify.database.models import Ativo
-from diversify.database.repositories import AtivoRepository, PrecoHistoricoRepository
+from diversify.database.performance import GrupoDeCommits
+from diversify.database.repositories import (
+    AtivoRepository,
+    EventoCorporativoRepository,
+    PrecoHistoricoRepository,
+    ResultadoUpsertPrecos,
+)
+from diversify.database.tipos import TipoEvento
+from diversify.metrics import cronometro, log, log_erro
+from diversify.quote_cache import CacheCotacoes
+from diversify.quotes_fetcher import (
+    FetchStats,
+    LoteCotacoes,
+    QuoteFetcher,
+    extrair_eventos,
+    extrair_precos,
+)
 
 
 class QuoteService:
@@ -22,6 +39,7 @@ class QuoteService:
         # O construtor recebe e armazena as dependências necessárias.
         self.ativo_repo = AtivoRepository()
         self.preco_repo = PrecoHistoricoRepository()
+        self.evento_repo = EventoCorporativoRepository()
 
     # Mapeamento de tickers B3 para os tickers do Yahoo Finance para os principais índices
     def _get_yahoo_finance_ticker(self, ticker: str) -> str:
@@ -37,80 +55,313 @@ class QuoteService:
         else:
             return "^BVSP"
 
-    def update_historical_prices(self, db_manager: DatabaseSessionManager):
+    def update_historical_prices(
+        self,
+        db_manager: DatabaseSessionManager,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        batch_size: int = 50,
+        downloader=None,
+        lotes_por_commit: int = 10,
+        periodo: str = "3y",
+        cache: CacheCotacoes | None = None,
+    ) -> FetchStats:
         """
-        Serviço principal que orquestra todo o fluxo de atualização de cotações,
-        usando transações curtas para cada ativo para máxima robustez.
+        Serviço principal que orquestra todo o fluxo de atualização de cotações.
+
+        Os ativos são agrupados pela data inicial da busca e baixados em lotes
+        multi-ticker, com até `max_workers` lotes simultâneos e no máximo
+        `requests_per_second` requisições por segundo. Cada lote é gravado em
+        um SAVEPOINT próprio, e a transação é confirmada a cada
+        `lotes_por_commit` lotes. Ativos sem nenhum preço salvo buscam o
+        histórico de `periodo`. Com um `cache`, séries já baixadas são lidas
+        do disco em vez do provedor.
+
+        Os preços são gravados brutos, com os proventos e desdobramentos em
+        `eventos_corporativos`. Ativos de bancos antigos, com preços ajustados,
+        têm a série inteira baixada e regravada uma única vez.
         """
-        print("\n--- INICIANDO ATUALIZAÇÃO DE COTAÇÕES HISTÓRICAS ---")
-        ativo_repo = AtivoRepository()
-        preco_repo = PrecoHistoricoRepository()
+        log("\n--- INICIANDO ATUALIZAÇÃO DE COTAÇÕES HISTÓRICAS ---")
+        # Só pregões já encerrados são buscados: a janela termina no dia
+        # seguinte ao último pregão fechado (`fim` é exclusivo).
+        ultima_sessao = ultima_sessao_encerrada()
+        fim = ultima_sessao + dt.timedelta(days=1)
 
-        # Etapa 1: Busca apenas os IDs dos ativos em uma sessão rápida.
-        ativos_ids_para_atualizar = []
-        with db_manager.get_session() as session:
-            resultados = session.query(Ativo.id).all()
-            ativos_ids_para_atualizar = [id_tuple[0] for id_tuple in resultados]
+        # Etapa 1: Monta o plano de atualização com uma única query agrupada.
+        with cronometro("etapa", etapa="plan_updates"):
+            with db_manager.get_session() as session:
+                plano = self.preco_repo.plan_updates(
+                    session, ultima_sessao=ultima_sessao
+                )
+
+        grupos: dict[dt.date | None, dict[str, int]] = {
+            inicio: {
+                self._get_yahoo_finance_ticker(item.ticker): item.ativo_id
+                for item in itens
+            }
+            for inicio, itens in plano.grupos.items()
+        }
+        log(
+            f"{plano.pendentes} de {plano.total_ativos} ativos precisam de atualização "
+            f"({len(grupos)} janelas de busca distintas, último pregão encerrado: "
+            f"{ultima_sessao:%d/%m/%Y})."
+        )
+        if plano.legados:
+            log(
+                f"{plano.legados} ativos com preços ajustados de uma versão "
+                "anterior terão a série bruta baixada de novo."
+            )
+        if not grupos:
+            log("--- ATUALIZAÇÃO CONCLUÍDA: nenhum ativo com pregão novo. ---")
+            return FetchStats()
 
-        print(
-            f"Encontrados {len(ativos_ids_para_atualizar)} ativos para verificar/atualizar cotações."
+        # Etapa 2: Baixa os lotes em paralelo e grava cada um ao terminar.
+        fetcher = QuoteFetcher(
+            downloader=downloader,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+            batch_size=batch_size,
+            periodo=periodo,
+            cache=cache,
         )
 
-        # Etapa 2: Itera sobre a lista de IDs, com uma transação para cada ativo.
-        for ativo_id in ativos_ids_para_atualizar:
+        with cronometro("etapa", etapa="update_quotes"):
+            stats = self._baixar_e_gravar(
+                db_manager,
+                fetcher,
+                fetcher.montar_lotes(grupos, fim),
+                lotes_por_commit,
+                modo="atualizar",
+                marcar_brutos=True,
+            )
+        log(f"--- ATUALIZAÇÃO CONCLUÍDA: {stats.resumo()} ---")
+        return stats
 
-            # Inicia uma nova sessão/transação para este ativo.
+    def fill_gaps(
+        self,
+        db_manager: DatabaseSessionManager,
+        desde: dt.date | None = None,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        batch_size: int = 50,
+        downloader=None,
+        lotes_por_commit: int = 10,
+        cache: CacheCotacoes | None = None,
+    ) -> FetchStats:
+        """
+        Preenche os buracos no meio das séries já salvas (pregões que
+        falharam, ativos que ficaram fora de um índice por um tempo) sem
+        baixar o histórico inteiro de novo.
+
+        As lacunas vêm de `find_gaps` e cada uma é buscada só na sua faixa;
+        ativos com a mesma faixa (ex: um dia em que a atualização falhou para
+        todos) dividem os mesmos lotes. Com `desde`, o trecho entre `desde` e
+        o primeiro preço de cada ativo também é preenchido. Os preços já
+        salvos não são regravados.
+
+        Um pregão sem negócios para o ativo (ex: papel suspenso) continua
+        aparecendo como lacuna; com um `cache`, a nova busca dessa faixa é
+        respondida pelo disco.
+        """
+        log("\n--- INICIANDO PREENCHIMENTO DE LACUNAS NAS COTAÇÕES ---")
+        with cronometro("etapa", etapa="find_gaps"):
             with db_manager.get_session() as session:
-                try:
-                    ativo = ativo_repo.get_by_id(session, ativo_id)
-                except Exception as e:
-                    print(
-                        f"Não foi possível buscar o ativo com ID {ativo_id}. Erro: {e}"
-                    )
-                    continue
-
-                yf_ticker = self._get_yahoo_finance_ticker(ativo.ticker)
-                print(f"\nProcessando: {ativo.ticker} ({yf_ticker})")
-
-                latest_date_in_db = preco_repo.get_latest_date(session, ativo.id)
-
-                historico = None
-                if latest_date_in_db:
-                    start_date = latest_date_in_db + dt.timedelta(days=1)
-                    if start_date >= dt.date.today():
-                        print("Dados já estão atualizados. Pulando.")
-                        continue
-                    # Busca a partir da última data
-                    historico = yf.Ticker(yf_ticker).history(
-                        start=start_date, end=dt.date.today(), auto_adjust=True
-                    )
-                else:
-                    # Se não há dados, busca o período completo
-                    historico = yf.Ticker(yf_ticker).history(
-                        period="3y", auto_adjust=True
+                lacunas = self.preco_repo.find_gaps(session, desde=desde)
+                tickers = self.ativo_repo.indice(session).por_id
+
+        faixas: dict[tuple[dt.date, dt.date], dict[str, int]] = {}
+        for lacuna in lacunas:
+            yf_ticker = self._get_yahoo_finance_ticker(tickers[lacuna.ativo_id])
+            faixas.setdefault((lacuna.inicio, lacuna.fim), {})[
+                yf_ticker
+            ] = lacuna.ativo_id
+        log(
+            f"{len(lacunas)} lacunas ({sum(lac.sessoes for lac in lacunas)} pregões) em "
+            f"{len({lac.ativo_id for lac in lacunas})} ativos, "
+            f"{len(faixas)} faixas de busca distintas."
+        )
+        if not faixas:
+            log("--- PREENCHIMENTO CONCLUÍDO: nenhuma lacuna encontrada. ---")
+            return FetchStats()
+
+        fetcher = QuoteFetcher(
+            downloader=downloader,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+            batch_size=batch_size,
+            cache=cache,
+        )
+        with cronometro("etapa", etapa="fill_gaps"):
+            stats = self._baixar_e_gravar(
+                db_manager,
+                fetcher,
+                fetcher.montar_lotes_por_faixa(faixas),
+                lotes_por_commit,
+                modo="ignorar",
+            )
+        log(f"--- PREENCHIMENTO CONCLUÍDO: {stats.resumo()} ---")
+        return stats
+
+    def _baixar_e_gravar(
+        self,
+        db_manager: DatabaseSessionManager,
+        fetcher: QuoteFetcher,
+        lotes: list[LoteCotacoes],
+        lotes_por_commit: int,
+        modo: str,
+        marcar_brutos: bool = False,
+    ) -> FetchStats:
+        """
+        Baixa os lotes em paralelo e grava cada um ao terminar, em um
+        SAVEPOINT próprio, confirmando a transação a cada `lotes_por_commit`.
+        """
+        with db_manager.get_session() as session:
+            grupo = GrupoDeCommits(session, itens_por_commit=lotes_por_commit)
+
+            def gravar(lote: LoteCotacoes, precos: list[dict], eventos: list[dict]):
+                # A falha de um lote desfaz só o SAVEPOINT dele e é contada
+                # pelo fetcher.
+                if not (precos or eventos or marcar_brutos):
+                    return 0
+                with grupo.item(f"lote {lote.inicio}", suprimir_erros=False):
+                    resultado = self.gravar_cotacoes(
+                        session,
+                        precos,
+                        eventos,
+                        modo,
+                        marcar_brutos,
+                        ativo_ids=lote.tickers.values(),
                     )
+                return resultado.novos
 
-                if historico is not None and not historico.empty:
-                    historico.dropna(subset=["Close"], inplace=True)
-
-                    if not historico.empty:
-                        dados_para_inserir = [
-                            {
-                                "ativo_id": ativo.id,
-                                "data_pregao": data.date(),
-                                "preco_fechamento": row[
-                                    "Close"
-                                ],  # 'Close' já é ajustado com auto_adjust=True
-                            }
-                            for data, row in historico.iterrows()
-                        ]
-
-                        if dados_para_inserir:
-                            preco_repo.bulk_insert(session, dados_para_inserir)
+            stats = fetcher.run(lotes, gravar)
+            grupo.commit()
+        return stats
+
+    def gravar_cotacoes(
+        self,
+        session: Session,
+        precos: list[dict],
+        eventos: list[dict],
+        modo: str,
+        marcar_brutos: bool = False,
+        ativo_ids: Iterable[int] | None = None,
+    ) -> ResultadoUpsertPrecos:
+        """
+        Grava os preços e os eventos corporativos de um lote baixado.
+
+        O provedor entrega fechamentos e proventos corrigidos pelos
+        desdobramentos conhecidos na data da busca; eles são convertidos para
+        valores brutos com os desdobramentos já salvos e os do próprio lote.
+
+        Com `marcar_brutos`, os ativos do lote (`ativo_ids`; por padrão, os
+        que receberam preços) passam a constar como tendo a série bruta (ver
+        `migrar_precos_brutos`). Os que o provedor não retornou também são
+        marcados: senão, um ativo de banco antigo sem dados no provedor teria
+        o histórico inteiro pedido de novo em toda execução.
+        """
+        if marcar_brutos:
+            marcar = set(ativo_ids or ()) | {p["ativo_id"] for p in precos}
+            self.ativo_repo.marcar_precos_brutos(session, marcar)
+        if not (precos or eventos):
+            return ResultadoUpsertPrecos()
+
+        ids = {p["ativo_id"] for p in precos} | {e["ativo_id"] for e in eventos}
+        desdobramentos = self.evento_repo.desdobramentos(session, ids)
+        for evento in sorted(eventos, key=lambda e: e["data_ex"]):
+            if evento["tipo"] == TipoEvento.DESDOBRAMENTO:
+                lista = desdobramentos.setdefault(evento["ativo_id"], [])
+                if (evento["data_ex"], evento["valor"]) not in lista:
+                    lista.append((evento["data_ex"], evento["valor"]))
+                    lista.sort()
+
+        if desdobramentos:
+            precos = desfazer_desdobramentos(
+                precos, desdobramentos, "data_pregao", "preco_fechamento"
+            )
+            proventos = [e for e in eventos if e["tipo"] == TipoEvento.PROVENTO]
+            eventos = [
+                e for e in eventos if e["tipo"] != TipoEvento.PROVENTO
+            ] + desfazer_desdobramentos(proventos, desdobramentos, "data_ex", "valor")
+
+        self.evento_repo.bulk_upsert(session, eventos, precos)
+        return self.preco_repo.bulk_insert(session, precos, modo=modo)
+
+    def update_historical_prices_sequencial(
+        self,
+        db_manager: DatabaseSessionManager,
+        downloader=None,
+        periodo: str = "3y",
+        pausa: float = 1.0,
+    ) -> FetchStats:
+        """
+        Caminho antigo, mantido como linha de base para comparação de
+        desempenho com `update_historical_prices`: percorre os ativos um a
+        um, consultando a última data salva de cada um, baixando só aquele
+        ticker, gravando em uma transação curta própria e esperando `pausa`
+        segundos antes do próximo. Não usa o plano agrupado, lotes, cache
+        nem downloads simultâneos.
+
+        A gravação é a mesma de `update_historical_prices` (`gravar_cotacoes`:
+        fechamentos brutos, eventos corporativos e série inteira para os
+        ativos legados), para não misturar preços brutos e ajustados.
+        """
+        log("\n--- INICIANDO ATUALIZAÇÃO DE COTAÇÕES HISTÓRICAS (SEQUENCIAL) ---")
+        if downloader is None:
+            import yfinance as yf
+
+            downloader = yf.download
+        stats = FetchStats()
+        inicio_execucao = time.perf_counter()
+        ultima_sessao = ultima_sessao_encerrada()
+        fim = ultima_sessao + dt.timedelta(days=1)
+
+        # Etapa 1: Busca apenas os IDs e tickers de todos os ativos.
+        with db_manager.get_session() as session:
+            ativos = self.ativo_repo.list_all_ids_and_tickers(session)
+        log(f"Encontrados {len(ativos)} ativos para verificar/atualizar cotações.")
+        stats.ativos = len(ativos)
+
+        # Etapa 2: Itera sobre os ativos, com uma transação para cada um.
+        for ativo_id, ticker in ativos:
+            yf_ticker = self._get_yahoo_finance_ticker(ticker)
+            try:
+                with db_manager.get_session() as session:
+                    brutos = session.get(Ativo, ativo_id).precos_brutos
+                    ultima = self.preco_repo.get_latest_date(session, ativo_id)
+                    if brutos and ultima is not None and ultima >= ultima_sessao:
+                        continue  # Dados já estão atualizados.
+
+                    # Sem preços (ou com a série ajustada de um banco antigo),
+                    # busca o período completo; senão, a partir da última data.
+                    kwargs = dict(auto_adjust=False, actions=True, progress=False)
+                    stats.contar_requisicao()
+                    if brutos and ultima is not None:
+                        inicio = ultima + dt.timedelta(days=1)
+                        historico = downloader(
+                            yf_ticker, start=inicio, end=fim, **kwargs
+                        )
                     else:
-                        print("Nenhuma cotação *válida* encontrada no período.")
-                else:
-                    print("Nenhuma nova cotação encontrada no período.")
+                        inicio = None
+                        historico = downloader(yf_ticker, period=periodo, **kwargs)
+
+                    lote = LoteCotacoes(inicio, fim, {yf_ticker: ativo_id})
+                    resultado = self.gravar_cotacoes(
+                        session,
+                        extrair_precos(historico, lote),
+                        extrair_eventos(historico, lote),
+                        modo="atualizar",
+                        marcar_brutos=True,
+                        ativo_ids=[ativo_id],
+                    )
+                    stats.linhas_inseridas += resultado.novos
+            except Exception as e:
+                stats.falhas += 1
+                log_erro(f"❌ Erro ao atualizar {ticker}: {e}")
+
+            # Pausa fixa entre as chamadas à API para cada ativo.
+            time.sleep(pausa)
 
-            # Pausa educada entre as chamadas de API para cada ativo
-            time.sleep(1)
+        stats.tempo_total = time.perf_counter() - inicio_execucao
+        log(f"--- ATUALIZAÇÃO CONCLUÍDA: {stats.resumo()} ---")
+        return stats
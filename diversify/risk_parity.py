@@ -0,0 +1,235 @@
+# ==============================================================================
+# DIVERSIFY/DIVERSIFY/RISK_PARITY.PY
+# ==============================================================================
+#
+# DESCRIÇÃO:
+# Alocação "Risk Parity" (contribuição de risco igual, ERC): cada ativo da
+# carteira contribui com a mesma parcela da volatilidade total.
+#
+# O problema é resolvido pela formulação convexa de Spinu (2013):
+#
+#     min  ½ xᵀΣx − Σ bᵢ ln(xᵢ),   x > 0
+#
+# cuja solução, normalizada para somar 1, é a carteira ERC (bᵢ = 1/n). Usamos
+# o método de Newton com passo amortecido, que converge em poucas iterações e
+# aceita um ponto inicial ("warm start").
+#
+# DESEMPENHO:
+# A alocação roda todas as noites para muitas carteiras. Para não recalcular
+# tudo do zero:
+#   - A covariância fica em um cache LRU com chave
+#     (conjunto de ativos, janela, data do último preço).
+#   - Quando chega apenas um pregão novo, o solver parte dos pesos da
+#     execução anterior, que já estão muito próximos da nova solução.
+#
+# COMPONENTES:
+# - resolver_risk_parity(): O solver, sobre uma matriz de covariância.
+# - CacheCovariancia: Cache LRU de matrizes de covariância.
+# - AlocadorRiskParity: Busca os preços, monta a covariância e resolve.
+#
+# ==============================================================================
+
+import datetime as dt
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from db_nexus.session import DatabaseSessionManager
+from sqlalchemy import func, select
+
+from diversify.analytics import covariancia_pareada, retornos_log
+from diversify.database.models import Ativo, PrecoHistorico
+from diversify.database.repositories import PrecoHistoricoRepository
+
+
+def resolver_risk_parity(
+    cov: np.ndarray,
+    pesos_iniciais: np.ndarray | None = None,
+    tol: float = 1e-10,
+    max_iter: int = 100,
+) -> tuple[np.ndarray, int]:
+    """
+    Resolve a carteira de contribuição de risco igual para a covariância `cov`.
+
+    Retorna os pesos (somando 1) e o número de iterações de Newton usadas.
+    """
+    n = cov.shape[0]
+    b = np.full(n, 1.0 / n)
+
+    # O ótimo satisfaz xᵀΣx = Σb = 1, então reescalamos o ponto inicial
+    # para já começar sobre essa superfície.
+    x = np.full(n, 1.0) if pesos_iniciais is None else np.array(pesos_iniciais)
+    x = x / np.sqrt(x @ cov @ x)
+
+    def objetivo(v):
+        return 0.5 * v @ cov @ v - b @ np.log(v)
+
+    for iteracao in range(max_iter):
+        gradiente = cov @ x - b / x
+        if np.abs(gradiente).max() < tol:
+            return x / x.sum(), iteracao
+        hessiana = cov + np.diag(b / (x * x))
+        passo = -np.linalg.solve(hessiana, gradiente)
+
+        # Passo amortecido: mantém x > 0 e garante queda do objetivo (Armijo).
+        negativos = passo < 0
+        t = min(1.0, 0.99 * np.min(-x[negativos] / passo[negativos], initial=np.inf))
+        atual = objetivo(x)
+        while objetivo(x + t * passo) > atual + 1e-4 * t * (gradiente @ passo):
+            t *= 0.5
+        x = x + t * passo
+
+    return x / x.sum(), max_iter
+
+
+class CacheCovariancia:
+    """
+    Cache LRU de matrizes de covariância (junto com as datas da janela e os
+    tickers válidos), com estatísticas de uso.
+    """
+
+    def __init__(self, tamanho_maximo: int = 128):
+        self.tamanho_maximo = tamanho_maximo
+        self._itens: OrderedDict[tuple, tuple] = OrderedDict()
+        self.acertos = 0
+        self.faltas = 0
+
+    def get(self, chave: tuple) -> tuple | None:
+        valor = self._itens.get(chave)
+        if valor is None:
+            self.faltas += 1
+            return None
+        self._itens.move_to_end(chave)
+        self.acertos += 1
+        return valor
+
+    def put(self, chave: tuple, valor: tuple):
+        self._itens[chave] = valor
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.tamanho_maximo:
+            self._itens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+
+@dataclass(frozen=True)
+class AlocacaoRiskParity:
+    """Resultado de uma alocação Risk Parity."""
+
+    tickers: list[str]
+    pesos: np.ndarray
+    contribuicoes: np.ndarray  # parcela de risco de cada ativo (soma 1)
+    data_referencia: dt.date
+    iteracoes: int
+    warm_start: bool
+    excluidos: list[str]  # ativos sem histórico suficiente na janela
+
+    def como_dict(self) -> dict[str, float]:
+        return dict(zip(self.tickers, self.pesos.tolist()))
+
+
+class AlocadorRiskParity:
+    """
+    Calcula alocações Risk Parity a partir dos preços salvos no banco,
+    reaproveitando covariâncias e soluções entre chamadas.
+    """
+
+    def __init__(
+        self,
+        session_manager: DatabaseSessionManager,
+        janela: int = 252,
+        min_periodos: int = 60,
+        tamanho_cache: int = 128,
+    ):
+        self.session_manager = session_manager
+        self.janela = janela
+        self.min_periodos = min_periodos
+        self.preco_repo = PrecoHistoricoRepository()
+        self.cache = CacheCovariancia(tamanho_cache)
+        # (ativos, janela) -> (datas da janela, tickers válidos, pesos), em
+        # ordem LRU e com o mesmo limite do cache de covariâncias.
+        self._solucoes: OrderedDict[tuple, tuple[np.ndarray, list[str], np.ndarray]] = (
+            OrderedDict()
+        )
+
+    def _ultima_data(self, session, tickers: tuple[str, ...]) -> dt.date | None:
+        """Data do último preço salvo entre os ativos (uma query agregada)."""
+        return session.scalar(
+            select(func.max(PrecoHistorico.data_pregao))
+            .join(Ativo, PrecoHistorico.ativo_id == Ativo.id)
+            .where(Ativo.ticker.in_(tickers))
+        )
+
+    def _covariancia(self, session, ativos: tuple[str, ...], ultima_data: dt.date):
+        """Monta (ou busca no cache) a covariância da janela terminada em `ultima_data`."""
+        chave = (ativos, self.janela, ultima_data)
+        em_cache = self.cache.get(chave)
+        if em_cache is not None:
+            return em_cache
+
+        # Margem de calendário generosa para cobrir `janela` pregões + 1.
+        inicio = ultima_data - dt.timedelta(days=int(self.janela * 1.6) + 10)
+        matriz = self.preco_repo.load_price_matrix(
+            session, list(ativos), inicio, ultima_data
+        )
+        datas = matriz.datas[-(self.janela + 1) :]
+        retornos = retornos_log(matriz.valores[-(self.janela + 1) :])
+        cov = covariancia_pareada(retornos, min_periodos=self.min_periodos)
+
+        # Ativos sem histórico suficiente ficam de fora. Primeiro os que não
+        # têm variância; depois, enquanto sobrar algum par sem pregões em
+        # comum suficientes, sai o ativo envolvido em mais pares incompletos.
+        validos = ~np.isnan(np.diag(cov))
+        faltantes = np.isnan(cov) & validos[:, None] & validos[None, :]
+        while faltantes.any():
+            pior = faltantes.sum(axis=1).argmax()
+            validos[pior] = False
+            faltantes[pior, :] = faltantes[:, pior] = False
+        tickers = [t for t, ok in zip(matriz.tickers, validos) if ok]
+        resultado = (datas, tickers, cov[np.ix_(validos, validos)])
+        self.cache.put(chave, resultado)
+        return resultado
+
+    def alocar(self, tickers: list[str]) -> AlocacaoRiskParity:
+        """Calcula os pesos Risk Parity para um conjunto de tickers."""
+        ativos = tuple(sorted({t.upper() for t in tickers}))
+        with self.session_manager.get_session() as session:
+            ultima_data = self._ultima_data(session, ativos)
+            if ultima_data is None:
+                raise ValueError("Nenhum preço encontrado para os ativos informados.")
+            datas, validos, cov = self._covariancia(session, ativos, ultima_data)
+
+        if not validos:
+            raise ValueError("Nenhum ativo tem histórico suficiente na janela.")
+
+        # Warm start: mesma carteira e a janela anterior terminou no pregão
+        # imediatamente anterior ao atual (ou seja, chegou um único pregão novo).
+        pesos_iniciais = None
+        anterior = self._solucoes.get((ativos, self.janela))
+        if anterior is not None:
+            datas_anteriores, validos_anteriores, pesos_anteriores = anterior
+            if (
+                validos_anteriores == validos
+                and len(datas) > 1
+                and datas_anteriores[-1] in (datas[-1], datas[-2])
+            ):
+                pesos_iniciais = pesos_anteriores
+
+        pesos, iteracoes = resolver_risk_parity(cov, pesos_iniciais)
+        self._solucoes[(ativos, self.janela)] = (datas, validos, pesos)
+        self._solucoes.move_to_end((ativos, self.janela))
+        while len(self._solucoes) > self.cache.tamanho_maximo:
+            self._solucoes.popitem(last=False)
+
+        risco_marginal = cov @ pesos
+        contribuicoes = pesos * risco_marginal / (pesos @ risco_marginal)
+        return AlocacaoRiskParity(
+            tickers=validos,
+            pesos=pesos,
+            contribuicoes=contribuicoes,
+            data_referencia=ultima_data,
+            iteracoes=iteracoes,
+            warm_start=pesos_iniciais is not None,
+            excluidos=sorted(set(ativos) - set(validos)),
+        )
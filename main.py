@@ -1,4 +1,6 @@
-from tasks.b3_index import b3_composition, refresh_indices
+import sys
+
+from diversify.cli import main
 
 if __name__ == "__main__":
-    refresh_indices()
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path para encontrar o pacote 'diversify'
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from diversify.cli import abrir_banco
+from diversify.metrics import gravar_resumo
+from diversify.pipeline import PipelineDiario
+from diversify.quote_cache import CacheCotacoes
+
+
+def main():
+    """
+    Executa o fluxo diário completo (composições da B3 -> banco -> cotações)
+    como um único pipeline, com as etapas sobrepostas.
+    """
+    db_url = "sqlite:///diversify.db"
+    # Perfil do SQLite, métricas do banco e esquema atual, como na linha de comando.
+    db_manager = abrir_banco(db_url)
+
+    PipelineDiario(db_manager, db_url=db_url, cache=CacheCotacoes()).executar()
+    gravar_resumo(nome_execucao="pipeline_diario")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,31 +4,26 @@ from pathlib import Path
 # Adiciona o diretório raiz ao path para encontrar o pacote 'diversify'
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from db_nexus.base import Base
-from db_nexus.session import DatabaseSessionManager
+from diversify.cli import main as cli_main
+from diversify.metrics import log
 
-from diversify.quotes_services import QuoteService
 
+def main() -> int:
+    """
+    Script principal para atualizar as cotações históricas. Equivale a
+    `python -m diversify update-quotes`.
+    """
+    log("==========================================================")
+    log("🚀 INICIANDO SCRIPT DE ATUALIZAÇÃO DE COTAÇÕES")
+    log("==========================================================")
 
-def main():
-    """Script principal para atualizar as cotações históricas."""
-    print("==========================================================")
-    print("🚀 INICIANDO SCRIPT DE ATUALIZAÇÃO DE COTAÇÕES")
-    print("==========================================================")
+    codigo = cli_main(["update-quotes"])
 
-    db_manager = DatabaseSessionManager("sqlite:///diversify.db")
-    quote_service = QuoteService()
-
-    # Garante que as tabelas do banco de dados existam
-    db_manager.create_all_tables()
-
-    # Chama o serviço que faz todo o trabalho pesado.
-    quote_service.update_historical_prices(db_manager)
-
-    print("\n==========================================================")
-    print("🏁 SCRIPT DE ATUALIZAÇÃO DE COTAÇÕES FINALIZADO.")
-    print("==========================================================")
+    log("\n==========================================================")
+    log("🏁 SCRIPT DE ATUALIZAÇÃO DE COTAÇÕES FINALIZADO.")
+    log("==========================================================")
+    return codigo
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())